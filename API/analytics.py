@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+from preprocessing import parse_datetime_column
+from snapshot import to_epoch_seconds
+
+
+# The statuses of the lifecycle of an issue, in the order of the rows and columns of the transition matrix.
+# Statuses that occur in the transitions but not here are appended
+STATUS_ORDER = ['Open', 'Patch Available', 'In Progress', 'Reopened', 'Resolved', 'Closed']
+
+# Percentiles of the dwell times reported for every transition
+DWELL_PERCENTILES = (50, 90)
+
+
+def grouped_percentiles(groups, values, n_groups, percentiles):
+    """
+    Compute percentiles of values per group with a single sort, interpolating like `np.percentile`.
+
+    Parameters:
+    groups (np.ndarray): The group code (0 to n_groups - 1) of every value.
+    values (np.ndarray): The values.
+    n_groups (int): The number of groups.
+    percentiles (tuple of float): The percentiles to compute, between 0 and 100.
+
+    Returns:
+    tuple: The number of values of every group, and an array of shape (len(percentiles), n_groups) with the
+           percentiles of every group (NaN for empty groups).
+    """
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+
+    result = np.full((len(percentiles), n_groups), np.nan)
+    present = counts > 0
+    for row, percentile in enumerate(percentiles):
+        positions = starts[present] + (counts[present] - 1) * (percentile / 100)
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.ceil(positions).astype(np.int64)
+        result[row, present] = sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (positions - lower)
+    return counts, result
+
+
+class BottleneckAnalytics:
+    """
+    Status-to-status transition counts and dwell times of the issues, filterable by priority, issue type and date.
+
+    The transition log is encoded once into NumPy arrays of category codes, sorted by (priority, issue type, time).
+    The transitions of every (priority, issue type) group are therefore a contiguous range, and the transitions of
+    a date window within a group are found by binary search. A query only gathers the ranges it selects and
+    aggregates them with `np.bincount` and a single sort, without scanning or filtering the raw log.
+
+    Parameters:
+    transitions (pd.DataFrame): Transitions with the columns 'from_status', 'to_status', 'when',
+                                'days_in_from_status', 'priority' and 'issue_type', e.g. from 'avro-transitions.csv'.
+                                The creation of an issue (no 'from_status') is not a transition between statuses.
+    """
+
+    def __init__(self, transitions):
+        transitions = transitions[transitions['from_status'].notna() & transitions['days_in_from_status'].notna()]
+
+        observed = pd.unique(pd.concat([transitions['from_status'], transitions['to_status']]).astype(object))
+        self.statuses = STATUS_ORDER + sorted(status for status in observed if status not in STATUS_ORDER)
+        from_codes = pd.Categorical(transitions['from_status'], categories=self.statuses).codes.astype(np.int64)
+        to_codes = pd.Categorical(transitions['to_status'], categories=self.statuses).codes.astype(np.int64)
+
+        # Missing priorities and issue types are a category of their own, so the groups cover every transition
+        priority_codes, self.priorities = pd.factorize(transitions['priority'].astype(object).fillna('None'), sort=True)
+        issue_type_codes, self.issue_types = pd.factorize(transitions['issue_type'].astype(object).fillna('None'), sort=True)
+        self.priorities, self.issue_types = list(self.priorities), list(self.issue_types)
+
+        group_codes = priority_codes * len(self.issue_types) + issue_type_codes
+        when = parse_datetime_column(transitions['when']).values.view(np.int64)
+
+        order = np.lexsort((when, group_codes))
+        self.when = when[order]
+        self.pair_codes = (from_codes * len(self.statuses) + to_codes)[order]
+        self.dwell_days = transitions['days_in_from_status'].to_numpy(dtype=np.float64)[order]
+        # The transitions of group g are the range group_offsets[g]:group_offsets[g + 1]
+        self.group_offsets = np.searchsorted(group_codes[order], np.arange(len(self.priorities) * len(self.issue_types) + 1))
+
+    def __len__(self):
+        return len(self.when)
+
+    def selected_positions(self, priorities=None, issue_types=None, start=None, end=None):
+        """
+        Return the positions of the transitions that match the filters.
+
+        Parameters:
+        priorities (list of str, optional): The priorities to keep, all if not provided.
+        issue_types (list of str, optional): The issue types to keep, all if not provided.
+        start (str, optional): Keep the transitions at or after this ISO-8601 date.
+        end (str, optional): Keep the transitions before this ISO-8601 date.
+
+        Raises:
+        ValueError: If a date cannot be parsed.
+        """
+        # The times of the transitions are in nanoseconds
+        start = to_epoch_seconds(start) * 10 ** 9 if start is not None else None
+        end = to_epoch_seconds(end) * 10 ** 9 if end is not None else None
+
+        priority_codes = [self.priorities.index(value) for value in priorities if value in self.priorities] \
+            if priorities is not None else range(len(self.priorities))
+        issue_type_codes = [self.issue_types.index(value) for value in issue_types if value in self.issue_types] \
+            if issue_types is not None else range(len(self.issue_types))
+
+        ranges = []
+        for priority_code in priority_codes:
+            for issue_type_code in issue_type_codes:
+                group = priority_code * len(self.issue_types) + issue_type_code
+                group_start, group_end = self.group_offsets[group], self.group_offsets[group + 1]
+                # The transitions of a group are sorted by time
+                group_when = self.when[group_start:group_end]
+                lower = group_start + (np.searchsorted(group_when, start) if start is not None else 0)
+                upper = group_start + (np.searchsorted(group_when, end) if end is not None else len(group_when))
+                if lower < upper:
+                    ranges.append(np.arange(lower, upper))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def query(self, priorities=None, issue_types=None, start=None, end=None):
+        """
+        Aggregate the transitions that match the filters, see `selected_positions`.
+
+        Returns:
+        dict: The statuses (the rows and columns of the matrix), the number of transitions, the transition matrix
+              (matrix[i][j] transitions from status i to status j) and, for every observed transition, the count and
+              the median and 90th percentile of the days spent in the status before it, the longest dwell times first.
+        """
+        positions = self.selected_positions(priorities, issue_types, start, end)
+        n_statuses = len(self.statuses)
+
+        counts, percentiles = grouped_percentiles(self.pair_codes[positions], self.dwell_days[positions],
+                                                  n_statuses * n_statuses, DWELL_PERCENTILES)
+
+        observed = np.flatnonzero(counts)
+        # Longest median dwell time first
+        observed = observed[np.argsort(-percentiles[0, observed], kind='stable')]
+        transitions = [
+            {
+                'from': self.statuses[pair // n_statuses],
+                'to': self.statuses[pair % n_statuses],
+                'count': int(counts[pair]),
+                'median_days': float(percentiles[0, pair]),
+                'p90_days': float(percentiles[1, pair]),
+            }
+            for pair in observed.tolist()
+        ]
+
+        return {
+            'statuses': self.statuses,
+            'total': int(len(positions)),
+            'matrix': counts.reshape(n_statuses, n_statuses).tolist(),
+            'transitions': transitions,
+        }
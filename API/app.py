@@ -1,16 +1,243 @@
+import hmac
 import os
+import time
+from datetime import datetime, timezone
 
-from flask import Flask, jsonify
-from predict import predict_resolution_date
+from flask import Flask, Response, g, jsonify, request
+import csvcache
+from analytics import BottleneckAnalytics
+from backlog import BacklogSeries
+from export import EXPORT_FORMATS, gzip_stream, iter_export
+from ingest import IssueFileTailer, IssueIngestor, records_to_frame
+from metrics import CONTENT_TYPE, Gauge, Histogram, MetricsRegistry, SlowRequestProfiler, StageMetrics
+from model_registry import ModelRegistry
+from preprocessing import FeatureEncoder, stage_hooks
+from response_cache import LRUCache, ResponseCache, SharedCache, cache_key, snapshot_etag
+from sharding import ProcessPool, ShardedSnapshotManager
 
-from datahelper import get_issue_by_key
+from datahelper import get_issue_store
 from datahelper import get_avro_issues_data
-from datahelper import get_issues_till_date
+from datahelper import get_transitions
+from datahelper import load_daycounts
 
 
 
 app = Flask(__name__)
 
+# Maximum number of issue keys in one batch prediction request
+MAX_BATCH_KEYS = int(os.environ.get('JIRA_MAX_BATCH_KEYS', 1000))
+
+# Metrics of this process, served at /metrics. The stages of preprocessing and prediction are
+# recorded from now on, so the first snapshot build below is measured too
+metrics = MetricsRegistry()
+request_durations = metrics.register(Histogram(
+    'jira_request_duration_seconds', 'Duration of the HTTP requests, until the response body starts.',
+    ('route', 'method', 'status')))
+stage_hooks.append(StageMetrics(metrics))
+
+# Optionally profile a sample of the requests and keep the profiles of the slow ones (see JIRA_PROFILE_DIR)
+request_profiler = SlowRequestProfiler.from_environ()
+
+# Load the regression model once per process, instead of on every request. Without an artifact on disk the app
+# still starts, and the prediction routes answer 503 until a model is loaded (by the admin reload route or the
+# model watcher)
+model_registry = ModelRegistry()
+if os.path.exists(model_registry.path):
+    model_registry.load()
+else:
+    app.logger.warning('No model artifact at %s, predictions are unavailable until a model is loaded',
+                       model_registry.path)
+
+# Feature encoder used when no encoder schema was saved next to the model, fitted on the
+# issues the model was trained on
+default_encoder = FeatureEncoder().fit(get_avro_issues_data())
+
+# Optionally preprocess and score the projects in parallel worker processes (JIRA_SHARD_WORKERS), instead of
+# one project after the other in the process serving the requests
+SHARD_WORKERS = int(os.environ.get('JIRA_SHARD_WORKERS', 0))
+shard_pool = ProcessPool(SHARD_WORKERS) if SHARD_WORKERS > 0 else None
+
+# Predict all issues once at startup, one snapshot per project with the project's model (or the global one).
+# Requests are served from the published snapshots
+snapshots = ShardedSnapshotManager(get_issue_store(), model_registry, default_encoder, executor=shard_pool)
+if model_registry.version is not None:
+    snapshots.rebuild()
+
+# Encode the transition log once, analytics queries only aggregate the transitions they select
+bottleneck_analytics = BottleneckAnalytics(get_transitions())
+
+# Pivot the daily issue counts per status once into a dense day x status matrix
+backlog_series = BacklogSeries(load_daycounts())
+
+# Cache the responses of the polled routes, keyed by the model and data versions of the snapshot they were
+# served from, so a new model or data is never answered from older responses. Optionally shared by all
+# workers through Redis (JIRA_RESPONSE_CACHE_URL)
+RESPONSE_CACHE_SIZE = int(os.environ.get('JIRA_RESPONSE_CACHE_SIZE', 10000))
+RESPONSE_CACHE_TTL = float(os.environ.get('JIRA_RESPONSE_CACHE_TTL', 60))
+response_cache = ResponseCache(
+    LRUCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL),
+    SharedCache.from_url(os.environ['JIRA_RESPONSE_CACHE_URL'], RESPONSE_CACHE_TTL)
+    if os.environ.get('JIRA_RESPONSE_CACHE_URL') else None
+) if RESPONSE_CACHE_SIZE > 0 else None
+
+metrics.register(Gauge('jira_issue_store_rows', 'Number of issues in the issue store.',
+                       lambda: len(get_issue_store())))
+metrics.register(Gauge('jira_snapshot_rows', 'Number of issues in the current prediction snapshot.',
+                       lambda: len(snapshots.current.predictions) if snapshots.ready else None))
+metrics.register(Gauge('jira_snapshot_age_seconds', 'Seconds since the current prediction snapshot was built.',
+                       lambda: time.time() - snapshots.current.built_at if snapshots.ready else None))
+metrics.register(Gauge('jira_csv_cache_hits_total', 'Number of CSV loads served from the columnar cache.',
+                       lambda: csvcache.cache_stats['hits'], 'counter'))
+metrics.register(Gauge('jira_csv_cache_misses_total', 'Number of CSV loads that parsed the CSV file.',
+                       lambda: csvcache.cache_stats['misses'], 'counter'))
+metrics.register(Gauge('jira_response_cache_hits_total', 'Number of responses served from the response cache.',
+                       lambda: response_cache.hits if response_cache is not None else None, 'counter'))
+metrics.register(Gauge('jira_response_cache_shared_hits_total',
+                       'Number of responses served from the response cache shared by the workers.',
+                       lambda: response_cache.shared_hits if response_cache is not None else None, 'counter'))
+metrics.register(Gauge('jira_response_cache_misses_total', 'Number of responses that were not in the response cache.',
+                       lambda: response_cache.misses if response_cache is not None else None, 'counter'))
+metrics.register(Gauge('jira_response_cache_hit_ratio', 'Fraction of the responses served from the response cache.',
+                       lambda: response_cache.hit_ratio() if response_cache is not None else None))
+metrics.register(Gauge('jira_response_cache_entries', 'Number of responses in the in-process response cache.',
+                       lambda: len(response_cache.local) if response_cache is not None else None))
+metrics.register(Gauge('jira_csv_cache_hit_ratio', 'Fraction of the CSV loads served from the columnar cache.',
+                       lambda: csvcache.cache_stats['hits'] / max(1, sum(csvcache.cache_stats.values()))))
+
+# Upserts ingested issues into the issue store and re-scores only those issues
+ingestor = IssueIngestor(get_issue_store(), snapshots)
+
+# Optionally follow a file that new and updated issues are appended to (as NDJSON or CSV)
+file_tailer = IssueFileTailer(os.environ['JIRA_INGEST_TAIL_PATH'], ingestor) \
+    if os.environ.get('JIRA_INGEST_TAIL_PATH') else None
+
+
+def start_background_tasks():
+    # Threads do not survive a fork, so a pre-forking server defers this to every worker (see gunicorn.conf.py)
+
+    # Optionally hot-swap the models whenever the artifacts on disk change
+    if os.environ.get('JIRA_MODEL_WATCH_INTERVAL'):
+        for registry in snapshots.registries:
+            registry.start_watching(float(os.environ['JIRA_MODEL_WATCH_INTERVAL']))
+
+    # Rebuild the snapshot in the background when the model or data changes (or when it gets too old)
+    snapshots.start(
+        float(os.environ.get('JIRA_SNAPSHOT_INTERVAL', 30)),
+        float(os.environ['JIRA_SNAPSHOT_MAX_AGE']) if os.environ.get('JIRA_SNAPSHOT_MAX_AGE') else None
+    )
+
+    # Every worker follows the file and keeps its own issue store up to date
+    if file_tailer is not None:
+        file_tailer.start(float(os.environ.get('JIRA_INGEST_TAIL_INTERVAL', 1)))
+
+
+if not os.environ.get('JIRA_DEFER_BACKGROUND_TASKS'):
+    start_background_tasks()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+    g.request_profile = request_profiler.start() if request_profiler is not None else None
+
+
+# Routes that serve or update predictions, they need a loaded model and the snapshots predicted with it
+# (the backlog history is served without a model, only its forecast needs one)
+PREDICTION_ENDPOINTS = {'resolve_predict', 'resolve_predict_batch', 'resolved_since_now', 'export_predictions',
+                        'ingest_issues'}
+
+
+@app.before_request
+def require_predictions():
+    if request.endpoint in PREDICTION_ENDPOINTS and not snapshots.ready:
+        return jsonify({'error': 'No model loaded, predictions are unavailable'}), 503
+
+
+@app.after_request
+def record_request_duration(response):
+    # Streamed bodies (e.g. the export) are only timed until the response starts
+    seconds = time.perf_counter() - g.request_started_at
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_durations.observe(seconds, route, request.method, str(response.status_code))
+
+    if g.request_profile is not None:
+        request_profiler.stop(g.request_profile, '{} {}'.format(request.method, route), seconds)
+        g.request_profile = None
+    return response
+
+
+@app.teardown_request
+def stop_request_profile(error=None):
+    # A request that failed before after_request ran still has to stop its profiler
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        profile.disable()
+
+
+def cached_json_response(key, build):
+    # Serve a response from the response cache, or build it with build() and cache it.
+    # Only successful and not found responses are cached, errors are always built again
+    if response_cache is None:
+        return build()
+
+    cached = response_cache.get(key)
+    if cached is not None:
+        body, status = cached
+        return Response(body, status=status, mimetype='application/json')
+
+    response = app.make_response(build())
+    if response.status_code in (200, 404):
+        response_cache.set(key, response.get_data(), response.status_code)
+    return response
+
+
+def snapshot_last_modified(snapshot):
+    # HTTP dates have a resolution of one second
+    return datetime.fromtimestamp(int(snapshot.built_at), timezone.utc)
+
+
+def not_modified_response(snapshot, etag):
+    # Answer a conditional GET with 304 if the client already has the current response, checking only the request
+    # headers against the snapshot's versions and build time. If-None-Match takes precedence over If-Modified-Since
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    elif request.if_modified_since is not None:
+        not_modified = snapshot_last_modified(snapshot) <= request.if_modified_since
+    else:
+        not_modified = False
+
+    if not not_modified:
+        return None
+    return set_validators(Response(status=304), snapshot, etag)
+
+
+def set_validators(response, snapshot, etag):
+    # Add the ETag and Last-Modified headers to successful responses (and to 304 responses)
+    if response.status_code in (200, 304):
+        response.set_etag(etag)
+        response.last_modified = snapshot_last_modified(snapshot)
+    return response
+
+
+def is_admin_request():
+    # Only allow admin requests if the caller knows the admin token. Without a token they are refused, unless
+    # JIRA_ADMIN_OPEN=1 explicitly opens them to any caller (e.g. for local development)
+    admin_token = os.environ.get('JIRA_ADMIN_TOKEN')
+    if not admin_token:
+        return os.environ.get('JIRA_ADMIN_OPEN') == '1'
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'), admin_token.encode('utf-8'))
+
+
+def parse_non_negative_int(value, default=None):
+    # Parse an optional query argument, rejecting anything that is not a non-negative integer
+    if value is None:
+        return default
+    number = int(value)
+    if number < 0:
+        raise ValueError(value)
+    return number
+
+
 @app.route('/api/issue/<issue_key>/resolve-fake3', methods=['GET'])
 def resolve_fake3(issue_key):
     return jsonify({
@@ -22,37 +249,245 @@ def resolve_fake3(issue_key):
 
 @app.route('/api/issue/<issue_key>/resolve-prediction', methods=['GET'])
 def resolve_predict(issue_key):
-    issue = get_issue_by_key(issue_key)
-    avro_issues = get_avro_issues_data()
-    # Check if the issue key exists in the data
-    if issue.empty:
+    # Only the snapshot of the issue's project (from its key prefix) is read
+    snapshot = snapshots.shard_snapshot(issue_key)
+    # Check if the issue key exists in the data, in the shard of its project, before answering conditional requests
+    if snapshot is None or issue_key not in get_issue_store():
         return jsonify({'error': 'Issue key not found'}), 404
 
-    resolution_date = predict_resolution_date(avro_issues, issue_key)
+    etag = snapshot_etag(snapshot, 'resolve-prediction', issue_key)
+    not_modified = not_modified_response(snapshot, etag)
+    if not_modified is not None:
+        return not_modified
+
+    def build():
+        # An issue without a prediction (e.g. closed without a resolution date) is answered like in the batch route
+        resolution_date = snapshot.resolution_date(issue_key)
+        if resolution_date is None:
+            return jsonify({'error': 'No prediction for the issue'}), 404
+        return jsonify({
+            'issue': issue_key,
+            'predicted_resolution_date': resolution_date
+        })
+
+    response = cached_json_response(cache_key('resolve-prediction', snapshot.version, issue_key), build)
+    return set_validators(response, snapshot, etag)
+
+
+
+@app.route('/api/issues/resolve-prediction', methods=['POST'])
+def resolve_predict_batch():
+    # The body is either a list of issue keys or an object with a 'keys' list
+    body = request.get_json(silent=True)
+    keys = body.get('keys') if isinstance(body, dict) else body
+    if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+        return jsonify({'error': 'Expected a JSON list of issue keys'}), 400
+    if len(keys) > MAX_BATCH_KEYS:
+        return jsonify({'error': 'At most {} issue keys per request'.format(MAX_BATCH_KEYS)}), 400
+
+    # All issues were scored together when the snapshots were built, so every key is a lookup in the snapshot of
+    # its project
+    issue_store = get_issue_store()
+    issues = []
+    for key in keys:
+        snapshot = snapshots.shard_snapshot(key)
+        if snapshot is None or key not in issue_store:
+            issues.append({'issue': key, 'error': 'Issue key not found', 'status': 404})
+            continue
+        resolution_date = snapshot.resolution_date(key)
+        if resolution_date is None:
+            issues.append({'issue': key, 'error': 'No prediction for the issue', 'status': 404})
+        else:
+            issues.append({'issue': key, 'predicted_resolution_date': resolution_date, 'status': 200})
+
     return jsonify({
-        'issue': issue_key,
-        'predicted_resolution_date': resolution_date
+        'issues': issues
     })
 
 
 
 @app.route('/api/release/<date>/resolved-since-now', methods=['GET'])
 def resolved_since_now(date):
-    avro_issues = get_avro_issues_data()
-    predicted_issues = predict_resolution_date(avro_issues)
-    filtered_df = get_issues_till_date(predicted_issues, date)
-    # Construct a list of issues with their predicted resolution dates
-    issues = [
-        {
-            'issue': row['key'],
-            'predicted_resolution_date': row['created']
-        }
-        for _, row in filtered_df.iterrows()
-    ]
+    # Optional pagination, the cursor is the position of the first issue of the page
+    try:
+        limit = parse_non_negative_int(request.args.get('limit'))
+        start = parse_non_negative_int(request.args.get('cursor'), 0)
+        # An empty page would return its own cursor as the next one, and a client following it would never finish
+        if limit == 0:
+            raise ValueError(limit)
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer and cursor a non-negative integer'}), 400
+
+    # Optionally only the issues of one project, read from the snapshot of that project alone
+    project = request.args.get('project')
+    snapshot = snapshots.project_snapshot(project) if project else snapshots.current
+    if snapshot is None:
+        return jsonify({'error': 'Project not found'}), 404
+
+    etag = snapshot_etag(snapshot, 'resolved-since-now', date, limit, start, project)
+    not_modified = not_modified_response(snapshot, etag)
+    if not_modified is not None:
+        return not_modified
+
+    def build():
+        # Binary search the unresolved issues sorted by predicted resolution date
+        try:
+            keys, resolution_dates, total = snapshot.date_index.issues_until(date, start, limit)
+        except ValueError:
+            return jsonify({'error': 'Invalid date, expected ISO-8601'}), 400
+
+        # Construct a list of issues with their predicted resolution dates
+        issues = [
+            {
+                'issue': key,
+                'predicted_resolution_date': resolution_date
+            }
+            for key, resolution_date in zip(keys.tolist(), resolution_dates.tolist())
+        ]
+
+        next_start = start + len(issues)
+        return jsonify({
+            'now': date,
+            'issues': issues,
+            'total': total,
+            'next_cursor': str(next_start) if next_start < total else None
+        })
+
+    response = cached_json_response(cache_key('resolved-since-now', snapshot.version, date, limit, start, project), build)
+    return set_validators(response, snapshot, etag)
+
+
+
+@app.route('/api/predictions/export', methods=['GET'])
+def export_predictions():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'format must be one of: {}'.format(', '.join(EXPORT_FORMATS))}), 400
+
+    try:
+        chunk_size = parse_non_negative_int(request.args.get('chunk_size'), 1000)
+    except ValueError:
+        return jsonify({'error': 'chunk_size must be a positive integer'}), 400
+    if chunk_size == 0:
+        return jsonify({'error': 'chunk_size must be a positive integer'}), 400
+
+    # The compressed and uncompressed exports are different representations, with different ETags.
+    # Clients can refuse gzip with a quality of 0 (e.g. 'gzip;q=0'), and accept it through '*'
+    use_gzip = request.accept_encodings['gzip'] > 0
+    snapshot = snapshots.current
+    etag = snapshot_etag(snapshot, 'export', export_format, chunk_size, use_gzip)
+    not_modified = not_modified_response(snapshot, etag)
+    if not_modified is not None:
+        return not_modified
+
+    # Stream the predictions of the current snapshot chunk by chunk, even if a new snapshot is published meanwhile
+    body = iter_export(snapshot.predictions, export_format, chunk_size)
+
+    headers = {'Content-Disposition': 'attachment; filename=predictions.{}'.format(export_format), 'Vary': 'Accept-Encoding'}
+    if use_gzip:
+        body = gzip_stream(body)
+        headers['Content-Encoding'] = 'gzip'
+
+    return set_validators(Response(body, mimetype=EXPORT_FORMATS[export_format], headers=headers), snapshot, etag)
+
+
+
+@app.route('/api/analytics/bottlenecks', methods=['GET'])
+def bottlenecks():
+    # Optional filters, priority and issue_type may be repeated or comma separated
+    def parse_list(name):
+        values = [value for arg in request.args.getlist(name) for value in arg.split(',') if value]
+        return values or None
+
+    try:
+        result = bottleneck_analytics.query(parse_list('priority'), parse_list('issue_type'),
+                                            request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date, expected ISO-8601'}), 400
+
+    return jsonify(result)
+
+
+
+@app.route('/api/backlog', methods=['GET'])
+def backlog():
+    # Optional date range and statuses (repeated or comma separated) of the history
+    start, end = request.args.get('from'), request.args.get('to')
+    statuses = [value for arg in request.args.getlist('status') for value in arg.split(',') if value] or None
+
+    if not snapshots.ready:
+        # Without a model there are no predicted resolution dates, so only the history is served
+        try:
+            return jsonify(backlog_series.query(start, end, statuses))
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+
+    snapshot = snapshots.current
+    etag = snapshot_etag(snapshot, 'backlog', start, end, statuses)
+    not_modified = not_modified_response(snapshot, etag)
+    if not_modified is not None:
+        return not_modified
+
+    def build():
+        # The days after the history are forecast from the predicted resolution dates of the open issues
+        try:
+            result = backlog_series.query(start, end, statuses, snapshot.date_index.epochs)
+        except ValueError as error:
+            return jsonify({'error': str(error)}), 400
+        return jsonify(result)
+
+    response = cached_json_response(cache_key('backlog', snapshot.version, start, end, statuses), build)
+    return set_validators(response, snapshot, etag)
+
+
+
+@app.route('/api/issues/ingest', methods=['POST'])
+def ingest_issues():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    # The body is an issue, a list of issues or an object with an 'issues' list
+    body = request.get_json(silent=True)
+    records = body.get('issues') if isinstance(body, dict) and 'issues' in body else body
+    if isinstance(records, dict):
+        records = [records]
+    if not isinstance(records, list):
+        return jsonify({'error': 'Expected a JSON issue or a list of issues'}), 400
+    if len(records) > MAX_BATCH_KEYS:
+        return jsonify({'error': 'At most {} issues per request'.format(MAX_BATCH_KEYS)}), 400
+
+    try:
+        issues = records_to_frame(records)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+
+    # Only the ingested issues are re-scored, the published snapshot is updated incrementally
+    return jsonify(ingestor.ingest(issues))
+
+
+
+@app.route('/api/admin/model/reload', methods=['POST'])
+def reload_model():
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+
+    # Swap in the artifacts currently on disk and predict with them, requests in flight keep the previous snapshots
+    try:
+        model_version = snapshots.model_registry.load().version
+        project_model_versions = {}
+        for project, registry in snapshots.project_registries.items():
+            project_model_versions[project] = registry.load().version
+        snapshots.rebuild()
+    except Exception as error:
+        return jsonify({'error': 'Model reload failed: {}'.format(error)}), 500
 
     return jsonify({
-        'now': date,
-        'issues': issues
+        'model_version': model_version,
+        'project_model_versions': project_model_versions
     })
 
 
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
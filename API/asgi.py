@@ -0,0 +1,308 @@
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qs
+
+from response_cache import cache_key, snapshot_etag
+
+
+# Number of threads computing responses off the event loop
+ASGI_WORKERS = int(os.environ.get('JIRA_ASGI_WORKERS', 4))
+
+# Maximum number of distinct computations running or waiting for a thread, further requests get a 503
+ASGI_MAX_PENDING = int(os.environ.get('JIRA_ASGI_MAX_PENDING', 64))
+
+
+class Overloaded(Exception):
+    """Raised when a computation is submitted while `CoalescingExecutor.max_pending` computations are pending."""
+
+
+class CoalescingExecutor:
+    """
+    Runs CPU-bound computations off the event loop, on a bounded executor.
+
+    Concurrent calls with the same key share a single computation: the first call submits it, and the calls that
+    arrive while it is pending wait for its result instead of computing it again. When `max_pending` computations are
+    already running or queued, new ones are rejected with `Overloaded` instead of queueing without bound, so a burst
+    of expensive requests cannot delay everything behind it.
+
+    Only the event loop thread calls `run`, so the pending computations are tracked without a lock.
+
+    Parameters:
+    executor (concurrent.futures.Executor): Runs the computations, e.g. a ThreadPoolExecutor.
+    max_pending (int): The maximum number of computations running or waiting for the executor.
+    """
+
+    def __init__(self, executor, max_pending):
+        self.executor = executor
+        self.max_pending = max_pending
+        self._pending = {}
+        self.coalesced = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def run(self, key, fn, *args):
+        """
+        Return the result of `fn(*args)`, computed by the executor or by a pending call with the same key.
+
+        Parameters:
+        key (hashable): Identifies the computation, calls with the same key must compute the same result.
+        fn (callable): The computation.
+        args: The arguments of `fn`.
+
+        Raises:
+        Overloaded: If `max_pending` computations are pending.
+        """
+        future = self._pending.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded()
+            future = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+            self._pending[key] = future
+
+            def forget(done):
+                if self._pending.get(key) is done:
+                    del self._pending[key]
+            future.add_done_callback(forget)
+
+        # A cancelled request (e.g. the client disconnected) does not cancel the computation the others wait for
+        return await asyncio.shield(future)
+
+
+def json_body(obj):
+    # Serialize like Flask's jsonify, so both apps send (and cache) the same bytes
+    return (json.dumps(obj, separators=(',', ':'), sort_keys=True) + '\n').encode('utf-8')
+
+
+def etag_matches(if_none_match, etag):
+    # Strong comparison of an If-None-Match header with an ETag, weak ETags never match
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag == '"{}"'.format(etag):
+            return True
+    return False
+
+
+class AsyncAPI:
+    """
+    An ASGI version of the `resolve-fake3`, `resolve-prediction` and `resolved-since-now` routes.
+
+    The routes read the same prediction snapshots, response cache and ETags as the Flask app. Requests that are
+    cheap to answer (resolve-fake3, the snapshot lookup of resolve-prediction, 304 responses and cache hits) are
+    answered on the event loop. Listing the issues resolved by a date slices the resolution date index and
+    serializes up to every open issue, so it runs on a bounded thread pool through a `CoalescingExecutor`:
+    identical concurrent requests are computed once, and a full queue is answered with 503 and `Retry-After`
+    rather than delaying the cheap requests.
+
+    Parameters:
+    snapshots (ShardedSnapshotManager): The prediction snapshots.
+    issue_store (ShardedIssueStore): The issues, to tell unknown issue keys from issues without a prediction.
+    response_cache (ResponseCache, optional): Caches the serialized responses, e.g. the cache of the Flask app.
+    executor (concurrent.futures.Executor, optional): Computes the responses. Defaults to a thread pool with
+                                                      `ASGI_WORKERS` threads.
+    max_pending (int, optional): See `CoalescingExecutor`. Defaults to `ASGI_MAX_PENDING`.
+    """
+
+    routes = [
+        (re.compile(r'^/api/issue/(?P<issue_key>[^/]+)/resolve-fake3$'), 'resolve_fake3'),
+        (re.compile(r'^/api/issue/(?P<issue_key>[^/]+)/resolve-prediction$'), 'resolve_predict'),
+        (re.compile(r'^/api/release/(?P<date>[^/]+)/resolved-since-now$'), 'resolved_since_now'),
+    ]
+
+    def __init__(self, snapshots, issue_store, response_cache=None, executor=None, max_pending=None):
+        self.snapshots = snapshots
+        self.issue_store = issue_store
+        self.response_cache = response_cache
+        self.executor = executor or ThreadPoolExecutor(ASGI_WORKERS, thread_name_prefix='asgi-worker')
+        self.computations = CoalescingExecutor(self.executor, max_pending or ASGI_MAX_PENDING)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        for pattern, name in self.routes:
+            match = pattern.match(scope['path'])
+            if match is not None:
+                break
+        else:
+            await self.send_response(send, 404, json_body({'error': 'Not found'}))
+            return
+
+        if scope['method'] != 'GET':
+            await self.send_response(send, 405, json_body({'error': 'Method not allowed'}), [(b'allow', b'GET')])
+            return
+
+        # Every route but resolve-fake3 needs the snapshots, which are only built once a model is loaded
+        if name != 'resolve_fake3' and not self.snapshots.ready:
+            await self.send_response(send, 503, json_body({'error': 'No model loaded, predictions are unavailable'}))
+            return
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+        args = {name: values[0] for name, values in parse_qs(scope['query_string'].decode('latin-1'),
+                                                                     keep_blank_values=True).items()}
+        status, body, extra_headers = await getattr(self, name)(headers, args, **match.groupdict())
+        await self.send_response(send, status, body, extra_headers)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def send_response(send, status, body, extra_headers=()):
+        headers = list(extra_headers)
+        if body or status != 304:
+            headers += [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode('ascii'))]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def validators(snapshot, etag):
+        # The ETag and Last-Modified headers of a response computed from a snapshot
+        return [(b'etag', '"{}"'.format(etag).encode('ascii')),
+                (b'last-modified', formatdate(int(snapshot.built_at), usegmt=True).encode('ascii'))]
+
+    @staticmethod
+    def is_not_modified(headers, snapshot, etag):
+        # If-None-Match takes precedence over If-Modified-Since, like in the Flask app
+        if 'if-none-match' in headers:
+            return etag_matches(headers['if-none-match'], etag)
+        if 'if-modified-since' in headers:
+            try:
+                modified_since = parsedate_to_datetime(headers['if-modified-since']).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(snapshot.built_at) <= modified_since
+        return False
+
+    def cached(self, key):
+        # Only the in-process cache is read on the event loop, a shared cache is read by the computation itself
+        if self.response_cache is None or self.response_cache.shared is not None:
+            return None
+        return self.response_cache.get(key)
+
+    def compute_cached(self, key, build):
+        # Runs on the executor: read a shared cache, or build the response and cache it
+        if self.response_cache is not None and self.response_cache.shared is not None:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return cached
+
+        body, status = build()
+        if self.response_cache is not None and status in (200, 404):
+            self.response_cache.set(key, body, status)
+        return body, status
+
+    async def resolve_fake3(self, headers, args, issue_key):
+        return 200, json_body({
+            'issue': issue_key,
+            'predicted_resolution_date': '1970-01-01T00:00:00.000+0000'
+        }), []
+
+    async def resolve_predict(self, headers, args, issue_key):
+        # A lookup in the snapshot of the issue's project, answered on the event loop
+        snapshot = self.snapshots.shard_snapshot(issue_key)
+        if snapshot is None or issue_key not in self.issue_store:
+            return 404, json_body({'error': 'Issue key not found'}), []
+
+        etag = snapshot_etag(snapshot, 'resolve-prediction', issue_key)
+        if self.is_not_modified(headers, snapshot, etag):
+            return 304, b'', self.validators(snapshot, etag)
+
+        # An issue without a prediction is answered like in the Flask app
+        resolution_date = snapshot.resolution_date(issue_key)
+        if resolution_date is None:
+            return 404, json_body({'error': 'No prediction for the issue'}), []
+        return 200, json_body({
+            'issue': issue_key,
+            'predicted_resolution_date': resolution_date
+        }), self.validators(snapshot, etag)
+
+    async def resolved_since_now(self, headers, args, date):
+        # Optional pagination, the cursor is the position of the first issue of the page
+        try:
+            limit = int(args['limit']) if 'limit' in args else None
+            start = int(args.get('cursor', 0))
+            # An empty page would return its own cursor as the next one, like in the Flask app
+            if start < 0 or (limit is not None and limit <= 0):
+                raise ValueError(args)
+        except ValueError:
+            return 400, json_body({'error': 'limit must be a positive integer and cursor a non-negative integer'}), []
+
+        # Optionally only the issues of one project, read from the snapshot of that project alone
+        project = args.get('project')
+        snapshot = self.snapshots.project_snapshot(project) if project else self.snapshots.current
+        if snapshot is None:
+            return 404, json_body({'error': 'Project not found'}), []
+
+        etag = snapshot_etag(snapshot, 'resolved-since-now', date, limit, start, project)
+        if self.is_not_modified(headers, snapshot, etag):
+            return 304, b'', self.validators(snapshot, etag)
+
+        key = cache_key('resolved-since-now', snapshot.version, date, limit, start, project)
+        cached = self.cached(key)
+        if cached is None:
+            try:
+                cached = await self.computations.run(key, self.compute_cached, key,
+                                                     lambda: resolved_issues_body(snapshot, date, start, limit))
+            except Overloaded:
+                return 503, json_body({'error': 'Server busy, retry later'}), [(b'retry-after', b'1')]
+
+        body, status = cached
+        return status, body, self.validators(snapshot, etag) if status == 200 else []
+
+
+def resolved_issues_body(snapshot, date, start, limit):
+    """
+    Serialize the unresolved issues predicted to be resolved by a date, see the `resolved-since-now` route.
+
+    Returns:
+    tuple: The JSON body (bytes) and the status code.
+    """
+    # Binary search the unresolved issues sorted by predicted resolution date
+    try:
+        keys, resolution_dates, total = snapshot.date_index.issues_until(date, start, limit)
+    except ValueError:
+        return json_body({'error': 'Invalid date, expected ISO-8601'}), 400
+
+    issues = [
+        {
+            'issue': key,
+            'predicted_resolution_date': resolution_date
+        }
+        for key, resolution_date in zip(keys.tolist(), resolution_dates.tolist())
+    ]
+
+    next_start = start + len(issues)
+    return json_body({
+        'now': date,
+        'issues': issues,
+        'total': total,
+        'next_cursor': str(next_start) if next_start < total else None
+    }), 200
+
+
+def create_app():
+    """
+    Create the ASGI app from the data, model and snapshots loaded by the Flask app, e.g. for
+    `uvicorn --factory asgi:create_app`.
+    """
+    import app
+
+    return AsyncAPI(app.snapshots, app.get_issue_store(), app.response_cache)
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+from snapshot import to_epoch_seconds
+
+
+# Statuses of the issues that are still open, summed up as the backlog
+OPEN_STATUSES = ['Open', 'In Progress', 'Patch Available', 'Reopened']
+
+# Number of days forecast after the history when no end date is requested
+FORECAST_DAYS = 90
+
+# Maximum number of days of a query, so a response stays bounded
+MAX_DAYS = 20000
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def to_day_number(date):
+    """
+    Convert an ISO-8601 date to the number of days since the epoch (of its UTC date).
+
+    Raises:
+    ValueError: If the date cannot be parsed.
+    """
+    return to_epoch_seconds(date) // SECONDS_PER_DAY
+
+
+class BacklogSeries:
+    """
+    The daily number of issues per status, and a forecast of the number of open issues.
+
+    The counts are pivoted once into a dense (day × status) matrix, where row i holds the counts of the i-th day
+    after the first one, so any date range is a slice. Days missing from the counts repeat the previous day.
+
+    Parameters:
+    daycounts (pd.DataFrame): The number of issues per status and day, with the columns 'day' (ISO-8601, the UTC date
+                              is used), 'status' and 'count', e.g. from 'avro-daycounts.csv'.
+    """
+
+    def __init__(self, daycounts):
+        day_numbers = pd.to_datetime(daycounts['day'], utc=True).dt.tz_localize(None).values.astype('datetime64[D]')
+        day_numbers = day_numbers.astype(np.int64)
+        status_codes, statuses = pd.factorize(daycounts['status'].astype(object))
+
+        # Open statuses first, in their order, then the others as they occur
+        self.statuses = [status for status in OPEN_STATUSES if status in set(statuses)] + \
+                        [status for status in statuses if status not in OPEN_STATUSES]
+        status_codes = pd.Index(self.statuses).get_indexer(statuses)[status_codes]
+
+        self.first_day = int(day_numbers.min())
+        rows = day_numbers - self.first_day
+        n_days = int(rows.max()) + 1
+
+        self.counts = np.zeros((n_days, len(self.statuses)), dtype=np.int64)
+        self.counts[rows, status_codes] = daycounts['count'].to_numpy(dtype=np.int64)
+
+        # Fill the days without counts with the previous day
+        present = np.zeros(n_days, dtype=bool)
+        present[rows] = True
+        if not present.all():
+            self.counts = self.counts[np.maximum.accumulate(np.where(present, np.arange(n_days), 0))]
+
+        self.open_columns = np.array([status in OPEN_STATUSES for status in self.statuses])
+
+    @property
+    def last_day(self):
+        return self.first_day + len(self.counts) - 1
+
+    def history(self, start_day, end_day, statuses):
+        """
+        Return the counts of some statuses and of the open issues for the days from `start_day` to `end_day`.
+
+        Parameters:
+        start_day (int): The first day, as days since the epoch.
+        end_day (int): The last day (included).
+        statuses (list of str): The statuses to return the counts of.
+
+        Returns:
+        tuple: The day numbers, the counts of `statuses` (one column per status) and the open issue counts.
+        """
+        lower = max(start_day, self.first_day) - self.first_day
+        upper = min(end_day, self.last_day) - self.first_day + 1
+        if lower >= upper:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(statuses)), dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        counts = self.counts[lower:upper]
+        columns = [self.statuses.index(status) for status in statuses]
+        return np.arange(lower, upper) + self.first_day, counts[:, columns], counts[:, self.open_columns].sum(axis=1)
+
+    @property
+    def last_open_count(self):
+        """The number of open issues on the last day of the history."""
+        return int(self.counts[-1, self.open_columns].sum())
+
+    @staticmethod
+    def forecast(resolution_epochs, open_count, start_day, end_day):
+        """
+        Forecast the number of open issues from their predicted resolution dates.
+
+        The forecast continues from `open_count`, the number of open issues the day before `start_day`, and an issue
+        is open until the day of its predicted resolution date. The resolutions are counted per day with
+        `np.bincount` and subtracted with a cumulative sum over the days, so the forecast costs one pass over the
+        issues and one over the days. Overdue issues, predicted to be resolved before `start_day`, carry no date to
+        forecast their resolution on, so they are left out and the forecast never drops on its first day. New issues
+        are not forecast.
+
+        Parameters:
+        resolution_epochs (np.ndarray): The predicted resolution dates of the open issues, in seconds since the epoch.
+        open_count (int): The number of open issues at the end of the day before `start_day`.
+        start_day (int): The first forecast day, as days since the epoch.
+        end_day (int): The last forecast day (included).
+
+        Returns:
+        tuple: The day numbers, the forecast number of open issues at the end of every day, and the number of
+               overdue issues.
+        """
+        n_days = max(end_day - start_day + 1, 0)
+        offsets = np.asarray(resolution_epochs, dtype=np.int64) // SECONDS_PER_DAY - start_day
+        overdue = int((offsets < 0).sum())
+        resolved = np.bincount(offsets[(offsets >= 0) & (offsets < n_days)], minlength=n_days)
+        return np.arange(start_day, start_day + n_days), np.maximum(open_count - np.cumsum(resolved), 0), overdue
+
+    def query(self, start=None, end=None, statuses=None, resolution_epochs=None):
+        """
+        Return the history of the issue counts and the forecast of the open issues for a date range.
+
+        Parameters:
+        start (str, optional): The first day in ISO-8601 format, the first day of the history if not provided.
+        end (str, optional): The last day (included), `FORECAST_DAYS` after the history if not provided.
+        statuses (list of str, optional): The statuses of the history, all if not provided.
+        resolution_epochs (np.ndarray, optional): The predicted resolution dates of the open issues, in seconds
+                                                  since the epoch. The days after the history are forecast from them.
+
+        Returns:
+        dict: The days and counts of the history (per status and open issues), and the days and open issues of the
+              forecast, with the number of open issues already overdue at the end of the history.
+
+        Raises:
+        ValueError: If a date cannot be parsed, the range is too long or a status is unknown.
+        """
+        try:
+            start_day = to_day_number(start) if start is not None else self.first_day
+            end_day = to_day_number(end) if end is not None else self.last_day + FORECAST_DAYS
+        except ValueError:
+            raise ValueError('Invalid date, expected ISO-8601')
+        if end_day - start_day >= MAX_DAYS:
+            raise ValueError('At most {} days per query'.format(MAX_DAYS))
+        statuses = statuses if statuses is not None else self.statuses
+        unknown = [status for status in statuses if status not in self.statuses]
+        if unknown:
+            raise ValueError('Unknown status: {}'.format(', '.join(unknown)))
+
+        days, counts, open_counts = self.history(start_day, end_day, statuses)
+        result = {
+            'history': {
+                'days': self.format_days(days),
+                'counts': {status: counts[:, column].tolist() for column, status in enumerate(statuses)},
+                'open': open_counts.tolist(),
+            },
+        }
+
+        if resolution_epochs is not None:
+            # The forecast always continues from the end of the history, and is then cut to the requested days
+            forecast_days, forecast_open, overdue = self.forecast(resolution_epochs, self.last_open_count,
+                                                                  self.last_day + 1, end_day)
+            shown = forecast_days >= start_day
+            result['forecast'] = {
+                'days': self.format_days(forecast_days[shown]),
+                'open': forecast_open[shown].tolist(),
+                'overdue': overdue,
+            }
+        return result
+
+    @staticmethod
+    def format_days(day_numbers):
+        """Format days since the epoch as ISO-8601 dates."""
+        return np.asarray(day_numbers, dtype=np.int64).astype('datetime64[D]').astype(str).tolist()
@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from datahelper import AVRO_ISSUES_PATH, get_issues_till_date
+from model_registry import MODEL_PATH, load_artifact
+from predict import predict_resolution_date
+from preprocessing import DATETIME_COLUMNS, FeatureEncoder, parse_datetime_column, preprocess_data
+
+
+# Number of rows of the generated datasets
+DEFAULT_SIZES = (10000, 100000, 1000000)
+
+# Benchmarks whose median got slower than the baseline's by more than this fraction are reported as regressions
+DEFAULT_TOLERANCE = 0.2
+
+# Cutoff date of the get_issues_till_date benchmark, after the last issue of the source data was created
+RELEASE_DATE = '2018-06-30'
+
+
+def format_iso_datetimes(values):
+    """Format naive UTC datetimes the way the JIRA export does, e.g. '2018-04-17T21:53:05.730+0000'."""
+    return values.dt.strftime('%Y-%m-%dT%H:%M:%S.%f').str[:-3] + '+0000'
+
+
+def generate_issues(n_rows, seed=0, source=None):
+    """
+    Generate a synthetic dataset of issues with the shape and distributions of 'avro-issues.csv'.
+
+    Every generated issue copies the attributes of a randomly drawn source issue (status, priority, issue type,
+    counts, resolution, ...), so the joint distributions of the columns are those of the source. The issue is then
+    moved to a random creation time within the creation period of the source, keeping its time to update and to
+    resolution. Keys are numbered in creation order, newest first like the source.
+
+    Parameters:
+    n_rows (int): The number of issues to generate.
+    seed (int, optional): The seed of the random generator. The same seed always generates the same issues.
+    source (pd.DataFrame, optional): The raw issues to draw from. Defaults to 'avro-issues.csv'.
+
+    Returns:
+    pd.DataFrame: The raw issues, with the columns of the source and the datetimes as ISO-8601 strings.
+    """
+    if source is None:
+        source = pd.read_csv(AVRO_ISSUES_PATH)
+    random = np.random.RandomState(seed)
+
+    issues = source.iloc[random.randint(0, len(source), n_rows)].reset_index(drop=True)
+
+    # Move every issue to a new creation time, shifting all its dates by the same amount
+    source_created = parse_datetime_column(source['created'])
+    created = parse_datetime_column(issues['created'])
+    period = (source_created.max() - source_created.min()).total_seconds()
+    new_created = source_created.min() + pd.to_timedelta(np.round(random.uniform(0, period, n_rows), 3), unit='s')
+    shift = new_created - created
+
+    order = np.argsort(-new_created.values.astype('int64'), kind='stable')
+    issues = issues.iloc[order].reset_index(drop=True)
+    shift = shift.iloc[order].reset_index(drop=True)
+
+    for column in DATETIME_COLUMNS:
+        issues[column] = format_iso_datetimes(parse_datetime_column(issues[column]) + shift)
+
+    # The project of the source, numbered from the oldest issue
+    project = source['key'].iloc[0].split('-')[0]
+    issues['key'] = ['{}-{}'.format(project, number) for number in range(n_rows, 0, -1)]
+
+    return issues
+
+
+def load_benchmark_model(path, source, seed=0):
+    """
+    Load the model to benchmark with, or fit a stand-in when the artifact is not available.
+
+    Returns:
+    tuple: The model and a description of it.
+    """
+    if path and os.path.exists(path):
+        return load_artifact(path), os.path.basename(path)
+
+    from sklearn.ensemble import RandomForestRegressor
+
+    # Same features and target as the trained model
+    preprocessed = preprocess_data(source)
+    preprocessed = preprocessed[preprocessed['status'] == 4]
+    features = preprocessed.drop(['days_since_created', 'status'], axis=1)
+    features = features.fillna(features.mean())
+    model = RandomForestRegressor(random_state=seed).fit(features, preprocessed['days_since_created'])
+    return model, 'RandomForestRegressor fitted on the source data'
+
+
+def time_call(function, repeat):
+    """Call a function `repeat` times and return the duration of every call in seconds."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, seed=0, model_path=MODEL_PATH, log=None, model=None):
+    """
+    Time the preprocessing and prediction functions on generated datasets of increasing size.
+
+    Parameters:
+    sizes (iterable of int, optional): The number of rows of each generated dataset.
+    repeat (int, optional): The number of times each benchmark is run.
+    seed (int, optional): The seed of the dataset generator.
+    model_path (str, optional): The model artifact to predict with. A stand-in is fitted if it does not exist.
+    log (callable, optional): Called with a line of text after every benchmark.
+    model (optional): An already loaded model to predict with instead of the artifact at `model_path`.
+
+    Returns:
+    dict: The environment of the run under 'meta', and one entry per benchmark and size under 'results'.
+    """
+    source = pd.read_csv(AVRO_ISSUES_PATH)
+    if model is None:
+        model, model_description = load_benchmark_model(model_path, source, seed)
+    else:
+        model_description = type(model).__name__
+    encoder = FeatureEncoder().fit(source)
+
+    results = []
+    for n_rows in sizes:
+        df = generate_issues(n_rows, seed, source)
+        unresolved_keys = df.loc[~df['status'].isin(['Resolved', 'Closed']), 'key']
+        key = unresolved_keys.iloc[0] if len(unresolved_keys) else df['key'].iloc[0]
+        predictions = predict_resolution_date(df, model=model)
+
+        benchmarks = [
+            ('preprocess_data', lambda: preprocess_data(df)),
+            ('predict_resolution_date', lambda: predict_resolution_date(df, model=model)),
+            ('predict_resolution_date_key', lambda: predict_resolution_date(df, key, model=model)),
+            ('predict_resolution_date_key_encoder', lambda: predict_resolution_date(df, key, model, encoder)),
+            ('get_issues_till_date', lambda: get_issues_till_date(predictions, RELEASE_DATE)),
+        ]
+        for name, function in benchmarks:
+            runs = time_call(function, repeat)
+            results.append({
+                'name': name,
+                'rows': n_rows,
+                'runs': runs,
+                'min': min(runs),
+                'median': statistics.median(runs),
+            })
+            if log is not None:
+                log('{:<40} {:>9} rows  median {:.4f} s'.format(name, n_rows, statistics.median(runs)))
+
+    try:
+        import sklearn
+        sklearn_version = sklearn.__version__
+    except ImportError:
+        sklearn_version = None
+
+    meta = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'sklearn': sklearn_version,
+        'seed': seed,
+        'repeat': repeat,
+        'model': model_description,
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare the median durations of a run with those of a baseline run.
+
+    Parameters:
+    results (dict): The results of `run_benchmarks`.
+    baseline (dict): The results of an earlier run.
+    tolerance (float, optional): The fraction a benchmark may get slower before it is reported as a regression.
+
+    Returns:
+    list of dict: One entry per benchmark and size found in both runs, with the baseline and current medians,
+                  their ratio and whether it is a regression.
+    """
+    baseline_medians = {(result['name'], result['rows']): result['median'] for result in baseline['results']}
+
+    comparison = []
+    for result in results['results']:
+        baseline_median = baseline_medians.get((result['name'], result['rows']))
+        if baseline_median is None:
+            continue
+        ratio = result['median'] / baseline_median if baseline_median > 0 else float('inf')
+        comparison.append({
+            'name': result['name'],
+            'rows': result['rows'],
+            'baseline': baseline_median,
+            'median': result['median'],
+            'ratio': ratio,
+            'regression': ratio > 1 + tolerance,
+        })
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark preprocessing and prediction on synthetic issues.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='Rows of each dataset')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the dataset generator')
+    parser.add_argument('--model', default=MODEL_PATH, help='Model artifact to predict with')
+    parser.add_argument('--output', default='benchmark-results.json', help='File the results are written to')
+    parser.add_argument('--baseline', help='Results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Slowdown (as a fraction) reported as a regression')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.repeat, args.seed, args.model, log=print)
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print('Wrote {}'.format(args.output))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            comparison = compare_results(results, json.load(baseline_file), args.tolerance)
+        for entry in comparison:
+            print('{:<40} {:>9} rows  {:.4f} s -> {:.4f} s  x{:.2f}{}'.format(
+                entry['name'], entry['rows'], entry['baseline'], entry['median'], entry['ratio'],
+                '  REGRESSION' if entry['regression'] else ''))
+        if any(entry['regression'] for entry in comparison):
+            sys.exit(1)
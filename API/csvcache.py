@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+# Default directory of the cache, next to the CSV files it caches
+CACHE_DIR = os.environ.get(
+    'JIRA_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', '.cache')
+)
+
+# Bumped whenever the on-disk layout changes, so older caches are never read
+CACHE_FORMAT = 1
+
+# Number of loads served from the cache and number of loads that had to parse the CSV
+cache_stats = {'hits': 0, 'misses': 0}
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_columns(df, directory):
+    """
+    Save a DataFrame as one NumPy file per column, plus a JSON manifest describing how to rebuild each column.
+
+    Numeric and datetime columns are saved as they are, text and categorical columns as integer codes plus
+    their categories, so every column can be memory-mapped when it is loaded.
+    """
+    columns = []
+    for position, name in enumerate(df.columns):
+        values = df[name]
+        column = {'name': name, 'file': '{}.npy'.format(position)}
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            column.update(kind='category', categories=values.cat.categories.tolist(), ordered=bool(values.cat.ordered))
+            array = values.cat.codes.values
+        elif pd.api.types.is_datetime64_dtype(values):
+            column.update(kind='datetime')
+            array = values.values.view('int64')
+        elif values.dtype == object:
+            codes, categories = pd.factorize(values)
+            column.update(kind='object', categories=categories.tolist())
+            array = codes.astype(np.int32)
+        else:
+            column.update(kind='numeric')
+            array = values.values
+
+        np.save(os.path.join(directory, column['file']), array, allow_pickle=False)
+        columns.append(column)
+
+    with open(os.path.join(directory, 'manifest.json'), 'w') as manifest_file:
+        json.dump({'format': CACHE_FORMAT, 'rows': len(df), 'columns': columns}, manifest_file)
+
+
+def load_columns(directory):
+    """Load a DataFrame saved with `save_columns`, memory-mapping the column files."""
+    with open(os.path.join(directory, 'manifest.json')) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    data = {}
+    for column in manifest['columns']:
+        array = np.load(os.path.join(directory, column['file']), mmap_mode='r', allow_pickle=False)
+
+        if column['kind'] == 'category':
+            data[column['name']] = pd.Categorical.from_codes(array, column['categories'], ordered=column['ordered'])
+        elif column['kind'] == 'datetime':
+            data[column['name']] = array.view('datetime64[ns]')
+        elif column['kind'] == 'object':
+            # Missing values have the code -1, which picks the trailing NaN
+            categories = np.array(column['categories'] + [np.nan], dtype=object)
+            data[column['name']] = categories[array]
+        else:
+            data[column['name']] = array
+
+    return pd.DataFrame(data, index=pd.RangeIndex(manifest['rows']), copy=False)
+
+
+def remove_stale_entries(cache_dir, name, entry_path):
+    """
+    Remove the cache entries of a CSV file other than its current entry, e.g. those of its earlier contents.
+
+    Entries still memory-mapped by a reader stay readable until they are unmapped. Temporary directories of entries
+    being written are left alone.
+
+    Parameters:
+    cache_dir (str): The directory of the cache.
+    name (str): The name of the cached CSV file, the prefix of its entries.
+    entry_path (str): The current entry, which is kept.
+    """
+    prefix = name + '-'
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if entry.startswith(prefix) and len(entry) == len(prefix) + 16 and path != entry_path and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def read_csv_cached(path, transform=None, cache_key='', cache_dir=None):
+    """
+    Read a CSV file through a typed columnar cache.
+
+    The first load parses the CSV (and applies `transform`), then saves the result as memory-mappable NumPy column
+    files. Later loads read the column files instead of parsing and inferring types again. The cache is keyed by the
+    absolute path and the content of the CSV: a changed modification time or size invalidates the cache, unless the
+    content hash shows the file did not actually change (e.g. after a fresh checkout).
+
+    Parameters:
+    path (str): The CSV file to read.
+    transform (callable, optional): Applied to the parsed DataFrame before it is cached, e.g. to parse dates.
+    cache_key (str, optional): Identifies `transform`. Change it whenever `transform` changes to invalidate the cache.
+    cache_dir (str, optional): The directory of the cache. Defaults to `CACHE_DIR`.
+
+    Returns:
+    pd.DataFrame: The (transformed) content of the CSV file.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    # Files with the same name in different directories (e.g. one per project) must not share entries
+    absolute_path = os.path.abspath(path)
+    name = '{}-{}'.format(os.path.basename(path), hashlib.sha256(absolute_path.encode('utf-8')).hexdigest()[:12])
+    stat = os.stat(path)
+
+    # The index remembers which content hash the file had at a given modification time and size
+    index_path = os.path.join(cache_dir, name + '.json')
+    try:
+        with open(index_path) as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        index = {}
+
+    if index.get('mtime_ns') == stat.st_mtime_ns and index.get('size') == stat.st_size:
+        source_digest = index['sha256']
+    else:
+        source_digest = file_digest(path)
+
+    entry_digest = hashlib.sha256('{}:{}:{}'.format(CACHE_FORMAT, source_digest, cache_key).encode('utf-8')).hexdigest()
+    entry_path = os.path.join(cache_dir, '{}-{}'.format(name, entry_digest[:16]))
+
+    if os.path.exists(os.path.join(entry_path, 'manifest.json')):
+        df = load_columns(entry_path)
+        cache_stats['hits'] += 1
+    else:
+        df = pd.read_csv(path)
+        if transform is not None:
+            df = transform(df)
+        cache_stats['misses'] += 1
+
+        # Write the entry into a temporary directory first, so readers never see a partial entry
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary_path = tempfile.mkdtemp(prefix=name + '.', dir=cache_dir)
+        try:
+            save_columns(df, temporary_path)
+            os.rename(temporary_path, entry_path)
+        except OSError:
+            # Another process published the same entry first
+            shutil.rmtree(temporary_path, ignore_errors=True)
+        else:
+            remove_stale_entries(cache_dir, name, entry_path)
+
+    # Remember the content hash for the current modification time and size
+    new_index = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': source_digest}
+    if index != new_index:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=cache_dir, delete=False) as index_file:
+            json.dump(new_index, index_file)
+        os.replace(index_file.name, index_path)
+
+    return df
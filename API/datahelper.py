@@ -1,27 +1,455 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
 import pandas as pd
 
-# Read the tracking issue CSV file located in data folder
-avro_issues = pd.read_csv('../data/avro-issues.csv')
+from csvcache import read_csv_cached
+from preprocessing import parse_datetime_columns
+
+# The data folder, resolved relative to this file so the API does not depend on the working directory
+DATA_DIR = os.environ.get('JIRA_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+
+AVRO_ISSUES_PATH = os.path.join(DATA_DIR, 'avro-issues.csv')
+AVRO_TRANSITIONS_PATH = os.path.join(DATA_DIR, 'avro-transitions.csv')
+AVRO_DAYCOUNTS_PATH = os.path.join(DATA_DIR, 'avro-daycounts.csv')
+
+# The CSV files of issues that are served, separated by os.pathsep (e.g. one file per JIRA project)
+ISSUES_PATHS = os.environ.get('JIRA_ISSUES_PATHS', AVRO_ISSUES_PATH).split(os.pathsep)
+
+# Declared dtypes of the issues data: low-cardinality text is categorical, counts are downcast to the smallest
+# integer type that fits them, and measurements are stored as float32. The datetime columns are always parsed to
+# datetime64, and columns that are not listed (e.g. the unique 'key') are kept as they are
+ISSUES_SCHEMA = {
+    'status': 'category',
+    'priority': 'category',
+    'issue_type': 'category',
+    'reporter': 'category',
+    'assignee': 'category',
+    'project': 'category',
+    'resolution': 'category',
+    'vote_count': 'count',
+    'comment_count': 'count',
+    'watch_count': 'count',
+    'summary_length': 'count',
+    'description_length': 'float32',
+    'days_in_current_status': 'float32',
+}
+
+
+def apply_schema(df, schema=ISSUES_SCHEMA):
+    """
+    Convert the columns of a DataFrame to the dtypes declared in a schema, and parse its datetime columns.
+
+    Parameters:
+    df (pd.DataFrame): The raw data, e.g. as read from the CSV file.
+    schema (dict, optional): The declared dtype of every column: 'category', 'count' for integers that are downcast
+                             to the smallest type that fits them, or any other NumPy/pandas dtype.
+
+    Returns:
+    pd.DataFrame: `df` itself if all its columns already have the declared dtypes, otherwise a converted copy.
+
+    Raises:
+    ValueError: If a value cannot be converted to the declared dtype of its column.
+    """
+    df = parse_datetime_columns(df)
+
+    columns = {}
+    for col, dtype in schema.items():
+        if col not in df:
+            continue
+        try:
+            if dtype == 'count':
+                # Counts with missing values stay floats
+                values = pd.to_numeric(df[col], downcast='integer')
+            else:
+                values = df[col].astype(dtype)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid value of "{}", expected {}'.format(col, 'a number' if dtype == 'count' else dtype))
+        if values.dtype != df[col].dtype:
+            columns[col] = values
+
+    return df.assign(**columns) if columns else df
+
+
+class IssueStore:
+    """
+    The issues data together with a hash index from issue key to row position.
+
+    The index is built once when the data is loaded, so checking whether an issue exists and fetching its row are
+    dictionary lookups instead of scanning the whole DataFrame. The DataFrame always has a RangeIndex, so the
+    position of an issue is also its index label.
+
+    Updates never modify the published data: `upsert` builds the new DataFrame and index on the side and publishes
+    them, together with a new version, with a single reference assignment.
+
+    The datetime columns are parsed once when issues enter the store, so predictions never parse them again, and the
+    other columns are converted to the dtypes of the schema (if one is given).
+
+    Parameters:
+    issues (pd.DataFrame): The issues data, with a unique 'key' column.
+    version (str): Identifies the data, so results computed from it can tell when they are stale.
+    schema (dict, optional): The declared dtypes of the columns, see `apply_schema`.
+    """
+
+    def __init__(self, issues, version, schema=None):
+        self.schema = schema or {}
+        issues = apply_schema(issues.reset_index(drop=True), self.schema)
+        positions = dict(zip(issues['key'], range(len(issues))))
+        self._state = (issues, positions, version)
+        # Serializes updates with each other; readers never take this lock
+        self._write_lock = threading.Lock()
+
+    @property
+    def issues(self):
+        """The DataFrame holding all the issues."""
+        return self._state[0]
+
+    @property
+    def version(self):
+        """The version of the data, changes on every update."""
+        return self._state[2]
+
+    def __contains__(self, key):
+        return key in self._state[1]
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def position(self, key):
+        """Return the row position of an issue, or None if the issue does not exist."""
+        return self._state[1].get(key)
+
+    def get(self, key):
+        """
+        Return the row of an issue.
+
+        Parameters:
+        key (str): The key of the issue, e.g. 'AVRO-2171'.
+
+        Returns:
+        pd.DataFrame: A DataFrame with the row of the issue, empty if the issue does not exist.
+        """
+        issues, positions, _ = self._state
+        position = positions.get(key)
+        return issues.iloc[[] if position is None else [position]]
+
+    def take(self, keys):
+        """
+        Return the rows of several issues, in the order of `keys`. Keys that do not exist are skipped.
+
+        Parameters:
+        keys (iterable of str): The keys of the issues.
+
+        Returns:
+        pd.DataFrame: A DataFrame with the rows of the issues that exist.
+        """
+        issues, positions, _ = self._state
+        return issues.iloc[[positions[key] for key in keys if key in positions]]
+
+    def upsert(self, rows):
+        """
+        Insert new issues and replace existing ones, keeping the index in sync.
+
+        Existing issues keep their row position, new issues are appended at the end.
+
+        Parameters:
+        rows (pd.DataFrame): The issues to insert or replace, with the same columns as the stored issues.
+
+        Returns:
+        str: The new version of the data.
+
+        Raises:
+        ValueError: If a value of `rows` cannot be converted to the declared dtype of its column.
+        """
+        with self._write_lock:
+            return self.publish(self.prepare_upsert(rows))
+
+    def prepare_upsert(self, rows):
+        """
+        Build the data, index and version of an upsert on the side, without publishing them.
+
+        The cost is one copy of every stored column (see `upsert_column`): the stored values are never converted or
+        encoded again.
+
+        Callers that publish the result with `publish` must hold the write lock between the two calls (see `upsert`),
+        so no other update is published in between.
+
+        Returns:
+        tuple: The new state, see `publish`.
+
+        Raises:
+        ValueError: If a value of `rows` cannot be converted to the declared dtype of its column.
+        """
+        issues, positions, version = self._state
+        rows = apply_schema(rows.drop_duplicates('key', keep='last').reindex(columns=issues.columns), self.schema)
+
+        # Existing issues are replaced in place, new issues get the next free positions
+        new_positions = dict(positions)
+        row_positions = []
+        for key in rows['key']:
+            if key not in new_positions:
+                new_positions[key] = len(new_positions)
+            row_positions.append(new_positions[key])
+        rows.index = row_positions
+
+        # The new version hashes the upserted rows into the previous version, so it only depends on the content:
+        # processes that applied the same upserts (e.g. the workers of a pre-forking server) agree on it, and
+        # processes holding different data never share a version, or the responses cached under it
+        digest = hashlib.sha256(version.encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(rows).values.tobytes())
+        new_version = '{}+{}'.format(version.split('+')[0], digest.hexdigest()[:16])
+
+        if issues.empty:
+            return rows, new_positions, new_version
+
+        # Every column is copied once, with the new issues appended and the replaced issues overwritten in place
+        is_new = rows.index >= len(issues)
+        replaced = rows.index[~is_new]
+        columns = {col: upsert_column(issues[col], rows[col], replaced, is_new) for col in issues.columns}
+        new_issues = pd.DataFrame(columns, index=pd.RangeIndex(len(new_positions)))
+        return new_issues, new_positions, new_version
+
+    def publish(self, state):
+        """
+        Publish a state built by `prepare_upsert`: the data, index and version together.
+
+        Returns:
+        str: The new version of the data.
+        """
+        self._state = state
+        return state[2]
+
+
+def upsert_column(stored, values, replaced, is_new):
+    """
+    Return a copy of a stored column with some values replaced and new values appended.
+
+    A categorical column keeps its codes, new categories are appended to its categories. Other columns are widened
+    to the common dtype of both (e.g. int8 counts to int16, or to float64 for missing values).
+
+    Parameters:
+    stored (pd.Series): The stored column, with a RangeIndex.
+    values (pd.Series): The upserted values, indexed by their positions in the new column.
+    replaced (np.ndarray): The positions of the replaced values, those of `values` where `is_new` is False.
+    is_new (np.ndarray): Whether every value of `values` is appended rather than replacing a stored value.
+
+    Returns:
+    np.ndarray or pd.Categorical: The new column.
+    """
+    if isinstance(stored.dtype, pd.CategoricalDtype):
+        categories = stored.cat.categories
+        new_values = pd.unique(values.dropna().to_numpy(dtype=object))
+        new_categories = new_values[categories.get_indexer(new_values) < 0]
+        if len(new_categories):
+            categories = categories.append(pd.Index(new_categories, dtype=object))
+        dtype = pd.CategoricalDtype(categories, ordered=stored.cat.ordered)
+        value_codes = pd.Categorical(values, dtype=dtype).codes
+
+        codes = np.concatenate([stored.cat.codes.to_numpy(), value_codes[is_new]])
+        codes[replaced] = value_codes[~is_new]
+        return pd.Categorical.from_codes(codes, dtype=dtype)
+
+    try:
+        dtype = np.result_type(stored.dtype, values.dtype)
+    except TypeError:
+        # e.g. datetimes and numbers, or a categorical upserted into a column without a schema
+        dtype = object
+    new_column = np.concatenate([stored.to_numpy(dtype=dtype), values.to_numpy(dtype=dtype)[is_new]])
+    new_column[replaced] = values.to_numpy(dtype=dtype)[~is_new]
+    return new_column
+
+
+def project_of(key):
+    """Return the project of an issue key, its prefix before the last dash (e.g. 'AVRO' for 'AVRO-2171')."""
+    return key.rsplit('-', 1)[0]
+
+
+class ShardedIssueStore:
+    """
+    The issues data partitioned by project, one `IssueStore` (shard) per issue key prefix.
+
+    Looking up an issue only touches the shard of its project, and an update only rebuilds the shards of the issues
+    it changes. Issues of a project that was not seen before get a new shard. The shards are published with a single
+    reference assignment, like the data of an `IssueStore`.
+
+    The version of every shard is the version of the data followed by its project, and the version of the store
+    joins the versions of its shards, so it changes whenever any shard changes.
+
+    Parameters:
+    issues (pd.DataFrame): The issues data of all projects, with a unique 'key' column.
+    version (str): Identifies the data, see `IssueStore`.
+    schema (dict, optional): The declared dtypes of the columns, see `apply_schema`.
+    """
+
+    def __init__(self, issues, version, schema=None):
+        self.schema = schema or {}
+        self.base_version = version
+        self.columns = issues.columns
+        projects = issues['key'].map(project_of)
+        self._shards = {
+            project: IssueStore(shard, '{}/{}'.format(version, project), schema)
+            for project, shard in issues.groupby(projects, sort=True)
+        }
+        self._issues = None
+        # Serializes updates with each other; readers never take this lock
+        self._write_lock = threading.Lock()
+
+    @property
+    def projects(self):
+        """The projects of the shards, sorted."""
+        return sorted(self._shards)
+
+    def shard(self, project):
+        """Return the store of a project, or None if the project has no issues."""
+        return self._shards.get(project)
+
+    @property
+    def version(self):
+        """The version of the data, changes whenever any shard changes."""
+        shards = self._shards
+        return '; '.join(shards[project].version for project in sorted(shards))
+
+    @property
+    def issues(self):
+        """
+        The DataFrame holding the issues of all projects, concatenated on first use after a change.
+
+        Serving reads the shards instead, this is for consumers of the whole data (e.g. fitting the encoder).
+        """
+        version = self.version
+        cached = self._issues
+        if cached is None or cached[0] != version:
+            shards = self._shards
+            issues = pd.concat([shards[project].issues for project in sorted(shards)], ignore_index=True)
+            cached = (version, apply_schema(issues, self.schema))
+            self._issues = cached
+        return cached[1]
+
+    def __contains__(self, key):
+        shard = self._shards.get(project_of(key))
+        return shard is not None and key in shard
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards.values())
+
+    def get(self, key):
+        """
+        Return the row of an issue from the shard of its project.
+
+        Returns:
+        pd.DataFrame: A DataFrame with the row of the issue, empty if the issue does not exist.
+        """
+        shard = self._shards.get(project_of(key))
+        if shard is None:
+            return pd.DataFrame(columns=self.columns)
+        return shard.get(key)
+
+    def take(self, keys):
+        """
+        Return the rows of several issues, grouped by project. Keys that do not exist are skipped.
+
+        Every row is indexed by its position in the shard of its project, see `IssueStore.take`.
+        """
+        keys_by_project = {}
+        for key in keys:
+            keys_by_project.setdefault(project_of(key), []).append(key)
+
+        shards = self._shards
+        rows = [shards[project].take(project_keys) for project, project_keys in keys_by_project.items()
+                if project in shards]
+        return pd.concat(rows) if rows else pd.DataFrame(columns=self.columns)
+
+    def upsert(self, rows):
+        """
+        Insert new issues and replace existing ones in the shards of their projects.
+
+        Returns:
+        str: The new version of the data.
+        """
+        with self._write_lock:
+            # Every shard is prepared before any is published, so an invalid row leaves all the shards unchanged
+            shards = dict(self._shards)
+            states = []
+            for project, project_rows in rows.groupby(rows['key'].map(project_of), sort=False):
+                if project not in shards:
+                    # A new project starts empty, so its version is derived from the upserted rows like any other
+                    shards[project] = IssueStore(pd.DataFrame(columns=self.columns),
+                                                 '{}/{}'.format(self.base_version, project), self.schema)
+                states.append((shards[project], shards[project].prepare_upsert(project_rows)))
+
+            for shard, state in states:
+                shard.publish(state)
+            # Publish the shards of new projects
+            self._shards = shards
+            return self.version
+
+
+def load_issue_store(paths=None):
+    # Read the tracking issue CSV files through the columnar cache, already converted to the declared schema,
+    # identify them by their modification times and sizes, and partition the issues by project
+    paths = paths or ISSUES_PATHS
+    frames, versions = [], []
+    for path in paths:
+        frames.append(read_csv_cached(path, apply_schema, 'issues-schema-1'))
+        stat = os.stat(path)
+        versions.append('{}:{}:{}'.format(os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+
+    issues = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return ShardedIssueStore(issues, ','.join(versions), ISSUES_SCHEMA)
+
+
+def load_transitions(path=AVRO_TRANSITIONS_PATH):
+    # Read the issue status transitions CSV file through the columnar cache
+    return read_csv_cached(path)
+
+
+def load_daycounts(path=AVRO_DAYCOUNTS_PATH):
+    # Read the daily issue counts per status CSV file through the columnar cache
+    return read_csv_cached(path)
+
+
+# Read the tracking issue CSV files located in data folder, partitioned by project
+issue_store = load_issue_store()
+
+
+# Read the issue status transitions CSV file located in data folder
+transitions = load_transitions()
+
+
+def get_issue_store():
+    return issue_store
+
+
+def get_transitions():
+    return transitions
 
 
 def get_issue_by_key(issue_key):
-    # Get the issue key from the non resolved data (csv)
-    issue = avro_issues[avro_issues['key'] == issue_key]
-    return issue
+    # Get the issue from the index instead of scanning the data (empty if the key does not exist)
+    return issue_store.get(issue_key)
 
 
 def get_avro_issues_data():
-    return avro_issues
+    return issue_store.issues
+
+
+def get_data_version():
+    return issue_store.version
 
 
 def get_issues_till_date(df, date):
+    # Unresolved issues whose predicted resolution date is on or before the date (the API serves this from the
+    # prediction snapshot's ResolutionDateIndex instead)
     unresolved_issues = df[~df['status'].isin(['Resolved', 'Closed'])]
 
-    unresolved_issues_copy = unresolved_issues.copy()
-    unresolved_issues_copy.loc[:, 'created'] = pd.to_datetime(unresolved_issues_copy['created'])
+    resolution_dates = pd.to_datetime(unresolved_issues['resolutiondate'])
 
-    date_cutoff = pd.to_datetime(date)
-    filtered_df = unresolved_issues_copy[unresolved_issues_copy['created'] <= date_cutoff]
+    date_cutoff = pd.Timestamp(date)
+    if date_cutoff.tzinfo is not None:
+        date_cutoff = date_cutoff.tz_convert('UTC').tz_localize(None)
+    filtered_df = unresolved_issues[resolution_dates <= date_cutoff]
     return filtered_df
 
 
@@ -0,0 +1,81 @@
+import zlib
+
+import pandas as pd
+
+from preprocessing import format_datetime_columns
+
+# Supported export formats and their content types
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def serialize_chunk(chunk, export_format, header=False):
+    """
+    Serialize a chunk of the predictions DataFrame.
+
+    Parameters:
+    chunk (pd.DataFrame): The rows to serialize.
+    export_format (str): 'ndjson' for one JSON object per line, or 'csv'.
+    header (bool, optional): Whether to write the CSV header line.
+
+    Returns:
+    str: The serialized rows, ending with a newline.
+    """
+    # Datetimes are formatted as 'YYYY-MM-DD HH:MM:SS' one chunk at a time
+    chunk = format_datetime_columns(chunk)
+
+    # Durations are exported as fractional days instead of pandas' timedelta representations
+    if 'days_since_created' in chunk and pd.api.types.is_timedelta64_dtype(chunk['days_since_created']):
+        chunk = chunk.assign(days_since_created=chunk['days_since_created'].dt.total_seconds() / (24 * 60 * 60))
+
+    if export_format == 'ndjson':
+        return chunk.to_json(orient='records', lines=True).rstrip('\n') + '\n'
+    return chunk.to_csv(index=False, header=header)
+
+
+def iter_export(predictions, export_format='ndjson', chunk_size=1000):
+    """
+    Serialize the predictions DataFrame chunk by chunk.
+
+    Only one chunk is serialized at a time, so the memory used by an export does not grow with the number of issues.
+
+    Parameters:
+    predictions (pd.DataFrame): The DataFrame returned by `predict_resolution_frame` or `predict_resolution_date`.
+    export_format (str, optional): One of `EXPORT_FORMATS`.
+    chunk_size (int, optional): The number of rows serialized at a time.
+
+    Yields:
+    bytes: The serialized rows.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError('Unsupported export format: {}'.format(export_format))
+
+    for start in range(0, len(predictions), chunk_size):
+        chunk = predictions.iloc[start:start + chunk_size]
+        yield serialize_chunk(chunk, export_format, header=start == 0).encode('utf-8')
+
+    # An empty CSV export still has its header line
+    if export_format == 'csv' and len(predictions) == 0:
+        yield predictions.to_csv(index=False).encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """
+    Compress a stream of byte chunks into a single gzip stream, chunk by chunk.
+
+    Parameters:
+    chunks (iterable of bytes): The data to compress.
+    level (int, optional): The compression level, from 1 (fastest) to 9 (smallest).
+
+    Yields:
+    bytes: The compressed data.
+    """
+    # wbits=31 writes the gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
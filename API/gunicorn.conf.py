@@ -0,0 +1,36 @@
+# Production serving configuration: `gunicorn -c gunicorn.conf.py` from the API directory
+#
+# The app (issue store, model, feature encoder and prediction snapshot) is loaded once in the
+# master process and the workers are forked from it, so they share those pages copy-on-write
+# instead of each loading and holding their own copy.
+import gc
+import multiprocessing
+import os
+
+# The background threads are started in every worker after the fork, see post_fork
+os.environ.setdefault('JIRA_DEFER_BACKGROUND_TASKS', '1')
+
+wsgi_app = 'app:app'
+bind = os.environ.get('JIRA_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('JIRA_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('JIRA_THREADS', 1))
+timeout = int(os.environ.get('JIRA_WORKER_TIMEOUT', 60))
+
+# Load the app in the master before forking the workers
+preload_app = True
+
+
+def when_ready(server):
+    # Move everything loaded so far to a permanent generation the garbage collector never visits,
+    # otherwise its passes over the shared objects would write to (and so copy) their pages in every worker
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import app
+
+    # The snapshot builder and model watcher threads of the master did not survive the fork.
+    # A model reloaded through the admin route only changes the worker that served the request,
+    # the watcher (JIRA_MODEL_WATCH_INTERVAL) makes every worker pick up a new artifact
+    app.start_background_tasks()
@@ -0,0 +1,199 @@
+import io
+import json
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from datahelper import apply_schema
+from preprocessing import parse_datetime_columns
+
+
+logger = logging.getLogger(__name__)
+
+
+# Fields every ingested issue needs: its key, and the status and creation date the predictions are made from
+REQUIRED_FIELDS = ['key', 'status', 'created']
+
+
+def records_to_frame(records):
+    """
+    Convert issues received as JSON objects to a DataFrame of raw issues.
+
+    Parameters:
+    records (list of dict): The issues, with the columns of 'avro-issues.csv' as fields. Every issue needs a 'key',
+                            a 'status' and a 'created' date.
+
+    Returns:
+    pd.DataFrame: The issues, one row per record, with parsed datetime columns.
+
+    Raises:
+    ValueError: If an issue is not a JSON object, misses a required field or has an invalid date.
+    """
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError('Every issue must be a JSON object')
+        for field in REQUIRED_FIELDS:
+            if not isinstance(record.get(field), str) or not record[field]:
+                raise ValueError('Every issue must have a "{}"'.format(field))
+    return validate_issues(pd.DataFrame.from_records(records))
+
+
+def validate_issues(issues):
+    """
+    Check that raw issues have the required columns, parse their datetime columns and convert the other columns to
+    the dtypes of `datahelper.ISSUES_SCHEMA`, so invalid issues are rejected before they reach the store.
+
+    Parameters:
+    issues (pd.DataFrame): The raw issues, e.g. as read from a CSV file.
+
+    Returns:
+    pd.DataFrame: The issues with parsed datetime columns and the declared dtypes.
+
+    Raises:
+    ValueError: If a required column is missing or empty, a date is invalid or a value has the wrong type.
+    """
+    for field in REQUIRED_FIELDS:
+        if field not in issues or issues[field].isna().any():
+            raise ValueError('Every issue must have a "{}"'.format(field))
+
+    try:
+        issues = parse_datetime_columns(issues)
+    except (ValueError, OverflowError):
+        raise ValueError('Invalid date, expected ISO-8601')
+    if issues['created'].isna().any():
+        raise ValueError('Every issue must have a "created"')
+    return apply_schema(issues)
+
+
+class IssueIngestor:
+    """
+    Applies new and updated issues to the issue store and re-scores only those issues.
+
+    The cost of an ingest grows with the number of ingested issues: the store and the prediction snapshot carry the
+    other issues over instead of encoding and predicting them again.
+
+    Parameters:
+    store (IssueStore): The store the issues are upserted into.
+    snapshots (SnapshotManager): The snapshots that are updated with the predictions of the ingested issues.
+    """
+
+    def __init__(self, store, snapshots):
+        self.store = store
+        self.snapshots = snapshots
+        # Serializes ingests, so the snapshot is updated in the order the store was
+        self._lock = threading.Lock()
+
+    def ingest(self, issues):
+        """
+        Upsert issues into the store and publish their new predictions.
+
+        Parameters:
+        issues (pd.DataFrame): The raw issues, see `records_to_frame`.
+
+        Returns:
+        dict: The new data version and the numbers of inserted and updated issues.
+        """
+        keys = list(dict.fromkeys(issues['key']))
+        if not keys:
+            return {'data_version': self.store.version, 'inserted': 0, 'updated': 0}
+
+        with self._lock:
+            updated = sum(1 for key in keys if key in self.store)
+            data_version = self.store.upsert(issues)
+            # The changed rows, indexed by their position in the store
+            self.snapshots.update(self.store.take(keys), data_version)
+
+        logger.info('Ingested %d issues (%d updated), data version %s', len(keys), updated, data_version)
+        return {'data_version': data_version, 'inserted': len(keys) - updated, 'updated': updated}
+
+
+class IssueFileTailer:
+    """
+    Follows a file that issues are appended to, and ingests the new issues.
+
+    The file is either newline delimited JSON (one issue per line), or CSV with the header of 'avro-issues.csv' as
+    its first line. Only complete lines are read, and a file that shrank (e.g. it was rotated) is read again from
+    the start.
+
+    Parameters:
+    path (str): The file to follow.
+    ingestor (IssueIngestor): Ingests the issues that are read.
+    """
+
+    def __init__(self, path, ingestor):
+        self.path = path
+        self.ingestor = ingestor
+        self.offset = 0
+        self.header = None
+        self._worker = None
+        self._stop = threading.Event()
+
+    def poll(self):
+        """
+        Ingest the issues appended to the file since the last poll.
+
+        Returns:
+        int: The number of issues ingested.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0
+        if size < self.offset:
+            self.offset = 0
+            self.header = None
+
+        with open(self.path, 'rb') as tailed_file:
+            tailed_file.seek(self.offset)
+            data = tailed_file.read()
+
+        # A partially written last line is read again on the next poll
+        complete = data[:data.rfind(b'\n') + 1]
+        self.offset += len(complete)
+        lines = complete.decode('utf-8').splitlines()
+
+        if self.path.endswith('.csv'):
+            if self.header is None and lines:
+                self.header, lines = lines[0], lines[1:]
+            lines = [line for line in lines if line.strip()]
+            if not lines:
+                return 0
+            issues = validate_issues(pd.read_csv(io.StringIO('\n'.join([self.header] + lines))))
+        else:
+            records = [json.loads(line) for line in lines if line.strip()]
+            if not records:
+                return 0
+            issues = records_to_frame(records)
+
+        self.ingestor.ingest(issues)
+        return len(issues)
+
+    def start(self, interval=1.0):
+        """
+        Start a daemon thread that polls the file every `interval` seconds.
+
+        A failed poll (e.g. a malformed line) is logged, and the lines it read are skipped.
+        """
+        if self._worker is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception('Failed to ingest issues from %s', self.path)
+
+        self._stop.clear()
+        self._worker = threading.Thread(target=run, name='issue-file-tailer', daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Stop the thread started by `start`."""
+        if self._worker is None:
+            return
+        self._stop.set()
+        self._worker.join()
+        self._worker = None
@@ -0,0 +1,294 @@
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+
+# Requests of the default mix: name, relative weight, path template and expected status code.
+# '{key}' is replaced by a random existing issue key, '{date}' by a random release date and '{limit}' by the page size
+DEFAULT_MIX = [
+    ('resolve-fake3', 1, '/api/issue/{key}/resolve-fake3', 200),
+    ('resolve-prediction', 4, '/api/issue/{key}/resolve-prediction', 200),
+    ('resolve-prediction-missing', 1, '/api/issue/MISSING-{number}/resolve-prediction', 404),
+    ('resolved-since-now', 2, '/api/release/{date}/resolved-since-now?limit={limit}', 200),
+]
+
+# Percentiles reported for every route
+PERCENTILES = (50, 95, 99)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Handles requests without logging every one of them, which would dominate the measured latencies."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class LocalServer:
+    """
+    Serves a WSGI app over HTTP on the loopback interface, from a background thread of the current process.
+
+    Parameters:
+    app: The WSGI app, e.g. the Flask app of `app.py`.
+    host (str, optional): The address to listen on.
+    port (int, optional): The port to listen on, 0 picks a free port.
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=0):
+        self.server = make_server(host, port, app, threaded=True, request_handler=QuietRequestHandler)
+        self.url = 'http://{}:{}'.format(host, self.server.server_port)
+        self._thread = threading.Thread(target=self.server.serve_forever, name='loadtest-server', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self._thread.join()
+
+
+def parse_mix(text):
+    """
+    Parse a request mix such as 'resolve-prediction=4,resolved-since-now=1' (route and relative weight).
+
+    The routes are those of `DEFAULT_MIX`, routes that are not listed are not requested.
+
+    Raises:
+    ValueError: If the mix is malformed, names an unknown route or has no positive weight.
+    """
+    routes = {entry[0]: entry for entry in DEFAULT_MIX}
+    mix = []
+    for part in text.split(','):
+        route, _, weight = part.strip().partition('=')
+        if route not in routes:
+            raise ValueError('Unknown route in the request mix: {}'.format(route))
+        weight = float(weight)
+        if not weight >= 0:
+            raise ValueError('Invalid weight in the request mix: {}'.format(part))
+        name, _, template, expected_status = routes[route]
+        mix.append((name, weight, template, expected_status))
+    if not any(weight > 0 for _, weight, _, _ in mix):
+        raise ValueError('The request mix has no positive weight: {}'.format(text))
+    return mix
+
+
+def build_plan(n_requests, keys, dates, mix=DEFAULT_MIX, seed=0, page_size=100):
+    """
+    Draw the requests of a load test from a weighted mix.
+
+    Parameters:
+    n_requests (int): The number of requests.
+    keys (list of str): The existing issue keys to request.
+    dates (list of str): The release dates to query.
+    mix (list of tuple, optional): The name, weight, path template and expected status of every kind of request.
+    seed (int, optional): The seed of the random generator, the same seed always draws the same plan.
+    page_size (int, optional): The number of issues per page of the listings.
+
+    Returns:
+    list of tuple: The name, path and expected status of every request.
+    """
+    generator = random.Random(seed)
+    weights = [weight for _, weight, _, _ in mix]
+
+    plan = []
+    for name, _, template, expected_status in generator.choices(mix, weights, k=n_requests):
+        path = template.format(key=generator.choice(keys), date=generator.choice(dates),
+                               number=generator.randrange(10 ** 6), limit=page_size)
+        plan.append((name, path, expected_status))
+    return plan
+
+
+def run_load(url, plan, rate=None, concurrency=8, timeout=30.0):
+    """
+    Send the planned requests to a server and measure their latencies.
+
+    With a target rate the requests are sent open-loop: request i is due `i / rate` seconds after the start,
+    whether or not earlier requests have completed, and its latency is measured from that due time. A server that
+    falls behind therefore shows up as growing latencies instead of a silently lower request rate. Without a rate,
+    every worker sends its next request as soon as the previous one completed.
+
+    Parameters:
+    url (str): The base URL of the server, e.g. 'http://127.0.0.1:5000'.
+    plan (list of tuple): The requests to send, see `build_plan`.
+    rate (float, optional): The target number of requests per second.
+    concurrency (int, optional): The number of connections sending requests in parallel.
+    timeout (float, optional): The timeout of every request in seconds.
+
+    Returns:
+    tuple: The (name, status, expected status, latency in seconds) of every request, and the elapsed seconds.
+    """
+    parts = urlsplit(url)
+    samples = []
+    samples_lock = threading.Lock()
+    next_position = [0]
+    position_lock = threading.Lock()
+    started_at = time.perf_counter()
+
+    def worker():
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+        while True:
+            with position_lock:
+                position = next_position[0]
+                next_position[0] += 1
+            if position >= len(plan):
+                break
+            name, path, expected_status = plan[position]
+
+            if rate:
+                due_at = started_at + position / rate
+                delay = due_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                due_at = time.perf_counter()
+
+            try:
+                connection.request('GET', parts.path.rstrip('/') + path)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                # Count the failure and reconnect for the next request
+                status = None
+                connection.close()
+                connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+
+            latency = time.perf_counter() - due_at
+            with samples_lock:
+                samples.append((name, status, expected_status, latency))
+        connection.close()
+
+    threads = [threading.Thread(target=worker, name='loadtest-client-{}'.format(number))
+               for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return samples, time.perf_counter() - started_at
+
+
+def summarize(samples, elapsed):
+    """
+    Summarize the latencies and throughput of a load test per route.
+
+    Returns:
+    dict: Per route (and for 'all' routes): the number of requests, the number of errors (unexpected status or
+          failed request), the throughput in requests per second and the latency percentiles in milliseconds.
+    """
+    routes = sorted(set(name for name, _, _, _ in samples))
+
+    summary = {}
+    for route in routes + ['all']:
+        selected = [sample for sample in samples if route == 'all' or sample[0] == route]
+        latencies = np.array([latency for _, _, _, latency in selected]) * 1000
+        summary[route] = {
+            'requests': len(selected),
+            'errors': sum(1 for _, status, expected_status, _ in selected if status != expected_status),
+            'throughput': len(selected) / elapsed if elapsed > 0 else 0.0,
+            'max_ms': float(latencies.max()),
+        }
+        for percentile in PERCENTILES:
+            summary[route]['p{}_ms'.format(percentile)] = float(np.percentile(latencies, percentile))
+    return summary
+
+
+def parse_budget(text):
+    """
+    Parse a latency budget such as 'resolve-prediction:p99=50' (route, percentile, milliseconds).
+
+    Raises:
+    ValueError: If the budget is malformed.
+    """
+    route, _, limit = text.partition(':')
+    statistic, _, milliseconds = limit.partition('=')
+    if not route or statistic not in ['p{}'.format(percentile) for percentile in PERCENTILES] + ['max']:
+        raise ValueError('Invalid latency budget: {}'.format(text))
+    return route, statistic + '_ms', float(milliseconds)
+
+
+def check_budgets(summary, budgets):
+    """
+    Check a load test summary against latency budgets, and against errors.
+
+    Parameters:
+    summary (dict): The result of `summarize`.
+    budgets (list of tuple): The (route, statistic, milliseconds) budgets, see `parse_budget`.
+
+    Returns:
+    list of str: The violated budgets, empty if the load test passed.
+    """
+    violations = ['{}: {} requests failed'.format(route, stats['errors'])
+                  for route, stats in summary.items() if route != 'all' and stats['errors']]
+    for route, statistic, milliseconds in budgets:
+        if route not in summary:
+            violations.append('{}: no requests'.format(route))
+        elif summary[route][statistic] > milliseconds:
+            violations.append('{}: {} {:.2f} ms > {:g} ms'.format(
+                route, statistic, summary[route][statistic], milliseconds))
+    return violations
+
+
+def format_summary(summary):
+    """Format a load test summary as a table."""
+    lines = ['{:<28} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'route', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms')]
+    for route, stats in summary.items():
+        lines.append('{:<28} {:>8} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+            route, stats['requests'], stats['errors'], stats['throughput'],
+            stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['max_ms']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the API on localhost and report latency percentiles.')
+    parser.add_argument('--url', help='Base URL of a running server. By default the app is served in-process')
+    parser.add_argument('--requests', type=int, default=2000, help='Number of requests to send')
+    parser.add_argument('--rate', type=float, help='Target requests per second (as fast as possible if omitted)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Number of parallel connections')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the request mix')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Routes and relative weights such as resolve-prediction=4,resolved-since-now=1')
+    parser.add_argument('--page-size', type=int, default=100, help='Number of issues per page of the listings')
+    parser.add_argument('--budget', action='append', default=[], type=parse_budget,
+                        help='Latency budget such as resolve-prediction:p99=50 (ms), may be repeated')
+    parser.add_argument('--output', help='File the summary is written to as JSON')
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    from datahelper import get_avro_issues_data
+
+    issues = get_avro_issues_data()
+    keys = issues['key'].tolist()
+    # Release dates spread over the period the issues were created in, and a year beyond
+    dates = pd.date_range(issues['created'].min(), issues['created'].max() + pd.Timedelta(days=365), periods=50)
+    dates = dates.strftime('%Y-%m-%d').tolist()
+    plan = build_plan(args.requests, keys, dates, args.mix, seed=args.seed, page_size=args.page_size)
+
+    if args.url:
+        samples, elapsed = run_load(args.url, plan, args.rate, args.concurrency)
+    else:
+        from app import app
+
+        with LocalServer(app) as server:
+            samples, elapsed = run_load(server.url, plan, args.rate, args.concurrency)
+
+    summary = summarize(samples, elapsed)
+    print(format_summary(summary))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+
+    violations = check_budgets(summary, args.budget)
+    for violation in violations:
+        print('FAILED {}'.format(violation))
+    sys.exit(1 if violations else 0)
@@ -0,0 +1,263 @@
+import bisect
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of the latency histogram buckets, from 0.5 ms to 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(label_names, label_values, extra=''):
+    """Format label names and values as a Prometheus label set, e.g. '{route="/metrics",status="200"}'."""
+    labels = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+              for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def format_value(value):
+    """Format a sample value the way Prometheus expects it."""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    A monotonically increasing count, per combination of label values.
+
+    Parameters:
+    name (str): The metric name.
+    help (str): The description shown by Prometheus.
+    label_names (tuple of str, optional): The names of the labels the samples are split by.
+    """
+
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """Add `amount` to the count of the given label values."""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        """Return the current count of the given label values."""
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        """Return the samples in the Prometheus text format."""
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} counter'.format(self.name)]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append('{}{} {}'.format(self.name, format_labels(self.label_names, label_values), format_value(value)))
+        return lines
+
+
+class Gauge:
+    """
+    A value that is read when the metrics are scraped, e.g. the number of rows of a dataset.
+
+    Parameters:
+    name (str): The metric name.
+    help (str): The description shown by Prometheus.
+    read (callable): Returns the current value, or None when there is nothing to report.
+    metric_type (str, optional): 'gauge', or 'counter' for values that are kept elsewhere and only increase.
+    """
+
+    def __init__(self, name, help, read, metric_type='gauge'):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.metric_type = metric_type
+
+    def render(self):
+        """Return the sample in the Prometheus text format."""
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.metric_type)]
+        try:
+            value = self.read()
+        except Exception:
+            logger.exception('Failed to read gauge %s', self.name)
+            value = None
+        if value is not None:
+            lines.append('{} {}'.format(self.name, format_value(value)))
+        return lines
+
+
+class Histogram:
+    """
+    Counts observations (e.g. durations) in cumulative buckets, per combination of label values.
+
+    Parameters:
+    name (str): The metric name.
+    help (str): The description shown by Prometheus.
+    label_names (tuple of str, optional): The names of the labels the samples are split by.
+    buckets (tuple of float, optional): The sorted upper bounds of the buckets. Defaults to `LATENCY_BUCKETS`.
+    """
+
+    def __init__(self, name, help, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Per label values: the count of every bucket (plus +Inf), the sum and the count of the observations
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Record an observation for the given label values."""
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                counts = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[0][position] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def count(self, *label_values):
+        """Return the number of observations for the given label values."""
+        counts = self._values.get(label_values)
+        return counts[2] if counts is not None else 0
+
+    def render(self):
+        """Return the samples in the Prometheus text format, with cumulative bucket counts."""
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            values = sorted((label_values, [list(counts[0]), counts[1], counts[2]])
+                            for label_values, counts in self._values.items())
+
+        for label_values, (bucket_counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label_names, label_values, 'le="{}"'.format(format_value(bound)))
+                lines.append('{}_bucket{} {}'.format(self.name, labels, cumulative))
+            labels = format_labels(self.label_names, label_values)
+            lines.append('{}_sum{} {}'.format(self.name, labels, format_value(total)))
+            lines.append('{}_count{} {}'.format(self.name, labels, count))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collects the metrics of the process and renders them for Prometheus.
+
+    Metrics are kept per process: behind a pre-forking server every worker reports its own requests.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        """Add a metric to the registry and return it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class StageMetrics:
+    """
+    Records the stages reported by `preprocessing.StageTimer` as a duration histogram and a row counter.
+
+    Instances are callables that can be appended to `preprocessing.stage_hooks`.
+
+    Parameters:
+    registry (MetricsRegistry): The registry the metrics are added to.
+    """
+
+    def __init__(self, registry):
+        self.durations = registry.register(Histogram(
+            'jira_stage_duration_seconds', 'Duration of the stages of preprocessing and prediction.', ('stage',)))
+        self.rows = registry.register(Counter(
+            'jira_stage_rows_total', 'Number of rows processed by the stages of preprocessing and prediction.',
+            ('stage',)))
+
+    def __call__(self, stage, seconds, rows):
+        self.durations.observe(seconds, stage)
+        if rows is not None:
+            self.rows.inc(stage, amount=rows)
+
+
+class SlowRequestProfiler:
+    """
+    Profiles a sample of the requests with cProfile and dumps the profiles of the slow ones.
+
+    Parameters:
+    directory (str): The directory the profiles are written to, as '<time>-<route>.prof' files.
+    sample_rate (float, optional): The fraction of the requests that are profiled, between 0 and 1.
+    threshold (float, optional): Only profiles of requests that took at least this many seconds are written.
+    """
+
+    def __init__(self, directory, sample_rate=0.01, threshold=0.5):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+
+    @classmethod
+    def from_environ(cls, environ=os.environ):
+        """
+        Create a profiler from the JIRA_PROFILE_DIR, JIRA_PROFILE_SAMPLE_RATE and JIRA_PROFILE_SLOW_SECONDS
+        environment variables, or return None if JIRA_PROFILE_DIR is not set.
+        """
+        if not environ.get('JIRA_PROFILE_DIR'):
+            return None
+        return cls(environ['JIRA_PROFILE_DIR'],
+                   float(environ.get('JIRA_PROFILE_SAMPLE_RATE', 0.01)),
+                   float(environ.get('JIRA_PROFILE_SLOW_SECONDS', 0.5)))
+
+    def start(self):
+        """
+        Start profiling the current request if it is part of the sample.
+
+        Returns:
+        cProfile.Profile: The running profiler, or None if the request is not profiled.
+        """
+        if random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already running in this process
+            return None
+        return profiler
+
+    def stop(self, profiler, name, seconds):
+        """
+        Stop a profiler returned by `start`, and write its profile if the request was slow.
+
+        Returns:
+        str: The path of the written profile, or None.
+        """
+        profiler.disable()
+        if seconds < self.threshold:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        safe_name = re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_') or 'request'
+        path = os.path.join(self.directory, '{:.6f}-{}.prof'.format(time.time(), safe_name))
+        profiler.dump_stats(path)
+        logger.info('Profiled slow request %s (%.3f s) to %s', name, seconds, path)
+        return path
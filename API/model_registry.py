@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import joblib
+except ImportError:
+    from sklearn.externals import joblib
+
+from forest import FlatForest
+from preprocessing import FeatureEncoder
+
+
+logger = logging.getLogger(__name__)
+
+# Default location of the trained Random Forest Regressor, resolved relative to this file
+# so the API does not depend on the working directory it is started from. The forest exported
+# with `forest.export_forest` is preferred over the pickle, as it loads without scikit-learn.
+# Serving only avoids importing scikit-learn with such a .npz artifact: unpickling a .pkl model imports it
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'RF_regressor_model.pkl')
+MODEL_PATH = os.environ.get(
+    'JIRA_MODEL_PATH',
+    os.path.splitext(DEFAULT_MODEL_PATH)[0] + '.npz'
+    if os.path.exists(os.path.splitext(DEFAULT_MODEL_PATH)[0] + '.npz') else DEFAULT_MODEL_PATH
+)
+
+# A loaded artifact together with its feature encoder and the metadata that identifies it
+LoadedModel = namedtuple('LoadedModel', ['model', 'encoder', 'version', 'path', 'loaded_at'])
+
+
+def artifact_version(path):
+    """
+    Build a version string for a model artifact from its file name, modification time and size.
+
+    The version is stable across processes, so every worker that loaded the same file reports the same version.
+    """
+    stat = os.stat(path)
+    return '{}:{}:{}'.format(os.path.basename(path), stat.st_mtime_ns, stat.st_size)
+
+
+def load_artifact(path):
+    """
+    Load a model artifact: a forest exported by `forest.export_forest` (.npz), or a pickled scikit-learn model.
+
+    Unpickling a scikit-learn model imports scikit-learn and requires the version it was pickled with, while an
+    exported forest is plain NumPy arrays.
+    """
+    if path.endswith('.npz'):
+        return FlatForest.load(path)
+    return joblib.load(path)
+
+
+def encoder_path(path):
+    """Return the path of the feature encoder schema that is saved next to a model artifact."""
+    return os.path.splitext(path)[0] + '_encoder.json'
+
+
+class ModelRegistry:
+    """
+    Holds the regression model that is used to serve predictions.
+
+    The artifact is deserialized once with `load` and then handed out with `get`, so requests no longer pay for
+    deserialization every time. A new artifact can be swapped in with `load` (or automatically with `start_watching`)
+    while the server keeps running: the new model is fully loaded before it is published with a single reference
+    assignment, so requests that are already running keep using the model they started with and are never blocked.
+
+    If a feature encoder schema (see `encoder_path`) was saved next to the artifact, it is loaded and swapped together
+    with the model, so both always come from the same training run.
+
+    Parameters:
+    path (str, optional): The path of the artifact to load. Defaults to `MODEL_PATH`.
+    """
+
+    def __init__(self, path=MODEL_PATH):
+        self.path = path
+        self._current = None
+        # Serializes loads and swaps with each other; readers never take this lock
+        self._swap_lock = threading.Lock()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    def load(self, path=None):
+        """
+        Load a model artifact and atomically publish it as the current model.
+
+        Parameters:
+        path (str, optional): The artifact to load. Defaults to the path the registry was created with.
+                              When given, it becomes the path the registry watches from now on.
+
+        Returns:
+        LoadedModel: The newly published model and its metadata.
+        """
+        with self._swap_lock:
+            path = path or self.path
+            version = artifact_version(path)
+            model = load_artifact(path)
+            encoder = FeatureEncoder.load(encoder_path(path)) if os.path.exists(encoder_path(path)) else None
+
+            # Publish the new model with a single reference assignment
+            loaded = LoadedModel(model, encoder, version, path, time.time())
+            self._current = loaded
+            self.path = path
+
+        logger.info('Loaded model %s', version)
+        return loaded
+
+    def current(self):
+        """
+        Return the currently published model together with its metadata.
+
+        Raises:
+        RuntimeError: If no model has been loaded yet.
+        """
+        loaded = self._current
+        if loaded is None:
+            raise RuntimeError('No model has been loaded, call load() first')
+        return loaded
+
+    def get(self):
+        """Return the currently published model."""
+        return self.current().model
+
+    @property
+    def version(self):
+        """The version string of the currently published model, or None if nothing is loaded."""
+        loaded = self._current
+        return loaded.version if loaded is not None else None
+
+    def reload_if_changed(self):
+        """
+        Reload the artifact if the file on disk no longer matches the published version.
+
+        Returns:
+        bool: True if a new model was published.
+        """
+        try:
+            changed = artifact_version(self.path) != self.version
+        except OSError:
+            # The file is being replaced, try again on the next poll
+            return False
+
+        if changed:
+            self.load()
+        return changed
+
+    def start_watching(self, interval=5.0):
+        """
+        Start a daemon thread that polls the artifact and hot-swaps the model whenever the file changes.
+
+        A failed reload (e.g. a partially written file) is logged and the previous model stays in service.
+
+        Parameters:
+        interval (float, optional): The number of seconds between two polls.
+        """
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop_watching.wait(interval):
+                try:
+                    self.reload_if_changed()
+                except Exception:
+                    logger.exception('Failed to reload model from %s', self.path)
+
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=watch, name='model-registry-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        """Stop the thread started by `start_watching`."""
+        if self._watcher is None:
+            return
+        self._stop_watching.set()
+        self._watcher.join()
+        self._watcher = None
@@ -3,142 +3,347 @@
 
 # In[ ]:
 
-from sklearn.externals import joblib
+try:
+    import joblib
+except ImportError:
+    from sklearn.externals import joblib
 import pandas as pd
-from sklearn.linear_model import LinearRegression
-from preprocessing import preprocess_data
+from preprocessing import preprocess_data, parse_datetime_columns, format_datetime_columns, StageTimer, FeatureEncoder
 import numpy as np
-
-def predict_resolution_date(df_avro_issues, key=None):
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+def predict_resolution_frame(df_avro_issues, model=None, encoder=None):
     """
-    Predict the resolution date of an issue or a DataFrame of issues based on its key using a pre-trained Random Forest regression model.
+    Predict the resolution dates of a DataFrame of issues, keeping the dates as datetime64 values.
 
-    If a specific key is provided, this function returns the predicted resolution date for that specific issue.
-    If no key is provided, this function returns a DataFrame of all issues along with their predicted resolution dates.
+    This is the computation behind `predict_resolution_date`, for callers that keep working with the dates (e.g. to
+    index or filter them) and only format them when the results are serialized.
 
     Parameters:
-    df_avro_issues (pd.DataFrame): A DataFrame containing the issues data. Each row corresponds to a specific issue.
-                                   Necessary columns are 'days_since_created', 'status', and 'created'.
-    key (str, optional): The key of the issue for which the resolution date should be predicted. If not provided,
-                         the function returns the entire DataFrame with predicted resolution dates.
+    df_avro_issues (pd.DataFrame): A DataFrame containing the issues data. The datetime columns may be ISO-8601 strings
+                                   or columns that were already parsed with `preprocessing.parse_datetime_columns`.
+    model (optional): An already loaded regression model, see `predict_resolution_date`.
+    encoder (preprocessing.FeatureEncoder, optional): A fitted encoder, see `predict_resolution_date`.
 
     Returns:
-    str or pd.DataFrame: The predicted resolution date for the issue in the format 'YYYY-MM-DD HH:MM:SS', 
-                         or the entire DataFrame with predicted resolution dates if 'key' is not provided.
-
-    Notes:
-    The preprocessing of the data is done using the 'preprocess_data' function from a module named 'preprocessing'.
+    pd.DataFrame: The issues with 'created', 'updated' and 'resolutiondate' as naive UTC datetime64 columns truncated to
+                  whole seconds, where 'resolutiondate' is the predicted resolution date of the unresolved issues, and
+                  the (predicted) time to resolution as the timedelta column 'days_since_created'.
     """
-        
 
-    # To load the Random Forest Regressor model
-    loaded_model = joblib.load('../RF_regressor_model.pkl')
 
+    # Report the duration of every stage to the instrumentation hooks (see preprocessing.stage_hooks)
+    timer = StageTimer('predict', len(df_avro_issues))
 
-    # Load the new preprocessed dataset
-    filtered_preprocessed_df = preprocess_data(df_avro_issues)
+    # To load the Random Forest Regressor model, unless the caller already holds one
+    if model is None:
+        model = joblib.load('../RF_regressor_model.pkl')
+        timer.lap('load_model')
 
-    pred_preprocessed_df = filtered_preprocessed_df[filtered_preprocessed_df['status'] != 4].drop(['days_since_created', 'status'], axis=1)
 
+    # Parse the datetime columns once (nothing to do if they were already parsed when the data was loaded)
+    df_avro_issues = parse_datetime_columns(df_avro_issues)
+    timer.lap('parse_dates')
 
-    # Handling NaNs (here some NaNs may exist in the description length feature)
-    pred_preprocessed_df = pred_preprocessed_df.fillna(pred_preprocessed_df.mean())
 
+    if encoder is not None:
+        # Encode the unresolved issues, NaNs are filled with the means of the training data
+        unresolved_mask = ~df_avro_issues['status'].isin(['Resolved', 'Closed'])
+        pred_preprocessed_df = encoder.transform(df_avro_issues[unresolved_mask])
+        timer.lap('encode', len(pred_preprocessed_df))
+    else:
+        # Load the new preprocessed dataset
+        filtered_preprocessed_df = preprocess_data(df_avro_issues)
 
-    # Declare final_resolution_date_df as global
-    global final_resolution_date_df
-    
-    
-    # Predicting the results for new dataset
-    predictions = loaded_model.predict(pred_preprocessed_df)
-    
+        pred_preprocessed_df = filtered_preprocessed_df[filtered_preprocessed_df['status'] != 4].drop(['days_since_created', 'status'], axis=1)
+        timer.lap('preprocess')
 
-    # copy the raw dataset and add the predicted days_since_created for the unresolved issues
-    final_resolution_date_df = df_avro_issues.copy()
-    
-    # Add a new column to the preprocessed DataFrame with the predictions
-    pred_preprocessed_df['days_since_created'] = predictions
 
+        # Handling NaNs (here some NaNs may exist in the description length feature)
+        pred_preprocessed_df = pred_preprocessed_df.fillna(pred_preprocessed_df.mean())
+        timer.lap('fillna', len(pred_preprocessed_df))
+
+
+    # Predicting the results for new dataset (there is nothing to predict when all the issues are already resolved)
+    predictions = model.predict(pred_preprocessed_df) if len(pred_preprocessed_df) else np.empty(0)
+    timer.lap('model', len(predictions))
     
-    final_resolution_date_df = final_resolution_date_df.merge(pred_preprocessed_df[['days_since_created']], how='left', left_index=True, right_index=True)
+
+    # Add the predicted days_since_created of the unresolved issues to the raw dataset. Below, only new columns are
+    # written to and existing columns are replaced as a whole, so a shallow copy is enough and the raw dataset is
+    # neither copied nor modified
+    final_resolution_date_df = df_avro_issues.copy(deep=False)
+    final_resolution_date_df['days_since_created'] = pd.Series(predictions, index=pred_preprocessed_df.index, dtype='float64')
+    timer.lap('merge')
 
 
-    # Convert 'resolutiondate' and 'created' to datetime
-    final_resolution_date_df['resolutiondate'] = pd.to_datetime(final_resolution_date_df['resolutiondate'])
-    final_resolution_date_df['created'] = pd.to_datetime(final_resolution_date_df['created'])
+    created = final_resolution_date_df['created']
+    resolution_dates = final_resolution_date_df['resolutiondate']
 
     # Calculate the time difference in seconds for rows where 'days_since_created' is NaN
     mask = final_resolution_date_df['days_since_created'].isna()
-    time_difference = (final_resolution_date_df.loc[mask, 'resolutiondate'] - final_resolution_date_df.loc[mask, 'created']).dt.total_seconds()
+    time_difference = (resolution_dates[mask] - created[mask]).dt.total_seconds()
 
     # Convert the time difference to days with fraction
     final_resolution_date_df.loc[mask, 'days_since_created'] = (time_difference / (24 * 60 * 60)).round()
 
-    
-    
-    
-  
-    #     # Make sure 'created' is datetime and 'days_since_created' is timedelta to add them to get resolutiondate datetime
-    #     final_resolution_date_df['created'] = pd.to_datetime(final_resolution_date_df['created'])
-    #     final_resolution_date_df['days_since_created'] = pd.to_timedelta(final_resolution_date_df['days_since_created'], unit='D')
 
-    # Make sure 'created' is datetime and 'days_since_created' is timedelta to add them to get resolutiondate datetime
-    # final_resolution_date_df['created'] = pd.to_datetime(final_resolution_date_df['created'])
-    final_resolution_date_df['days_since_created'] = pd.to_timedelta(final_resolution_date_df['days_since_created'], unit='D')
+    # Convert the days to a timedelta, truncated to whole seconds
+    days_since_created = pd.to_timedelta(final_resolution_date_df['days_since_created'], unit='D')
+    final_resolution_date_df['days_since_created'] = pd.to_timedelta(np.trunc(days_since_created.dt.total_seconds()), unit='s')
 
 
-    # Convert 'created' column to string
-    final_resolution_date_df['created'] = final_resolution_date_df['created'].astype(str)
+    # Truncate the datetime columns to whole seconds (this replaces the columns, so 'resolutiondate' can be filled in below)
+    for column in ['created', 'updated', 'resolutiondate']:
+        final_resolution_date_df[column] = final_resolution_date_df[column].dt.floor('s')
 
-    # Split the string on the dot and take the first part
-    final_resolution_date_df['created'] = final_resolution_date_df['created'].str.split('.').str[0]
+    # Add the timedelta to 'created' where 'resolutiondate' is NaN
+    mask = final_resolution_date_df['resolutiondate'].isna()
+    final_resolution_date_df.loc[mask, 'resolutiondate'] = final_resolution_date_df['created'] + final_resolution_date_df['days_since_created']
+    timer.lap('resolution_dates')
 
-    # Convert the string back to datetime format
-    final_resolution_date_df['created'] = pd.to_datetime(final_resolution_date_df['created'])
 
-    final_resolution_date_df['days_since_created'] = pd.to_timedelta(
-        final_resolution_date_df['days_since_created']
-        .dt
-        .total_seconds()
-        .astype(int)
-        .astype('timedelta64[s]')
-    )
-    
-    # Convert 'resolutiondate' column to datetime
-    final_resolution_date_df['resolutiondate'] = pd.to_datetime(final_resolution_date_df['resolutiondate'])
+    return final_resolution_date_df
 
-    # Check if 'resolutiondate' is NaN
-    mask = pd.isna(final_resolution_date_df['resolutiondate'])
 
-    # Add the timedelta to 'created' and assign the result to 'resolutiondate' where 'resolutiondate' is NaN
-    final_resolution_date_df.loc[mask, 'resolutiondate'] = final_resolution_date_df['created'] + final_resolution_date_df['days_since_created']    
+def predict_resolution_date(df_avro_issues, key=None, model=None, encoder=None, position=None):
+    """
+    Predict the resolution date of an issue or a DataFrame of issues based on its key using a pre-trained Random Forest regression model.
 
+    If a specific key is provided, this function returns the predicted resolution date for that specific issue.
+    If no key is provided, this function returns a DataFrame of all issues along with their predicted resolution dates.
 
-    # Define the list of columns that contain datetime data
-    datetime_columns = ['created', 'updated', 'resolutiondate']
+    Parameters:
+    df_avro_issues (pd.DataFrame): A DataFrame containing the issues data. Each row corresponds to a specific issue.
+                                   Necessary columns are 'days_since_created', 'status', and 'created'.
+    key (str, optional): The key of the issue for which the resolution date should be predicted. If not provided,
+                         the function returns the entire DataFrame with predicted resolution dates.
+    model (optional): An already loaded regression model. If not provided, the model is loaded from
+                      '../RF_regressor_model.pkl' on every call, so long running callers should load it once
+                      (e.g. with the API's model registry) and pass it in.
+    encoder (preprocessing.FeatureEncoder, optional): A fitted encoder with the feature schema and imputation statistics
+                      of the training data. When provided, only the rows that are scored are encoded (a single row if
+                      'key' is given) instead of preprocessing the whole DataFrame. Rows are then scored independently
+                      of each other, so callers holding an index of the issues (e.g. the API's IssueStore) can pass
+                      only the rows they need instead of the whole DataFrame.
+    position (int, optional): The row position of the issue 'key' in df_avro_issues, e.g. from the API's
+                      `IssueStore.position`, so the issue is found without scanning the 'key' column. The column is
+                      scanned once if not provided.
 
-    # Convert the datetime columns to datetime format and format them as strings
-    final_resolution_date_df[datetime_columns] = final_resolution_date_df[datetime_columns].apply(
-        lambda x: x.apply(lambda y: pd.to_datetime(y).strftime('%Y-%m-%d %H:%M:%S')), axis=1
-    )
+    Returns:
+    str or pd.DataFrame: The predicted resolution date for the issue in the format 'YYYY-MM-DD HH:MM:SS', 
+                         or the entire DataFrame with predicted resolution dates if 'key' is not provided.
 
-    
-#     # add 'days_since_created' to 'created' where 'resolutiondate' is NaT
-#     final_resolution_date_df.loc[final_resolution_date_df['resolutiondate'].isna(), 'resolutiondate'] = final_resolution_date_df['created'] + final_resolution_date_df['days_since_created']
+    Raises:
+    KeyError: If 'key' is not in the DataFrame.
 
-#     # Define the list of columns that contain datetime data
-#     datetime_columns = ['created', 'updated', 'resolutiondate']
-#     # # Convert the datetime columns to datetime format and format them as strings
-#     # final_resolution_date_df[datetime_columns] = final_resolution_date_df[datetime_columns].apply(pd.to_datetime).apply(lambda x: x.dt.strftime('%Y-%m-%d %H:%M:%S'))
+    Notes:
+    The preprocessing of the data is done using the 'preprocess_data' function from a module named 'preprocessing'.
+    The predictions themselves are computed by `predict_resolution_frame`.
+    """
+
+
+    if key is not None and position is None:
+        # Without an index of the issues, find the row of the issue once
+        positions = np.flatnonzero(df_avro_issues['key'].values == key)
+        if not len(positions):
+            raise KeyError('Issue key not found: {}'.format(key))
+        position = positions[0]
 
-#     for col in datetime_columns:
-#         final_resolution_date_df[col] = pd.to_datetime(final_resolution_date_df[col])
-#         final_resolution_date_df[col] = final_resolution_date_df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    if encoder is not None and key is not None:
+        # With a fixed feature schema, only the requested issue has to be encoded
+        df_avro_issues = df_avro_issues.iloc[[position]]
+        position = 0
+
+    final_resolution_date_df = predict_resolution_frame(df_avro_issues, model=model, encoder=encoder)
+
+    # Format the datetime columns as strings (vectorized, once, right before returning them)
+    timer = StageTimer('predict', len(final_resolution_date_df))
+    final_resolution_date_df = format_datetime_columns(final_resolution_date_df)
+    timer.lap('format')
 
 
     if key is None:
         return final_resolution_date_df
     else:
-        return final_resolution_date_df.loc[final_resolution_date_df['key'] == key, 'resolutiondate'].values[0]
+        # The predictions keep the rows of the issues in their order
+        return final_resolution_date_df['resolutiondate'].iloc[position]
+    
     
-    
\ No newline at end of file
+
+# In[ ]:
+
+
+logger = logging.getLogger(__name__)
+
+# The model and encoder of a scoring worker process, set once by `_init_score_worker`
+_score_worker = {}
+
+
+def load_model(path):
+    """
+    Load a model artifact: a pickled scikit-learn model, or a forest exported with `forest.export_forest` (.npz).
+    """
+    if path.endswith('.npz'):
+        from forest import FlatForest
+        return FlatForest.load(path)
+    return joblib.load(path)
+
+
+def read_chunks(path, chunksize):
+    """
+    Read a CSV (or Parquet) file of raw issues in chunks of `chunksize` rows, so it never has to fit in memory.
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            yield chunk
+
+
+class ChunkWriter:
+    """
+    Appends scored chunks to a CSV or Parquet file (chosen by the extension), in the order they are written.
+
+    Parameters:
+    path (str): The file to write. Parquet files require the pyarrow package.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        self._started = False
+
+    def write(self, chunk):
+        """Append a chunk of scored issues to the file."""
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            elif table.schema != self._writer.schema:
+                # A column that is empty in a chunk is read as floats, cast it to the type of the first chunk
+                table = table.cast(self._writer.schema)
+            self._writer.write_table(table)
+        else:
+            chunk.to_csv(self.path, mode='a' if self._started else 'w', header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        """Finish writing the file."""
+        if self._writer is not None:
+            self._writer.close()
+        elif not self._started and not self.parquet:
+            # An empty input still produces an (empty) output file
+            open(self.path, 'w').close()
+
+
+def _init_score_worker(model_path, encoder_schema):
+    _score_worker['model'] = load_model(model_path)
+    _score_worker['encoder'] = FeatureEncoder(**encoder_schema)
+
+
+def _score_chunk(chunk):
+    return predict_resolution_date(chunk, model=_score_worker['model'], encoder=_score_worker['encoder'])
+
+
+def _score_chunks(chunks, model_path, encoder, workers):
+    """Score chunks of issues with a pool of worker processes, yielding the results in the order of the chunks."""
+    if workers == 1:
+        _init_score_worker(model_path, encoder.to_dict())
+        for chunk in chunks:
+            yield _score_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_score_worker, initargs=(model_path, encoder.to_dict())) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_score_chunk, chunk))
+            # Once enough chunks are in flight, wait for the oldest one before reading more of the input
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def score_file(input_path, output_path, model_path, encoder, chunksize=50000, workers=None):
+    """
+    Predict the resolution dates of the issues in a file too large to score in memory, and write them to a file.
+
+    The input is read in chunks of `chunksize` rows, which are scored by a pool of worker processes and written in
+    the order they were read. At most two chunks per worker are in flight, so the memory used does not grow with the
+    size of the input. The encoder gives every chunk the same feature schema and imputation values, so every row is
+    scored independently of the other rows of its chunk and the output is the same as the one of
+    `predict_resolution_date(df_avro_issues, model=model, encoder=encoder)` on the whole input.
+
+    Parameters:
+    input_path (str): The CSV (or Parquet) file of raw issues, with the columns of 'avro-issues.csv'.
+    output_path (str): The CSV or Parquet file the issues are written to, with their predicted resolution dates.
+    model_path (str): The model artifact, loaded once by every worker process.
+    encoder (preprocessing.FeatureEncoder): The fitted encoder of the model.
+    chunksize (int, optional): The number of rows scored at a time.
+    workers (int, optional): The number of worker processes, all CPUs by default. With 1 worker, the chunks are
+                             scored in the current process.
+
+    Returns:
+    dict: The number of rows scored, the elapsed seconds and the rows scored per second.
+    """
+    workers = workers or os.cpu_count() or 1
+    started_at = time.perf_counter()
+    writer = ChunkWriter(output_path)
+    rows = 0
+
+    try:
+        for scored in _score_chunks(read_chunks(input_path, chunksize), model_path, encoder, workers):
+            writer.write(scored)
+            rows += len(scored)
+            logger.info('Scored %d issues', rows)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started_at
+    return {'rows': rows, 'seconds': elapsed, 'rows_per_second': rows / elapsed if elapsed > 0 else 0.0}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Predict the resolution dates of issues.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    score_parser = subparsers.add_parser('score', help='Score a large file of issues in chunks with worker processes')
+    score_parser.add_argument('input', help='CSV (or Parquet) file of issues, with the columns of avro-issues.csv')
+    score_parser.add_argument('output', help='CSV or Parquet file the issues and their predicted resolution dates are written to')
+    score_parser.add_argument('--model', default='../RF_regressor_model.pkl', help='Model artifact (.pkl, or .npz exported with forest.py)')
+    score_parser.add_argument('--encoder', help='Encoder schema of the model (default: the _encoder.json file next to the model)')
+    score_parser.add_argument('--fit-encoder', metavar='CSV', help='Fit the encoder on the training issues in this file instead')
+    score_parser.add_argument('--chunksize', type=int, default=50000, help='Number of rows scored at a time')
+    score_parser.add_argument('--workers', type=int, help='Number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    # Fail before scoring starts rather than when the first chunk is read or written
+    if any(path.endswith('.parquet') for path in (args.input, args.output)) and importlib.util.find_spec('pyarrow') is None:
+        parser.error('Parquet files require the pyarrow package, install it or use CSV files')
+
+    if args.fit_encoder:
+        encoder = FeatureEncoder().fit(pd.read_csv(args.fit_encoder))
+    else:
+        encoder_path = args.encoder or os.path.splitext(args.model)[0] + '_encoder.json'
+        if not os.path.exists(encoder_path):
+            parser.error('No encoder schema at {}, pass --encoder or --fit-encoder'.format(encoder_path))
+        encoder = FeatureEncoder.load(encoder_path)
+
+    stats = score_file(args.input, args.output, args.model, encoder, args.chunksize, args.workers)
+    print('Scored {} issues in {:.2f} s ({:.0f} rows/s)'.format(stats['rows'], stats['seconds'], stats['rows_per_second']),
+          file=sys.stderr)
@@ -4,9 +4,106 @@
 # In[2]:
 
 
-from sklearn.preprocessing import LabelEncoder
 import pandas as pd
-from outliers_removal import remove_outliers
+import numpy as np
+import json
+import time
+
+
+# Columns that contain ISO-8601 datetimes
+DATETIME_COLUMNS = ['created', 'updated', 'resolutiondate']
+
+# Format of the datetimes returned by the API
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# Functions called as hook(stage, seconds, rows) after every stage measured by a StageTimer,
+# e.g. to export the timings as metrics. Nothing is reported while the list is empty
+stage_hooks = []
+
+
+class StageTimer:
+    """
+    Measures the consecutive stages of a computation and reports their durations to the `stage_hooks`.
+
+    Each call to `lap` ends the current stage and starts the next one, so instrumenting a function only takes one
+    call after each of its stages.
+
+    Parameters:
+    prefix (str): Prepended to the stage names, e.g. 'predict' reports the stage 'model' as 'predict.model'.
+    rows (int, optional): The number of rows the stages process, reported unless a lap gives its own count.
+    """
+
+    def __init__(self, prefix, rows=None):
+        self.prefix = prefix
+        self.rows = rows
+        self.started_at = time.perf_counter()
+
+    def lap(self, stage, rows=None):
+        """
+        End the current stage and report how long it took.
+
+        Parameters:
+        stage (str): The name of the stage that just ended.
+        rows (int, optional): The number of rows the stage processed, if different from the timer's.
+        """
+        now = time.perf_counter()
+        if stage_hooks:
+            name = '{}.{}'.format(self.prefix, stage)
+            for hook in list(stage_hooks):
+                hook(name, now - self.started_at, self.rows if rows is None else rows)
+        self.started_at = now
+
+
+def parse_datetime_column(values):
+    """
+    Parse a column of ISO-8601 datetimes into naive UTC datetime64 values.
+
+    Columns that are already naive datetime64 are returned as they are, so data that was parsed once when it was
+    loaded is never parsed again.
+
+    Parameters:
+        values (pandas.Series): The column to parse.
+
+    Returns:
+        pandas.Series: The parsed column, with NaT for missing values.
+    """
+    if pd.api.types.is_datetime64_dtype(values):
+        return values
+    return pd.to_datetime(values, utc=True).dt.tz_localize(None)
+
+
+def parse_datetime_columns(df):
+    """
+    Parse the datetime columns ('created', 'updated', 'resolutiondate') of a DataFrame into naive UTC datetime64 columns.
+
+    Parameters:
+        df (pandas.DataFrame): The raw issue data.
+
+    Returns:
+        pandas.DataFrame: `df` itself if all its datetime columns are already parsed, otherwise a new DataFrame with the
+        parsed columns (the other columns are not copied).
+    """
+    columns = [col for col in DATETIME_COLUMNS if col in df and not pd.api.types.is_datetime64_dtype(df[col])]
+    if not columns:
+        return df
+    return df.assign(**{col: parse_datetime_column(df[col]) for col in columns})
+
+
+def format_datetime_columns(df):
+    """
+    Format the parsed datetime columns of a DataFrame as strings in the format 'YYYY-MM-DD HH:MM:SS'.
+
+    The formatting is vectorized and meant to be done once, right before the data is returned or serialized.
+
+    Parameters:
+        df (pandas.DataFrame): A DataFrame with datetime64 columns.
+
+    Returns:
+        pandas.DataFrame: A new DataFrame with the datetime columns formatted (the other columns are not copied).
+    """
+    columns = [col for col in DATETIME_COLUMNS if col in df and pd.api.types.is_datetime64_any_dtype(df[col])]
+    return df.assign(**{col: df[col].dt.strftime(DATETIME_FORMAT) for col in columns})
 
 
 def preprocess_data(df):
@@ -26,38 +123,30 @@ def preprocess_data(df):
 
     Steps:
         1. Select a subset of the input DataFrame, `df`, including only the necessary columns for preprocessing.
-        2. Define the list of columns that contain datetime data.
-        3. Convert the datetime columns in the DataFrame to datetime format and format the datetime objects as strings in the format 'YYYY-MM-DD HH:MM:SS'.
-        4. Convert the remaining object columns ('created', 'updated', 'resolutiondate') to datetime format.
-        5. Calculate the time difference in seconds between 'resolutiondate' and 'created', and convert it to days, storing it in a new column 'days_since_created'.
-        6. Extract additional features from the 'created' column: 'created_day_name' (day of the week), 'created_is_weekend' (whether it's a weekend or weekday), and 'created_month_name'.
-        7. Replace 'Closed' status with 'Resolved', as the 'resolutiondate' for 'Closed' statuses represents the date when the issue is resolved.
-        8. Perform ordinal encoding on categorical columns using predefined order mappings.
-        9. Perform one-hot encoding on the 'issue_type' column using `LabelEncoder`.
-        10. Drop the original categorical and date columns from the DataFrame.
-        11. Return the preprocessed DataFrame, `df_issues`, as the output.
+        2. Convert the datetime columns ('created', 'updated', 'resolutiondate') to UTC datetime format, truncated to whole seconds.
+           Columns that were already parsed with `parse_datetime_columns` are not parsed again.
+        3. Calculate the time difference in seconds between 'resolutiondate' and 'created', and convert it to days, storing it in a new column 'days_since_created'.
+        4. Extract additional features from the 'created' column: 'created_day_name' (day of the week), 'created_is_weekend' (whether it's a weekend or weekday), and 'created_month_name'.
+        5. Replace 'Closed' status with 'Resolved', as the 'resolutiondate' for 'Closed' statuses represents the date when the issue is resolved.
+        6. Perform ordinal encoding on categorical columns using predefined order mappings.
+        7. Perform one-hot encoding on the 'issue_type' column using `LabelEncoder`.
+        8. Drop the original categorical and date columns from the DataFrame.
+        9. Return the preprocessed DataFrame, `df_issues`, as the output.
 
     Note:
-        - The function assumes that the necessary modules, such as `pandas` and `sklearn.preprocessing.LabelEncoder`, are imported before calling the function.
+        - The function assumes that the necessary modules, such as `pandas` and `numpy`, are imported before calling the function.
     """
-  
+    timer = StageTimer('preprocess', len(df))
+
     # Create a new DataFrame from a subset of df, selecting only the needed columns
     df_issues = df[['key', 'status', 'priority', 'issue_type', 'created', 'updated', 'description_length', 'summary_length', 'watch_count', 'comment_count', 'resolutiondate']].copy()
-
-    # Define the list of columns that contain datetime data
-    datetime_columns = ['created', 'updated', 'resolutiondate']
+    timer.lap('select')
 
     # Loop over the datetime columns
-    for column in datetime_columns:
-        # Convert the column in df_issues to datetime format
-        df_issues[column] = pd.to_datetime(df_issues[column])
-        # Format the datetime objects as strings in the format 'YYYY-MM-DD HH:MM:SS'
-        df_issues[column] = df_issues[column].dt.strftime('%Y-%m-%d %H:%M:%S')
-
-    # Convert object columns to datetime
-    df_issues['created'] = pd.to_datetime(df_issues['created'])
-    df_issues['updated'] = pd.to_datetime(df_issues['updated'])
-    df_issues['resolutiondate'] = pd.to_datetime(df_issues['resolutiondate'])
+    for column in DATETIME_COLUMNS:
+        # Convert the column to UTC datetime (unless it was already parsed when the data was loaded), truncated to whole seconds
+        df_issues[column] = parse_datetime_column(df_issues[column]).dt.floor('s')
+    timer.lap('parse_dates')
 
     # Calculate the time difference in seconds
     time_difference = (df_issues['resolutiondate'] - df_issues['created']).dt.total_seconds()
@@ -72,7 +161,9 @@ def preprocess_data(df):
     df_issues['created_month_name'] = df_issues['created'].dt.month_name()
 
     # Since the resolutiondate for Closed statuses is the date when the issue is resolved, Closed is replaced by Resolved
-    df_issues['status'] = df_issues['status'].replace('Closed', 'Resolved')
+    # (np.where works the same for text and categorical columns)
+    df_issues['status'] = np.where(df_issues['status'] == 'Closed', 'Resolved', df_issues['status'])
+    timer.lap('derive_features')
 
 #     # Ordinal encoding
 #     status_order = ['Open', 'Patch Available', 'In Progress', 'Resolved', 'Reopened', 'Closed']
@@ -110,6 +201,7 @@ def preprocess_data(df):
     df_issues['status'] = pd.Categorical(df_issues['status'], categories=status_order, ordered=True)
     # Convert the ordered categorical data to codes. Add +1 so the codes start from 1 instead of 0
     df_issues['status'] = df_issues['status'].cat.codes + 1
+    timer.lap('encode_status')
 
     
     
@@ -118,22 +210,161 @@ def preprocess_data(df):
 
     # Iterate over the columns to one-hot encode
     for col in cols_to_encode:
-        # Create the one-hot encoded dataframe
-        one_hot = pd.get_dummies(df_issues[col], prefix=col)
+        # Create the one-hot encoded dataframe (categorical columns only get dummies for the categories that occur, like text columns)
+        values = df_issues[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.remove_unused_categories()
+        one_hot = pd.get_dummies(values, prefix=col)
 
         # Drop the original column from the dataframe
         df_issues.drop(col, axis=1, inplace=True)
 
         # Concatenate the one-hot encoded dataframe with the original dataframe
         df_issues = pd.concat([df_issues, one_hot], axis=1)
+    timer.lap('one_hot')
 
     # Drop the original categorical and date columns
     df_issues.drop(['key', 'created', 'resolutiondate', 'updated', 'created_is_weekend'], axis=1, inplace=True)
     
     
     no_outliers_encoded_df_issues = df_issues[~((df_issues['status'] == 4) & ((df_issues['days_since_created'] == 0) | (df_issues['days_since_created'] > 47)))]
+    timer.lap('filter')
 
   
     
     return no_outliers_encoded_df_issues
 
+
+
+# Numeric columns that are passed to the model as they are
+NUMERIC_FEATURES = ['description_length', 'summary_length', 'watch_count', 'comment_count']
+
+# Columns that are one-hot encoded by preprocess_data, in the order their dummies appear in the feature matrix
+ONE_HOT_FEATURES = ['priority', 'created_day_name', 'created_month_name', 'issue_type']
+
+
+class FeatureEncoder:
+    """
+    Encodes raw issues into the exact feature matrix the regression model was trained on.
+
+    `preprocess_data` one-hot encodes with `pd.get_dummies`, so the columns it produces depend on the rows it is given
+    and the whole dataset has to be preprocessed to score a single issue. The encoder is fitted once on the training
+    data and freezes everything that depends on it: the category vocabularies of the one-hot encoded columns, the
+    order of the feature columns and the means used to fill missing values. Afterwards `transform` encodes any number
+    of rows, including a single one, into that fixed schema.
+
+    Parameters:
+    feature_columns (list of str, optional): The ordered feature columns the model expects.
+    vocabularies (dict, optional): The known categories of every one-hot encoded column.
+    fill_values (dict, optional): The value used to fill missing values of every numeric column.
+    """
+
+    def __init__(self, feature_columns=None, vocabularies=None, fill_values=None):
+        self.feature_columns = feature_columns
+        self.vocabularies = vocabularies
+        self.fill_values = fill_values
+
+    def fit(self, df):
+        """
+        Learn the feature schema and the imputation statistics from the raw training issues.
+
+        Parameters:
+        df (pandas.DataFrame): The raw issue data the model was trained on, with the columns required by `preprocess_data`.
+
+        Returns:
+        FeatureEncoder: The fitted encoder itself.
+        """
+        # Reuse preprocess_data so the schema is exactly the one the model was trained on
+        return self.fit_features(preprocess_data(df))
+
+    def fit_features(self, preprocessed_df):
+        """
+        Learn the feature schema and the imputation statistics from training issues already preprocessed with
+        `preprocess_data`, for callers that also need the preprocessed data itself (e.g. to train the model).
+
+        Parameters:
+        preprocessed_df (pandas.DataFrame): The result of `preprocess_data` on the raw training issues.
+
+        Returns:
+        FeatureEncoder: The fitted encoder itself.
+        """
+        features = preprocessed_df.drop(['days_since_created', 'status'], axis=1)
+
+        self.feature_columns = list(features.columns)
+        self.vocabularies = {
+            col: [column[len(col) + 1:] for column in self.feature_columns if column.startswith(col + '_')]
+            for col in ONE_HOT_FEATURES
+        }
+        self.fill_values = {col: float(features[col].mean()) for col in NUMERIC_FEATURES}
+
+        return self
+
+    def transform(self, df):
+        """
+        Encode raw issues into the fitted feature schema.
+
+        Categories that were not seen during fitting are encoded as all zeros, and missing numeric values are
+        filled with the training means, so the result never depends on the other rows that are passed in.
+
+        Parameters:
+        df (pandas.DataFrame): The raw issue data to encode. Each row corresponds to a specific issue.
+
+        Returns:
+        pandas.DataFrame: The feature matrix, with the same index as `df` and the columns in the fitted order.
+        """
+        if self.feature_columns is None:
+            raise ValueError('The encoder has to be fitted before it can transform data')
+
+        created = parse_datetime_column(df['created'])
+
+        # Values of the columns to one-hot encode
+        categorical_values = {
+            'priority': df['priority'],
+            'created_day_name': created.dt.day_name(),
+            'created_month_name': created.dt.month_name(),
+            'issue_type': df['issue_type'],
+        }
+
+        encoded = [df[NUMERIC_FEATURES].fillna(self.fill_values)]
+        for col in ONE_HOT_FEATURES:
+            # A categorical with the frozen vocabulary always produces the same dummy columns
+            values = pd.Categorical(categorical_values[col], categories=self.vocabularies[col])
+            one_hot = pd.get_dummies(values, prefix=col)
+            one_hot.index = df.index
+            encoded.append(one_hot)
+
+        features = pd.concat(encoded, axis=1)
+
+        return features.reindex(columns=self.feature_columns, fill_value=0)
+
+    def to_dict(self):
+        """Return the fitted schema as a JSON serializable dictionary."""
+        return {
+            'feature_columns': self.feature_columns,
+            'vocabularies': self.vocabularies,
+            'fill_values': self.fill_values,
+        }
+
+    def save(self, path):
+        """
+        Persist the fitted schema as JSON.
+
+        Parameters:
+        path (str): The file to write the schema to.
+        """
+        with open(path, 'w') as schema_file:
+            json.dump(self.to_dict(), schema_file, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an encoder that was persisted with `save`.
+
+        Parameters:
+        path (str): The file the schema was written to.
+
+        Returns:
+        FeatureEncoder: The fitted encoder.
+        """
+        with open(path) as schema_file:
+            return cls(**json.load(schema_file))
@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(route, version, *args):
+    """
+    Build the cache key of a response.
+
+    Parameters:
+    route (str): The name of the route.
+    version (tuple): The versions of the model and data the response is computed from, so responses computed from
+                     an older model or data are never served again.
+    args: The parts of the request the response depends on, e.g. the issue key or the query arguments.
+    """
+    return '|'.join(str(part) for part in (route,) + tuple(version) + args)
+
+
+def snapshot_etag(snapshot, route, *args):
+    """
+    Build the strong ETag of a response computed from a prediction snapshot.
+
+    It only depends on the model and data versions and the request, so it is known before anything is computed,
+    and every worker (and both the WSGI and ASGI apps) sends the same ETag for the same response.
+    """
+    return hashlib.sha256(cache_key(route, snapshot.version, *args).encode('utf-8')).hexdigest()[:32]
+
+
+class LRUCache:
+    """
+    An in-process cache bounded in size (least recently used entries are evicted first) and in age.
+
+    Parameters:
+    max_entries (int): The maximum number of entries.
+    ttl (float, optional): The number of seconds an entry is served for. Entries never expire if not provided.
+    clock (callable, optional): Returns the current time in seconds.
+    """
+
+    def __init__(self, max_entries, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the value cached for a key, or None if it is not cached or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Cache a value, evicting the least recently used entries beyond `max_entries`."""
+        expires_at = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedCache:
+    """
+    A cache shared by all worker processes, stored in Redis (or any client with Redis' get/set API).
+
+    Parameters:
+    client: The client, e.g. `redis.Redis`.
+    ttl (float, optional): The number of seconds an entry is served for.
+    prefix (str, optional): Prepended to all keys, so several deployments can share a server.
+    """
+
+    def __init__(self, client, ttl=None, prefix='jira:response:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, ttl=None):
+        """
+        Connect to a Redis server, e.g. 'redis://localhost:6379/0'.
+
+        Raises:
+        RuntimeError: If the redis package is not installed.
+        """
+        if redis is None:
+            raise RuntimeError('The redis package is required for a shared response cache')
+        return cls(redis.Redis.from_url(url), ttl)
+
+    def get(self, key):
+        """Return the value cached for a key, or None."""
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value):
+        """Cache a value for `ttl` seconds."""
+        self.client.set(self.prefix + key, value, ex=max(1, int(self.ttl)) if self.ttl else None)
+
+
+class ResponseCache:
+    """
+    Caches serialized responses in process, and optionally in a cache shared by all worker processes.
+
+    A response found in the shared cache is also cached in process. Failures of the shared cache are logged and
+    treated as misses, so the API keeps serving when the shared cache is down.
+
+    Parameters:
+    local (LRUCache): The in-process cache.
+    shared (SharedCache, optional): The cache shared by the worker processes.
+    """
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._counters_lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached response for a key.
+
+        Returns:
+        tuple: The body (bytes) and the status code, or None on a miss.
+        """
+        response = self.local.get(key)
+        value = None
+        if response is None and self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception:
+                logger.exception('Failed to read the shared response cache')
+                value = None
+            if value is not None:
+                status, _, body = value.partition(b'\n')
+                response = (body, int(status))
+                self.local.set(key, response)
+
+        with self._counters_lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                if value is not None:
+                    self.shared_hits += 1
+        return response
+
+    def set(self, key, body, status):
+        """Cache the body (bytes) and status code of a response."""
+        self.local.set(key, (body, status))
+        if self.shared is not None:
+            try:
+                self.shared.set(key, str(status).encode('ascii') + b'\n' + body)
+            except Exception:
+                logger.exception('Failed to write the shared response cache')
+
+    def hit_ratio(self):
+        """Return the fraction of the lookups that were hits, or None before the first lookup."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
@@ -0,0 +1,312 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+from datahelper import project_of
+from model_registry import DEFAULT_MODEL_PATH, ModelRegistry
+from snapshot import ResolutionDateIndex, SnapshotManager
+
+
+logger = logging.getLogger(__name__)
+
+# Directory of the per-project model artifacts: '<PROJECT>.npz' (or '<PROJECT>.pkl') with its encoder schema
+# '<PROJECT>_encoder.json'. Projects without an artifact are served by the global model
+PROJECT_MODELS_DIR = os.environ.get(
+    'JIRA_PROJECT_MODELS_DIR',
+    os.path.join(os.path.dirname(DEFAULT_MODEL_PATH), 'models', 'projects')
+)
+
+
+def project_model_path(project, directory=None):
+    """
+    Return the path of the model artifact of a project, or None if the project has no artifact of its own.
+
+    An exported forest (.npz) is preferred over a pickled model (.pkl), like for the global model.
+    """
+    directory = directory or PROJECT_MODELS_DIR
+    for extension in ('.npz', '.pkl'):
+        path = os.path.join(directory, project + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class ProcessPool:
+    """
+    A process pool that is only started when the first task is submitted.
+
+    The worker processes are spawned rather than forked, so they never inherit the locks and threads of the server,
+    and a pool created before a pre-forking server forked its workers (see gunicorn.conf.py) is started again in
+    every worker instead of being shared with the master.
+
+    Parameters:
+    max_workers (int): The number of worker processes.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Submit a task to the pool, see `concurrent.futures.Executor.submit`."""
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            pool = self._pool
+        return pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """Stop the worker processes, they are started again by the next submit."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None and self._pid == os.getpid():
+            pool.shutdown(wait)
+
+
+class ShardedSnapshot:
+    """
+    The prediction snapshots of all projects, read like a single `PredictionSnapshot`.
+
+    Lookups by issue key go to the snapshot of the key's project. The merged predictions and resolution date index
+    of all projects are only built when they are first read.
+
+    Parameters:
+    snapshots (dict): The `PredictionSnapshot` of every project.
+    """
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self._predictions = None
+        self._date_index = None
+
+    @property
+    def model_version(self):
+        """The versions of the models of the projects, each version once."""
+        versions = [self.snapshots[project].model_version for project in sorted(self.snapshots)]
+        return '; '.join(dict.fromkeys(versions))
+
+    @property
+    def data_version(self):
+        """The versions of the data of the projects, see `ShardedIssueStore.version`."""
+        return '; '.join(self.snapshots[project].data_version for project in sorted(self.snapshots))
+
+    @property
+    def version(self):
+        """The versions of the models and data the snapshots were built from."""
+        return self.model_version, self.data_version
+
+    @property
+    def built_at(self):
+        """The time the most recent of the snapshots was built."""
+        return max(snapshot.built_at for snapshot in self.snapshots.values())
+
+    def resolution_date(self, key):
+        """Return the resolution date of an issue from the snapshot of its project, or None."""
+        snapshot = self.snapshots.get(project_of(key))
+        return snapshot.resolution_date(key) if snapshot is not None else None
+
+    @property
+    def predictions(self):
+        """The predictions of all projects, ordered by project."""
+        if self._predictions is None:
+            self._predictions = pd.concat([self.snapshots[project].predictions for project in sorted(self.snapshots)],
+                                          ignore_index=True)
+        return self._predictions
+
+    @property
+    def date_index(self):
+        """The unresolved issues of all projects sorted by their predicted resolution date."""
+        if self._date_index is None:
+            indexes = [self.snapshots[project].date_index for project in sorted(self.snapshots)]
+            self._date_index = indexes[0] if len(indexes) == 1 else ResolutionDateIndex.merged(indexes)
+        return self._date_index
+
+
+class ShardedSnapshotManager:
+    """
+    Builds and publishes the prediction snapshot of every project of a `ShardedIssueStore`.
+
+    Every project has its own `SnapshotManager`, predicting with the project's model (see `project_model_path`) or
+    with the global model if the project has none. Rebuilds of the projects run concurrently, each preprocessing and
+    scoring its own shard in a worker process of `executor`, and an update only re-scores the projects it changed.
+
+    Parameters:
+    store (ShardedIssueStore): The issues, partitioned by project.
+    model_registry (ModelRegistry): The registry of the global model.
+    default_encoder (FeatureEncoder, optional): The encoder used when a model was loaded without one.
+    project_models_dir (str, optional): The directory of the per-project models. Defaults to `PROJECT_MODELS_DIR`.
+    executor (concurrent.futures.Executor, optional): Runs the predictions of the rebuilds, e.g. a `ProcessPool`.
+                                                      Rebuilds predict in the calling thread if not provided.
+    """
+
+    def __init__(self, store, model_registry, default_encoder=None, project_models_dir=None, executor=None):
+        self.store = store
+        self.model_registry = model_registry
+        self.default_encoder = default_encoder
+        self.project_models_dir = project_models_dir
+        self.executor = executor
+        self._managers = {}
+        self._project_registries = {}
+        self._current = None
+        # Serializes the creation of project managers; readers never take this lock
+        self._lock = threading.Lock()
+        self._worker = None
+        self._stop = threading.Event()
+
+    @property
+    def registries(self):
+        """The model registries the projects predict with, the global one first."""
+        return [self.model_registry] + [self._project_registries[project] for project in sorted(self._project_registries)]
+
+    @property
+    def project_registries(self):
+        """The model registries of the projects that have a model of their own, keyed by project."""
+        return dict(self._project_registries)
+
+    def manager(self, project):
+        """Return the snapshot manager of a project, created on first use."""
+        manager = self._managers.get(project)
+        if manager is not None:
+            return manager
+
+        with self._lock:
+            if project not in self._managers:
+                model_registry = self.model_registry
+                path = project_model_path(project, self.project_models_dir)
+                if path is not None:
+                    model_registry = ModelRegistry(path)
+                    model_registry.load()
+                    self._project_registries[project] = model_registry
+
+                # The shard is looked up on every call, the store publishes a new one for a new project
+                manager = SnapshotManager(model_registry,
+                                          lambda: self.store.shard(project).issues,
+                                          lambda: self.store.shard(project).version,
+                                          self.default_encoder, self.executor)
+                managers = dict(self._managers)
+                managers[project] = manager
+                self._managers = managers
+            return self._managers[project]
+
+    @property
+    def ready(self):
+        """True once the snapshot of any project has been published."""
+        return any(manager._current is not None for manager in self._managers.values())
+
+    @property
+    def current(self):
+        """
+        The most recently published snapshots of all projects.
+
+        Raises:
+        RuntimeError: If no snapshot has been built yet.
+        """
+        managers = self._managers
+        snapshots = {project: manager._current for project, manager in managers.items()
+                     if manager._current is not None}
+        if not snapshots:
+            raise RuntimeError('No prediction snapshot has been built, call rebuild() first')
+
+        # Reuse the composite snapshot (and the merged index it built) until a project publishes a new snapshot
+        current = self._current
+        if current is None or current.snapshots != snapshots:
+            current = ShardedSnapshot(snapshots)
+            self._current = current
+        return current
+
+    def project_snapshot(self, project):
+        """Return the current snapshot of a project, or None if the project has no snapshot."""
+        manager = self._managers.get(project)
+        return manager._current if manager is not None else None
+
+    def shard_snapshot(self, key):
+        """Return the current snapshot of the project of an issue key, or None if the project has no snapshot."""
+        return self.project_snapshot(project_of(key))
+
+    def rebuild(self):
+        """
+        Predict all issues of every project, and publish the results.
+
+        Returns:
+        ShardedSnapshot: The newly published snapshots.
+        """
+        managers = [self.manager(project) for project in self.store.projects]
+        if self.executor is not None and len(managers) > 1:
+            # Every thread waits on the worker process scoring its project
+            with ThreadPoolExecutor(len(managers), thread_name_prefix='shard-rebuild') as threads:
+                list(threads.map(SnapshotManager.rebuild, managers))
+        else:
+            for manager in managers:
+                manager.rebuild()
+        return self.current
+
+    def update(self, changed_issues, data_version=None):
+        """
+        Re-score only the changed (or new) issues in the snapshots of their projects.
+
+        Parameters:
+        changed_issues (pd.DataFrame): The changed issues, indexed by their position in the shard of their project
+                                       (e.g. as returned by `ShardedIssueStore.take`).
+        data_version (str, optional): The version of the data of all projects, unused: every project is updated to
+                                      the version of its own shard.
+
+        Returns:
+        ShardedSnapshot: The newly published snapshots.
+        """
+        for project, project_issues in changed_issues.groupby(changed_issues['key'].map(project_of), sort=False):
+            self.manager(project).update(project_issues, self.store.shard(project).version)
+        return self.current
+
+    def is_stale(self):
+        """Return True if the model or the data of any project changed since its snapshot was built."""
+        if set(self._managers) != set(self.store.projects):
+            return True
+        return any(manager.is_stale() for manager in self._managers.values())
+
+    def rebuild_if_stale(self, max_age=None):
+        """
+        Rebuild the snapshot of every project whose model or data changed, or that is older than `max_age` seconds.
+
+        Returns:
+        bool: True if a new snapshot was published.
+        """
+        rebuilt = False
+        for project in self.store.projects:
+            rebuilt = self.manager(project).rebuild_if_stale(max_age) or rebuilt
+        return rebuilt
+
+    def start(self, interval=30.0, max_age=None):
+        """
+        Start a daemon thread that rebuilds the snapshots in the background, see `SnapshotManager.start`.
+
+        A failed rebuild of a project is logged and its previous snapshot stays in service.
+        """
+        if self._worker is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                for project in self.store.projects:
+                    try:
+                        self.manager(project).rebuild_if_stale(max_age)
+                    except Exception:
+                        logger.exception('Failed to rebuild the prediction snapshot of project %s', project)
+
+        self._stop.clear()
+        self._worker = threading.Thread(target=run, name='prediction-snapshot-builder', daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Stop the thread started by `start`."""
+        if self._worker is None:
+            return
+        self._stop.set()
+        self._worker.join()
+        self._worker = None
@@ -0,0 +1,393 @@
+import copy
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from model_registry import artifact_version, load_artifact
+from predict import predict_resolution_frame
+from preprocessing import DATETIME_FORMAT, FeatureEncoder
+
+
+logger = logging.getLogger(__name__)
+
+
+def to_epoch_seconds(date):
+    """
+    Convert an ISO-8601 date to seconds since the epoch in UTC. Dates without a timezone are taken as UTC.
+
+    Raises:
+    ValueError: If the date cannot be parsed.
+    """
+    timestamp = pd.Timestamp(date)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+    return timestamp.value // 10 ** 9
+
+
+# The artifact loaded by a worker process of an executor, see `predict_with_artifact`
+_worker_artifacts = {}
+
+
+def predict_with_artifact(model_path, model_version, encoder_schema, issues):
+    """
+    Predict issues in a worker process (e.g. of a process pool), with the model artifact at `model_path`.
+
+    Every worker loads an artifact once and keeps it for later calls with the same version.
+
+    Parameters:
+    model_path (str): The artifact the model was loaded from.
+    model_version (str): The version of the model, see `model_registry.artifact_version`.
+    encoder_schema (dict): The schema of the feature encoder, see `FeatureEncoder.to_dict`, or None.
+    issues (pd.DataFrame): The issues to predict.
+
+    Returns:
+    pd.DataFrame: The result of `predict_resolution_frame`.
+
+    Raises:
+    RuntimeError: If the artifact on disk is no longer the requested version.
+    """
+    loaded = _worker_artifacts.get(model_path)
+    if loaded is None or loaded[0] != model_version:
+        # The artifact may have been replaced since the caller loaded it, never predict with another version
+        if artifact_version(model_path) != model_version:
+            raise RuntimeError('The artifact {} is no longer version {}'.format(model_path, model_version))
+        loaded = (model_version, load_artifact(model_path))
+        _worker_artifacts[model_path] = loaded
+
+    encoder = FeatureEncoder(**encoder_schema) if encoder_schema is not None else None
+    return predict_resolution_frame(issues, model=loaded[1], encoder=encoder)
+
+
+class ResolutionDateIndex:
+    """
+    The unresolved issues sorted by their predicted resolution date.
+
+    The resolution dates are kept as an int64 array of epoch seconds, so finding the issues that are resolved by a
+    date is a binary search followed by a slice, instead of parsing and filtering the whole DataFrame.
+
+    Parameters:
+    predictions (pd.DataFrame): The DataFrame returned by `predict_resolution_frame` for all issues.
+    """
+
+    def __init__(self, predictions):
+        self.epochs, self.keys, self.resolution_dates = self._sorted_entries(predictions)
+
+    @staticmethod
+    def _sorted_entries(predictions):
+        # The epochs, keys and formatted resolution dates of the unresolved issues, earliest resolution date first.
+        # Issues without a prediction (NaT) are left out, their epoch would sort before every date
+        unresolved_issues = predictions[~predictions['status'].isin(['Resolved', 'Closed'])
+                                        & predictions['resolutiondate'].notna()]
+
+        # The predicted resolution dates are already parsed, as naive UTC datetimes truncated to whole seconds
+        resolution_dates = unresolved_issues['resolutiondate']
+        epochs = resolution_dates.values.astype('datetime64[s]').astype('int64')
+        order = np.argsort(epochs, kind='stable')
+
+        return (epochs[order], unresolved_issues['key'].values[order],
+                resolution_dates.dt.strftime(DATETIME_FORMAT).values[order])
+
+    def updated(self, changed_predictions):
+        """
+        Return a new index where the entries of some issues are replaced, leaving this index untouched.
+
+        Only the changed issues are formatted and sorted, they are then merged into the sorted arrays of the other
+        issues, instead of sorting all issues again.
+
+        Parameters:
+        changed_predictions (pd.DataFrame): The new predictions of the changed (or new) issues.
+
+        Returns:
+        ResolutionDateIndex: The updated index.
+        """
+        keep = ~np.isin(self.keys, changed_predictions['key'].values)
+        epochs, keys, resolution_dates = self._sorted_entries(changed_predictions)
+        positions = np.searchsorted(self.epochs[keep], epochs, side='right')
+
+        index = copy.copy(self)
+        index.epochs = np.insert(self.epochs[keep], positions, epochs)
+        index.keys = np.insert(self.keys[keep], positions, keys)
+        index.resolution_dates = np.insert(self.resolution_dates[keep], positions, resolution_dates)
+        return index
+
+    @classmethod
+    def merged(cls, indexes):
+        """
+        Merge the indexes of disjoint sets of issues (e.g. of several projects) into one index.
+
+        Parameters:
+        indexes (list of ResolutionDateIndex): The indexes to merge.
+
+        Returns:
+        ResolutionDateIndex: The merged index.
+        """
+        epochs = np.concatenate([index.epochs for index in indexes])
+        order = np.argsort(epochs, kind='stable')
+
+        index = cls.__new__(cls)
+        index.epochs = epochs[order]
+        index.keys = np.concatenate([index.keys for index in indexes])[order]
+        index.resolution_dates = np.concatenate([index.resolution_dates for index in indexes])[order]
+        return index
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def count_until(self, date):
+        """Return the number of unresolved issues predicted to be resolved on or before `date`."""
+        return int(np.searchsorted(self.epochs, to_epoch_seconds(date), side='right'))
+
+    def issues_until(self, date, start=0, limit=None):
+        """
+        Return a page of the unresolved issues predicted to be resolved on or before `date`, earliest first.
+
+        Parameters:
+        date (str): The cutoff date in ISO-8601 format.
+        start (int, optional): The position of the first issue of the page.
+        limit (int, optional): The maximum number of issues of the page. All remaining issues if not provided.
+
+        Returns:
+        tuple: The keys and the predicted resolution dates of the page, and the total number of matching issues.
+        """
+        total = self.count_until(date)
+        stop = total if limit is None else min(total, start + limit)
+        return self.keys[start:stop], self.resolution_dates[start:stop], total
+
+
+def formatted_resolution_dates(predictions):
+    # The formatted resolution dates by issue key, issues without a prediction (NaT) are left out
+    predicted = predictions[predictions['resolutiondate'].notna()]
+    return dict(zip(predicted['key'], predicted['resolutiondate'].dt.strftime(DATETIME_FORMAT)))
+
+
+class PredictionSnapshot:
+    """
+    The predicted resolution dates of all issues, computed once from one version of the data and the model.
+
+    A snapshot is never modified after it has been built, so any number of request threads can read it without
+    locking. Callers must treat `predictions` as read-only. Its datetime columns are kept as datetime64 values and
+    are only formatted when they are served.
+
+    Parameters:
+    predictions (pd.DataFrame): The DataFrame returned by `predict_resolution_frame` for all issues.
+    model_version (str): The version of the model the predictions were made with.
+    data_version (str): The version of the issues data the predictions were made for.
+    resolution_dates (dict, optional): The formatted resolution dates by issue key, computed if not provided.
+    date_index (ResolutionDateIndex, optional): The index of the predictions, built if not provided.
+    """
+
+    def __init__(self, predictions, model_version, data_version, resolution_dates=None, date_index=None):
+        self.predictions = predictions
+        self.model_version = model_version
+        self.data_version = data_version
+        self.built_at = time.time()
+
+        # Predicted (or actual) resolution date of every issue, keyed by issue key
+        if resolution_dates is None:
+            resolution_dates = formatted_resolution_dates(predictions)
+        self.resolution_dates = resolution_dates
+        # Unresolved issues sorted by predicted resolution date
+        self.date_index = date_index if date_index is not None else ResolutionDateIndex(predictions)
+
+    def updated(self, changed_predictions, data_version):
+        """
+        Return a new snapshot where the predictions of some issues are replaced, leaving this snapshot untouched.
+
+        Only the changed issues are formatted and indexed, the rest of the snapshot is carried over.
+
+        Parameters:
+        changed_predictions (pd.DataFrame): The new predictions of the changed (or new) issues, indexed by their
+                                            position in the issue store like the snapshot's predictions.
+        data_version (str): The version of the issues data that includes the changes.
+
+        Returns:
+        PredictionSnapshot: The updated snapshot.
+        """
+        replaced = changed_predictions.index[changed_predictions.index.isin(self.predictions.index)]
+        predictions = pd.concat([self.predictions.drop(index=replaced), changed_predictions]).sort_index()
+
+        resolution_dates = dict(self.resolution_dates)
+        for key in changed_predictions['key']:
+            resolution_dates.pop(key, None)
+        resolution_dates.update(formatted_resolution_dates(changed_predictions))
+
+        return PredictionSnapshot(predictions, self.model_version, data_version, resolution_dates,
+                                  self.date_index.updated(changed_predictions))
+
+    @property
+    def version(self):
+        """The versions of the model and data the snapshot was built from."""
+        return self.model_version, self.data_version
+
+    def resolution_date(self, key):
+        """
+        Return the resolution date of an issue, or None if the issue is not part of the snapshot or has no prediction.
+
+        Parameters:
+        key (str): The key of the issue, e.g. 'AVRO-2171'.
+        """
+        return self.resolution_dates.get(key)
+
+
+class SnapshotManager:
+    """
+    Builds prediction snapshots and publishes them to the request threads.
+
+    Snapshots are double-buffered: a new snapshot is computed completely on the side while requests keep reading the
+    current one, and is then published with a single reference assignment. Readers therefore never see a half-built
+    snapshot, and no request ever has to run the prediction over the whole dataset itself.
+
+    Parameters:
+    model_registry (ModelRegistry): The registry holding the model (and encoder) to predict with.
+    get_issues (callable): Returns the DataFrame of issues to predict.
+    get_data_version (callable): Returns the version of the data `get_issues` currently returns.
+    default_encoder (FeatureEncoder, optional): The encoder used when the model was loaded without one.
+    executor (concurrent.futures.Executor, optional): Runs the predictions of the rebuilds (see
+                                                      `predict_with_artifact`), e.g. a process pool shared by the
+                                                      snapshots of several projects. Rebuilds predict in the calling
+                                                      thread if not provided.
+    """
+
+    def __init__(self, model_registry, get_issues, get_data_version, default_encoder=None, executor=None):
+        self.model_registry = model_registry
+        self.get_issues = get_issues
+        self.get_data_version = get_data_version
+        self.default_encoder = default_encoder
+        self.executor = executor
+        self._current = None
+        # Serializes rebuilds with each other; readers never take this lock
+        self._build_lock = threading.Lock()
+        self._worker = None
+        self._stop = threading.Event()
+
+    @property
+    def current(self):
+        """
+        The most recently published snapshot.
+
+        Raises:
+        RuntimeError: If no snapshot has been built yet.
+        """
+        snapshot = self._current
+        if snapshot is None:
+            raise RuntimeError('No prediction snapshot has been built, call rebuild() first')
+        return snapshot
+
+    def rebuild(self):
+        """
+        Predict all issues with the current model and data, and publish the result as the current snapshot.
+
+        Returns:
+        PredictionSnapshot: The newly published snapshot.
+        """
+        with self._build_lock:
+            loaded = self.model_registry.current()
+            data_version = self.get_data_version()
+            issues = self.get_issues()
+
+            encoder = loaded.encoder or self.default_encoder
+            if self.executor is not None:
+                predictions = self.executor.submit(predict_with_artifact, loaded.path, loaded.version,
+                                                   encoder.to_dict() if encoder is not None else None, issues).result()
+            else:
+                predictions = predict_resolution_frame(issues, model=loaded.model, encoder=encoder)
+            snapshot = PredictionSnapshot(predictions, loaded.version, data_version)
+
+            # Publish the fully built snapshot with a single reference assignment
+            self._current = snapshot
+
+        logger.info('Built prediction snapshot for model %s and data %s', *snapshot.version)
+        return snapshot
+
+    def update(self, changed_issues, data_version):
+        """
+        Re-score only the changed (or new) issues and publish them in a new snapshot.
+
+        Scoring single issues needs a fixed feature schema, so without an encoder, or when the model changed since
+        the current snapshot was built, all issues are predicted again instead.
+
+        Parameters:
+        changed_issues (pd.DataFrame): The changed issues, indexed by their position in the data `get_issues`
+                                       returns (e.g. as returned by `IssueStore.take`).
+        data_version (str): The version of the data that includes the changes.
+
+        Returns:
+        PredictionSnapshot: The newly published snapshot.
+        """
+        with self._build_lock:
+            loaded = self.model_registry.current()
+            encoder = loaded.encoder or self.default_encoder
+            snapshot = self._current
+
+            if encoder is not None and snapshot is not None and snapshot.model_version == loaded.version:
+                changed_predictions = predict_resolution_frame(changed_issues, model=loaded.model, encoder=encoder)
+                snapshot = snapshot.updated(changed_predictions, data_version)
+
+                # Publish the updated snapshot with a single reference assignment
+                self._current = snapshot
+                logger.info('Updated %d issues of the prediction snapshot for data %s', len(changed_issues),
+                            data_version)
+                return snapshot
+
+        return self.rebuild()
+
+    def is_stale(self):
+        """Return True if the model or the data changed since the current snapshot was built."""
+        snapshot = self._current
+        return snapshot is None or snapshot.version != (self.model_registry.version, self.get_data_version())
+
+    def rebuild_if_stale(self, max_age=None):
+        """
+        Rebuild the snapshot if the model or data changed, or if it is older than `max_age` seconds.
+
+        Returns:
+        bool: True if a new snapshot was published.
+        """
+        # Nothing to predict with until a model is loaded
+        if self.model_registry.version is None:
+            return False
+
+        snapshot = self._current
+        expired = max_age is not None and snapshot is not None and time.time() - snapshot.built_at > max_age
+
+        if self.is_stale() or expired:
+            self.rebuild()
+            return True
+        return False
+
+    def start(self, interval=30.0, max_age=None):
+        """
+        Start a daemon thread that rebuilds the snapshot in the background.
+
+        Every `interval` seconds the thread rebuilds the snapshot if the model or data changed, and in any case once
+        the snapshot is older than `max_age` seconds. A failed rebuild is logged and the previous snapshot stays in
+        service.
+
+        Parameters:
+        interval (float, optional): The number of seconds between two checks.
+        max_age (float, optional): Rebuild at least this often, even when nothing changed.
+        """
+        if self._worker is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.rebuild_if_stale(max_age)
+                except Exception:
+                    logger.exception('Failed to rebuild the prediction snapshot')
+
+        self._stop.clear()
+        self._worker = threading.Thread(target=run, name='prediction-snapshot-builder', daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Stop the thread started by `start`."""
+        if self._worker is None:
+            return
+        self._stop.set()
+        self._worker.join()
+        self._worker = None
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from analytics import BottleneckAnalytics, grouped_percentiles
+
+
+class TestBottleneckAnalytics(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_grouped_percentiles: Method to test the percentiles per group against np.percentile.
+        - test_query: Method to test the aggregates of filtered transitions against pandas.
+        - test_no_match: Method to test filters that select no transitions.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the transitions from CSV and encodes them.
+        """
+
+        # Read the raw data from CSV
+        self.df_avro_transitions = pd.read_csv('../data/avro-transitions.csv')
+        self.analytics = BottleneckAnalytics(self.df_avro_transitions)
+
+    def test_grouped_percentiles(self):
+        generator = np.random.default_rng(0)
+        groups = generator.integers(0, 5, 200)
+        values = generator.exponential(10, 200)
+
+        counts, percentiles = grouped_percentiles(groups, values, 6, (50, 90))
+
+        for group in range(5):
+            self.assertEqual(counts[group], (groups == group).sum())
+            np.testing.assert_allclose(percentiles[:, group], np.percentile(values[groups == group], [50, 90]))
+        # Groups without values
+        self.assertEqual(counts[5], 0)
+        self.assertTrue(np.isnan(percentiles[:, 5]).all())
+
+    def test_query(self):
+        result = self.analytics.query(['Major', 'Critical'], ['Bug'], '2016-01-01', '2018-01-01T00:00:00+00:00')
+
+        # The same transitions filtered and aggregated with pandas
+        transitions = self.df_avro_transitions.dropna(subset=['from_status'])
+        when = pd.to_datetime(transitions['when'], utc=True)
+        transitions = transitions[transitions['priority'].isin(['Major', 'Critical']) & (transitions['issue_type'] == 'Bug')
+                                  & (when >= pd.Timestamp('2016-01-01', tz='UTC')) & (when < pd.Timestamp('2018-01-01', tz='UTC'))]
+        expected = transitions.groupby(['from_status', 'to_status'])['days_in_from_status'].agg(
+            ['count', 'median', lambda days: days.quantile(0.9)])
+
+        self.assertEqual(result['total'], len(transitions))
+        self.assertEqual(len(result['transitions']), len(expected))
+        for transition in result['transitions']:
+            count, median, p90 = expected.loc[(transition['from'], transition['to'])]
+            self.assertEqual(transition['count'], count)
+            self.assertAlmostEqual(transition['median_days'], median)
+            self.assertAlmostEqual(transition['p90_days'], p90)
+
+            row, column = result['statuses'].index(transition['from']), result['statuses'].index(transition['to'])
+            self.assertEqual(result['matrix'][row][column], count)
+
+        # Longest median dwell time first
+        medians = [transition['median_days'] for transition in result['transitions']]
+        self.assertEqual(medians, sorted(medians, reverse=True))
+
+        # Without filters, every transition between statuses is counted
+        self.assertEqual(self.analytics.query()['total'], self.df_avro_transitions['from_status'].notna().sum())
+
+    def test_no_match(self):
+        result = self.analytics.query(priorities=['Unknown'])
+
+        self.assertEqual(result['total'], 0)
+        self.assertEqual(result['transitions'], [])
+        self.assertEqual(sum(map(sum, result['matrix'])), 0)
+
+        with self.assertRaises(ValueError):
+            self.analytics.query(start='not a date')
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,530 @@
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from unittest import mock
+
+from sklearn.dummy import DummyRegressor
+
+# The background threads are not needed by the tests
+os.environ.setdefault('JIRA_DEFER_BACKGROUND_TASKS', '1')
+
+import app
+from ingest import records_to_frame
+from model_registry import joblib
+from sharding import ShardedSnapshotManager
+
+
+def load_test_model(test_case, constant=10.0):
+    """
+    Load a model that predicts every issue to be resolved `constant` days after its creation into the app, and
+    predict all issues with it.
+
+    Returns:
+    str: The path of the model artifact, removed when the test case is cleaned up.
+    """
+    directory = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, directory)
+    path = os.path.join(directory, 'model.pkl')
+    joblib.dump(DummyRegressor(strategy='constant', constant=constant).fit([[0]], [0]), path)
+    app.model_registry.load(path)
+    app.snapshots.rebuild()
+    return path
+
+
+def configure_admin_token(test_case, token='test-token'):
+    """
+    Configure the admin token of the app for the duration of a test case.
+
+    Returns:
+    dict: The headers of an admin request.
+    """
+    patcher = mock.patch.dict(os.environ, {'JIRA_ADMIN_TOKEN': token})
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return {'X-Admin-Token': token}
+
+
+class TestModelLoading(unittest.TestCase):
+    """
+    Methods:
+        - test_without_model: Method to test that the app starts without a model and serves predictions once one is loaded.
+    """
+
+    def test_without_model(self):
+        # A fresh process, so the app is imported without any model artifact on disk
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        script = textwrap.dedent('''
+            import json
+            from sklearn.dummy import DummyRegressor
+            import app
+            from model_registry import joblib
+
+            client = app.app.test_client()
+            statuses = [client.get(url).status_code for url in [
+                '/api/issue/AVRO-2171/resolve-prediction', '/api/release/2018-06-01/resolved-since-now',
+                '/api/issue/AVRO-2171/resolve-fake3', '/metrics']]
+
+            # The backlog history is served without a model, the forecast once one is loaded
+            backlog = client.get('/api/backlog')
+            statuses.append(backlog.status_code)
+            statuses.append('forecast' in backlog.get_json())
+
+            joblib.dump(DummyRegressor(strategy='constant', constant=10.0).fit([[0]], [0]), app.model_registry.path)
+            statuses.append(client.post('/api/admin/model/reload').status_code)
+            statuses.append(client.get('/api/issue/AVRO-2171/resolve-prediction').status_code)
+            statuses.append('forecast' in client.get('/api/backlog').get_json())
+            print(json.dumps(statuses))
+        ''')
+        environment = dict(os.environ, JIRA_MODEL_PATH=os.path.join(directory, 'model.pkl'),
+                           JIRA_DEFER_BACKGROUND_TASKS='1', JIRA_ADMIN_OPEN='1')
+        output = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=environment, capture_output=True, text=True, check=True).stdout
+
+        self.assertEqual(json.loads(output.splitlines()[-1]), [503, 503, 200, 200, 200, False, 200, 200, True])
+
+
+
+class TestExport(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_ndjson: Method to test the export of all predictions as newline delimited JSON.
+        - test_csv: Method to test the export of all predictions as CSV.
+        - test_gzip: Method to test the gzip compressed export.
+        - test_invalid_arguments: Method to test that invalid arguments are rejected.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Loads a model into the app and creates a test client.
+        """
+        load_test_model(self)
+        self.client = app.app.test_client()
+        self.predictions = app.snapshots.current.predictions
+
+    def test_ndjson(self):
+        response = self.client.get('/api/predictions/export?chunk_size=100')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertIn('predictions.ndjson', response.headers['Content-Disposition'])
+
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row['key'] for row in rows], list(self.predictions['key']))
+        self.assertEqual(set(rows[0]), set(self.predictions.columns))
+
+        # Unchanged predictions are answered with 304
+        response = self.client.get('/api/predictions/export?chunk_size=100',
+                                   headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_csv(self):
+        response = self.client.get('/api/predictions/export?format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(lines[0].split(',')[0], self.predictions.columns[0])
+        self.assertEqual(len(lines), len(self.predictions) + 1)
+
+    def test_gzip(self):
+        plain = self.client.get('/api/predictions/export')
+        compressed = self.client.get('/api/predictions/export', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.get_data()), plain.get_data())
+        self.assertNotEqual(compressed.headers['ETag'], plain.headers['ETag'])
+
+        # Quality values are respected
+        for accept_encoding in ['gzip;q=0', 'identity, gzip;q=0', 'br']:
+            response = self.client.get('/api/predictions/export', headers={'Accept-Encoding': accept_encoding})
+            self.assertNotIn('Content-Encoding', response.headers, accept_encoding)
+            self.assertEqual(response.get_data(), plain.get_data())
+        response = self.client.get('/api/predictions/export', headers={'Accept-Encoding': 'br;q=1, *;q=0.5'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+    def test_invalid_arguments(self):
+        for query in ['format=xml', 'chunk_size=0', 'chunk_size=-1', 'chunk_size=abc']:
+            response = self.client.get('/api/predictions/export?' + query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('error', response.get_json())
+
+
+
+class TestBatchPrediction(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_batch: Method to test predicting several issue keys in one request.
+        - test_invalid_body: Method to test that invalid request bodies are rejected.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Loads a model into the app and creates a test client.
+        """
+        load_test_model(self)
+        self.client = app.app.test_client()
+
+    def test_batch(self):
+        snapshot = app.snapshots.current
+        expected = [
+            {'issue': 'AVRO-2171', 'predicted_resolution_date': snapshot.resolution_date('AVRO-2171'), 'status': 200},
+            {'issue': 'AVRO-0', 'error': 'Issue key not found', 'status': 404},
+            {'issue': 'OTHER-1', 'error': 'Issue key not found', 'status': 404},
+        ]
+
+        # A list of keys, or an object with a 'keys' list
+        for body in [['AVRO-2171', 'AVRO-0', 'OTHER-1'], {'keys': ['AVRO-2171', 'AVRO-0', 'OTHER-1']}]:
+            response = self.client.post('/api/issues/resolve-prediction', json=body)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), {'issues': expected})
+
+        response = self.client.post('/api/issues/resolve-prediction', json=[])
+        self.assertEqual(response.get_json(), {'issues': []})
+
+    def test_invalid_body(self):
+        for body in [None, {'keys': 'AVRO-2171'}, ['AVRO-2171', 1], ['AVRO-{}'.format(n) for n in range(app.MAX_BATCH_KEYS + 1)]]:
+            response = self.client.post('/api/issues/resolve-prediction', json=body)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.get_json())
+
+        response = self.client.post('/api/issues/resolve-prediction', data='not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/issues/resolve-prediction').status_code, 405)
+
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_metrics: Method to test the Prometheus text served at /metrics.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Loads a model into the app and creates a test client.
+        """
+        load_test_model(self)
+        self.client = app.app.test_client()
+
+    def sample(self, name):
+        # The value of a sample of the metrics, or None if it is not served
+        for line in self.client.get('/metrics').get_data(as_text=True).splitlines():
+            if line.startswith(name + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return None
+
+    def test_metrics(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'text/plain; version=0.0.4; charset=utf-8')
+
+        # Every request is timed by route, method and status
+        count = 'jira_request_duration_seconds_count{route="/api/issue/<issue_key>/resolve-prediction",method="GET",status="404"}'
+        before = self.sample(count) or 0
+        self.client.get('/api/issue/AVRO-0/resolve-prediction')
+        self.assertEqual(self.sample(count), before + 1)
+
+        # The stages of the prediction that built the snapshot, and the gauges
+        self.assertIn('jira_stage_duration_seconds_count{stage="predict.model"}', response.get_data(as_text=True))
+        self.assertEqual(self.sample('jira_issue_store_rows'), len(app.get_issue_store()))
+        self.assertEqual(self.sample('jira_snapshot_rows'), len(app.snapshots.current.predictions))
+        self.assertLess(self.sample('jira_snapshot_age_seconds'), 60)
+
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_cached_responses: Method to test that repeated requests are served from the response cache.
+        - test_errors_not_cached: Method to test that error responses are not cached.
+        - test_new_model: Method to test that a new model is never answered from older responses.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Loads a model into the app and creates a test client.
+        """
+        load_test_model(self)
+        self.client = app.app.test_client()
+        self.cache = app.response_cache
+
+    def test_cached_responses(self):
+        for url in ['/api/issue/AVRO-2171/resolve-prediction', '/api/release/2018-06-01/resolved-since-now?limit=5', '/api/backlog?from=2018-04-01&to=2018-04-30']:
+            first = self.client.get(url)
+            hits = self.cache.hits
+            second = self.client.get(url)
+
+            self.assertEqual(self.cache.hits, hits + 1, url)
+            self.assertEqual((second.status_code, second.get_data()), (first.status_code, first.get_data()), url)
+            self.assertEqual(second.mimetype, 'application/json')
+
+        result = self.client.get('/api/release/2018-06-01/resolved-since-now?limit=5').get_json()
+        self.assertEqual(set(result), {'now', 'issues', 'total', 'next_cursor'})
+        self.assertEqual(len(result['issues']), min(5, result['total']))
+
+    def test_errors_not_cached(self):
+        for url in ['/api/release/not-a-date/resolved-since-now', '/api/release/2018-06-01/resolved-since-now?limit=0',
+                    '/api/backlog?status=Unknown']:
+            self.client.get(url)
+            hits = self.cache.hits
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(self.cache.hits, hits, url)
+
+        for query in ['limit=-1', 'cursor=abc']:
+            self.assertEqual(self.client.get('/api/release/2018-06-01/resolved-since-now?' + query).status_code, 400)
+
+    def test_new_model(self):
+        self.client.get('/api/issue/AVRO-2171/resolve-prediction')
+        load_test_model(self, constant=20.0)
+        hits = self.cache.hits
+
+        response = self.client.get('/api/issue/AVRO-2171/resolve-prediction')
+        self.assertEqual(self.cache.hits, hits)
+        self.assertEqual(response.get_json()['predicted_resolution_date'],
+                         app.snapshots.current.resolution_date('AVRO-2171'))
+
+
+
+class TestBottlenecks(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_bottlenecks: Method to test the transition matrix and dwell times served by the route.
+        - test_filters: Method to test the priority, issue type and date filters of the route.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Creates a test client, the route does not need a model.
+        """
+        self.client = app.app.test_client()
+
+    def test_bottlenecks(self):
+        response = self.client.get('/api/analytics/bottlenecks')
+        self.assertEqual(response.status_code, 200)
+
+        result = response.get_json()
+        self.assertEqual(set(result), {'statuses', 'total', 'matrix', 'transitions'})
+        self.assertEqual(result['total'], len(app.bottleneck_analytics))
+        self.assertEqual(sum(map(sum, result['matrix'])), result['total'])
+        self.assertEqual(set(result['transitions'][0]), {'from', 'to', 'count', 'median_days', 'p90_days'})
+        medians = [transition['median_days'] for transition in result['transitions']]
+        self.assertEqual(medians, sorted(medians, reverse=True))
+
+    def test_filters(self):
+        expected = app.bottleneck_analytics.query(['Major', 'Critical'], ['Bug'], '2017-01-01', '2018-01-01')
+        self.assertGreater(expected['total'], 0)
+
+        # Filters may be comma separated or repeated
+        for query in ['priority=Major,Critical&issue_type=Bug&from=2017-01-01&to=2018-01-01',
+                      'priority=Major&priority=Critical&issue_type=Bug&from=2017-01-01&to=2018-01-01']:
+            self.assertEqual(self.client.get('/api/analytics/bottlenecks?' + query).get_json(), expected)
+
+        self.assertEqual(self.client.get('/api/analytics/bottlenecks?priority=Unknown').get_json()['total'], 0)
+
+        response = self.client.get('/api/analytics/bottlenecks?from=not-a-date')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(), {'error': 'Invalid date, expected ISO-8601'})
+
+
+class TestConditionalRequests(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_etag: Method to test conditional requests with If-None-Match.
+        - test_modified_since: Method to test conditional requests with If-Modified-Since.
+        - test_unknown_key: Method to test that conditional requests for an unknown issue key are answered with 404.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Loads a model into the app, creates a test client and requests the prediction of AVRO-2171 once.
+        """
+        load_test_model(self)
+        self.client = app.app.test_client()
+        self.url = '/api/issue/AVRO-2171/resolve-prediction'
+        self.response = self.client.get(self.url)
+
+    def test_etag(self):
+        self.assertEqual(self.response.status_code, 200)
+        etag = self.response.headers['ETag']
+
+        for if_none_match in [etag, '*', '"other", ' + etag]:
+            response = self.client.get(self.url, headers={'If-None-Match': if_none_match})
+            self.assertEqual((response.status_code, response.get_data()), (304, b''), if_none_match)
+            self.assertEqual(response.headers['ETag'], etag)
+
+        response = self.client.get(self.url, headers={'If-None-Match': '"other"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['predicted_resolution_date'], '2018-04-27 21:53:05')
+
+    def test_modified_since(self):
+        last_modified = self.response.headers['Last-Modified']
+        self.assertEqual(self.client.get(self.url, headers={'If-Modified-Since': last_modified}).status_code, 304)
+        self.assertEqual(self.client.get(self.url, headers={'If-Modified-Since': 'Mon, 01 Jan 2018 00:00:00 GMT'})
+                         .status_code, 200)
+
+        # If-None-Match takes precedence over If-Modified-Since
+        response = self.client.get(self.url, headers={'If-None-Match': '"other"', 'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_key(self):
+        for headers in [{'If-None-Match': '*'}, {'If-Modified-Since': self.response.headers['Last-Modified']}]:
+            for key in ['AVRO-0', 'OTHER-1']:
+                response = self.client.get('/api/issue/{}/resolve-prediction'.format(key), headers=headers)
+                self.assertEqual(response.status_code, 404, (key, headers))
+                self.assertEqual(response.get_json(), {'error': 'Issue key not found'})
+
+
+class TestIngest(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_invalid_issues: Method to test that issues without a valid creation date or with a value of the wrong
+                               type are rejected with 400.
+        - test_admin_token: Method to test that only callers with the admin token may ingest issues.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Loads a model into the app, configures an admin token and creates a test client.
+        """
+        load_test_model(self)
+        self.headers = configure_admin_token(self)
+        self.client = app.app.test_client()
+
+    def test_invalid_issues(self):
+        data_version = app.get_issue_store().version
+
+        for issue, error in [({'key': 'AVRO-9998', 'status': 'Open'}, 'Every issue must have a "created"'),
+                             ({'key': 'AVRO-9998', 'status': 'Open', 'created': 'garbage'},
+                              'Invalid date, expected ISO-8601'),
+                             ({'key': 'AVRO-9998', 'status': 'Open', 'created': '2018-01-01T00:00:00.000+0000',
+                               'watch_count': 'abc'}, 'Invalid value of "watch_count", expected a number')]:
+            response = self.client.post('/api/issues/ingest', json=issue, headers=self.headers)
+            self.assertEqual(response.status_code, 400, issue)
+            self.assertEqual(response.get_json(), {'error': error})
+
+        # Nothing was ingested
+        self.assertNotIn('AVRO-9998', app.get_issue_store())
+        self.assertEqual(app.get_issue_store().version, data_version)
+        self.assertEqual(self.client.get('/api/issue/AVRO-9998/resolve-prediction').status_code, 404)
+
+    def test_admin_token(self):
+        # An invalid body, so an accepted request changes nothing
+        for headers in [{}, {'X-Admin-Token': 'other'}]:
+            self.assertEqual(self.client.post('/api/issues/ingest', json=[1], headers=headers).status_code, 403)
+        self.assertEqual(self.client.post('/api/issues/ingest', json=[1], headers=self.headers).status_code, 400)
+
+        # Without a token, admin requests are refused unless they are explicitly opened to any caller
+        with mock.patch.dict(os.environ, {'JIRA_ADMIN_TOKEN': ''}):
+            self.assertEqual(self.client.post('/api/issues/ingest', json=[1]).status_code, 403)
+            self.assertEqual(self.client.post('/api/admin/model/reload').status_code, 403)
+            with mock.patch.dict(os.environ, {'JIRA_ADMIN_OPEN': '1'}):
+                self.assertEqual(self.client.post('/api/issues/ingest', json=[1]).status_code, 400)
+
+
+class TestMissingPrediction(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_no_prediction: Method to test that both prediction routes answer 404 for an issue without a prediction.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Loads a model into the app and ingests an issue that was closed without a resolution date.
+        """
+        load_test_model(self)
+        self.client = app.app.test_client()
+        app.ingestor.ingest(records_to_frame([{'key': 'AVRO-99999', 'status': 'Closed',
+                                               'created': '2018-01-01T00:00:00.000+0000'}]))
+
+    def test_no_prediction(self):
+        self.assertIn('AVRO-99999', app.get_issue_store())
+
+        response = self.client.get('/api/issue/AVRO-99999/resolve-prediction')
+        self.assertEqual((response.status_code, response.get_json()), (404, {'error': 'No prediction for the issue'}))
+
+        response = self.client.post('/api/issues/resolve-prediction', json=['AVRO-99999'])
+        self.assertEqual(response.get_json()['issues'],
+                         [{'issue': 'AVRO-99999', 'error': 'No prediction for the issue', 'status': 404}])
+
+
+class TestReloadModel(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_reload: Method to test that every model is reloaded and its version returned, keyed by project.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Loads a model into the app, configures an admin token and serves the project AVRO with a model of its own
+        that predicts 20 days.
+        """
+        load_test_model(self)
+        self.headers = configure_admin_token(self)
+        self.client = app.app.test_client()
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.project_model_path = os.path.join(self.directory, 'AVRO.pkl')
+        joblib.dump(DummyRegressor(strategy='constant', constant=20.0).fit([[0]], [0]), self.project_model_path)
+
+        snapshots = ShardedSnapshotManager(app.get_issue_store(), app.model_registry, app.snapshots.default_encoder,
+                                           self.directory)
+        snapshots.rebuild()
+        patcher = mock.patch.object(app, 'snapshots', snapshots)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reload(self):
+        response = self.client.post('/api/admin/model/reload', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        project_version = app.snapshots.project_registries['AVRO'].version
+        self.assertEqual(response.get_json(), {'model_version': app.model_registry.version,
+                                               'project_model_versions': {'AVRO': project_version}})
+
+        # A new artifact of the project is loaded and predicted with
+        joblib.dump(DummyRegressor(strategy='constant', constant=30.0).fit([[0]], [0]), self.project_model_path)
+        os.utime(self.project_model_path, ns=(0, os.stat(self.project_model_path).st_mtime_ns + 10 ** 9))
+        result = self.client.post('/api/admin/model/reload', headers=self.headers).get_json()
+
+        self.assertNotEqual(result['project_model_versions']['AVRO'], project_version)
+        self.assertEqual(result['project_model_versions']['AVRO'], app.snapshots.project_registries['AVRO'].version)
+        result = self.client.get('/api/issue/AVRO-2171/resolve-prediction').get_json()
+        self.assertEqual(result['predicted_resolution_date'], '2018-05-17 21:53:05')
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from sklearn.dummy import DummyRegressor
+
+from asgi import AsyncAPI, CoalescingExecutor, Overloaded
+from datahelper import ISSUES_SCHEMA, ShardedIssueStore
+from ingest import IssueIngestor, records_to_frame
+from model_registry import ModelRegistry, joblib
+from preprocessing import FeatureEncoder
+from response_cache import LRUCache, ResponseCache
+from sharding import ShardedSnapshotManager
+
+
+async def call(app, path, query=b'', headers=()):
+    # Send a GET request to an ASGI app, and return the status, headers and body of the response
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'headers': list(headers)}
+    await app(scope, receive, send)
+    return messages[0]['status'], dict(messages[0]['headers']), messages[1]['body']
+
+
+class TestAsyncAPI(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_routes: Method to test the responses of the three routes.
+        - test_not_modified: Method to test conditional requests with If-None-Match.
+        - test_no_prediction: Method to test that an issue without a prediction is answered with 404.
+        - test_coalescing: Method to test that concurrent identical computations run once.
+        - test_backpressure: Method to test that a full queue is answered with 503 while cheap requests are served.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the raw data from CSV into an issue store, and builds the snapshots with a model that predicts every
+        issue to be resolved after 10 days.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        path = os.path.join(self.directory, 'model.pkl')
+        joblib.dump(DummyRegressor(strategy='constant', constant=10.0).fit([[0]], [0]), path)
+        model_registry = ModelRegistry(path)
+        model_registry.load()
+
+        # Read the raw data from CSV
+        df_avro_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+        self.store = ShardedIssueStore(df_avro_issues, 'v1', ISSUES_SCHEMA)
+        self.snapshots = ShardedSnapshotManager(self.store, model_registry, FeatureEncoder().fit(df_avro_issues),
+                                                self.directory)
+        self.snapshots.rebuild()
+
+        self.executor = ThreadPoolExecutor(2)
+        self.addCleanup(self.executor.shutdown)
+        self.app = AsyncAPI(self.snapshots, self.store, ResponseCache(LRUCache(100)), self.executor, max_pending=2)
+
+    def test_routes(self):
+        status, _, body = asyncio.run(call(self.app, '/api/issue/AVRO-1/resolve-fake3'))
+        self.assertEqual((status, json.loads(body)['predicted_resolution_date']), (200, '1970-01-01T00:00:00.000+0000'))
+
+        status, headers, body = asyncio.run(call(self.app, '/api/issue/AVRO-2171/resolve-prediction'))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {'issue': 'AVRO-2171', 'predicted_resolution_date': '2018-04-27 21:53:05'})
+        self.assertIn(b'etag', headers)
+        self.assertEqual(asyncio.run(call(self.app, '/api/issue/AVRO-9999/resolve-prediction'))[0], 404)
+        self.assertEqual(asyncio.run(call(self.app, '/api/issue/OTHER-1/resolve-prediction'))[0], 404)
+
+        date_index = self.snapshots.current.date_index
+        status, _, body = asyncio.run(call(self.app, '/api/release/2100-01-01/resolved-since-now', b'limit=2'))
+        self.assertEqual(status, 200)
+        result = json.loads(body)
+        self.assertEqual([issue['issue'] for issue in result['issues']], list(date_index.keys[:2]))
+        self.assertEqual((result['total'], result['next_cursor']), (len(date_index), '2'))
+
+        # The second request is served from the response cache
+        self.assertEqual(asyncio.run(call(self.app, '/api/release/2100-01-01/resolved-since-now', b'limit=2'))[2], body)
+        self.assertEqual(self.app.response_cache.hits, 1)
+
+        self.assertEqual(asyncio.run(call(self.app, '/api/release/not-a-date/resolved-since-now'))[0], 400)
+        self.assertEqual(asyncio.run(call(self.app, '/api/release/2100-01-01/resolved-since-now', b'limit=-1'))[0], 400)
+        self.assertEqual(asyncio.run(call(self.app, '/api/release/2100-01-01/resolved-since-now', b'limit=0'))[0], 400)
+        self.assertEqual(asyncio.run(call(self.app, '/api/release/2100-01-01/resolved-since-now', b'project=X'))[0], 404)
+        self.assertEqual(asyncio.run(call(self.app, '/api/unknown'))[0], 404)
+
+    def test_not_modified(self):
+        _, headers, _ = asyncio.run(call(self.app, '/api/release/2100-01-01/resolved-since-now'))
+
+        status, _, body = asyncio.run(call(self.app, '/api/release/2100-01-01/resolved-since-now',
+                                           headers=[(b'if-none-match', headers[b'etag'])]))
+        self.assertEqual((status, body), (304, b''))
+        status, _, _ = asyncio.run(call(self.app, '/api/release/2100-01-01/resolved-since-now',
+                                        headers=[(b'if-none-match', b'"other"')]))
+        self.assertEqual(status, 200)
+
+    def test_no_prediction(self):
+        IssueIngestor(self.store, self.snapshots).ingest(records_to_frame([
+            {'key': 'AVRO-99999', 'status': 'Closed', 'created': '2018-01-01T00:00:00.000+0000'}]))
+
+        status, _, body = asyncio.run(call(self.app, '/api/issue/AVRO-99999/resolve-prediction'))
+        self.assertEqual((status, json.loads(body)), (404, {'error': 'No prediction for the issue'}))
+
+    def test_coalescing(self):
+        computations = CoalescingExecutor(self.executor, max_pending=2)
+        release = threading.Event()
+        calls = []
+
+        def compute(value):
+            calls.append(value)
+            release.wait(5)
+            return value * 2
+
+        async def run():
+            tasks = [asyncio.ensure_future(computations.run(key, compute, key)) for key in [1, 1, 1, 2]]
+            await asyncio.sleep(0)
+            # Two computations are pending, a third one is rejected while identical requests still join them
+            with self.assertRaises(Overloaded):
+                await computations.run(3, compute, 3)
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        self.assertEqual(asyncio.run(run()), [2, 2, 2, 4])
+        self.assertEqual(sorted(calls), [1, 2])
+        self.assertEqual((computations.coalesced, computations.rejected, len(computations)), (2, 1, 0))
+
+    def test_backpressure(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        async def run():
+            # Fill the queue with slow computations
+            blocked = [asyncio.ensure_future(self.app.computations.run(key, release.wait, 5)) for key in ['a', 'b']]
+            await asyncio.sleep(0)
+
+            status, headers, _ = await call(self.app, '/api/release/2100-01-01/resolved-since-now')
+            self.assertEqual((status, headers[b'retry-after']), (503, b'1'))
+
+            # Requests that need no computation are still served
+            self.assertEqual((await call(self.app, '/api/issue/AVRO-1/resolve-fake3'))[0], 200)
+            self.assertEqual((await call(self.app, '/api/issue/AVRO-2171/resolve-prediction'))[0], 200)
+
+            release.set()
+            await asyncio.gather(*blocked)
+            return await call(self.app, '/api/release/2100-01-01/resolved-since-now')
+
+        self.assertEqual(asyncio.run(run())[0], 200)
+        self.assertEqual(self.app.computations.rejected, 1)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,108 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backlog import BacklogSeries
+
+
+class TestBacklogSeries(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_history: Method to test the history against the daily counts.
+        - test_missing_days: Method to test that days without counts repeat the previous day.
+        - test_forecast: Method to test the forecast against counting the open issues of every day.
+        - test_forecast_continues_history: Method to test that the forecast continues from the end of the history.
+        - test_invalid_query: Method to test the errors of invalid queries.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the daily counts from CSV and pivots them.
+        """
+
+        # Read the raw data from CSV
+        self.df_avro_daycounts = pd.read_csv('../data/avro-daycounts.csv')
+        self.backlog = BacklogSeries(self.df_avro_daycounts)
+
+    def test_history(self):
+        result = self.backlog.query('2018-04-20', '2018-04-23', ['Open', 'Patch Available'])
+
+        history = result['history']
+        self.assertEqual(history['days'], ['2018-04-20', '2018-04-21', '2018-04-22', '2018-04-23'])
+        self.assertNotIn('forecast', result)
+
+        daycounts = self.df_avro_daycounts[self.df_avro_daycounts['day'].str.startswith('2018-04-23')]
+        counts = dict(zip(daycounts['status'], daycounts['count']))
+        self.assertEqual(history['counts']['Open'][-1], counts['Open'])
+        self.assertEqual(history['counts']['Patch Available'][-1], counts['Patch Available'])
+        self.assertEqual(history['open'][-1],
+                         counts['Open'] + counts['In Progress'] + counts['Patch Available'] + counts['Reopened'])
+
+        # All days and statuses by default
+        history = self.backlog.query(resolution_epochs=None)['history']
+        self.assertEqual(len(history['days']), self.df_avro_daycounts['day'].nunique())
+        self.assertEqual(set(history['counts']), set(self.df_avro_daycounts['status']))
+
+    def test_missing_days(self):
+        daycounts = pd.DataFrame({
+            'day': ['2018-01-01T10:00:00+00:00', '2018-01-01T10:00:00+00:00', '2018-01-04T10:00:00+00:00'],
+            'status': ['Open', 'Closed', 'Open'],
+            'count': [3, 1, 5],
+        })
+
+        history = BacklogSeries(daycounts).query()['history']
+
+        self.assertEqual(history['days'], ['2018-01-01', '2018-01-02', '2018-01-03', '2018-01-04'])
+        self.assertEqual(history['counts']['Open'], [3, 3, 3, 5])
+        self.assertEqual(history['open'], [3, 3, 3, 5])
+
+    def test_forecast(self):
+        generator = np.random.default_rng(0)
+        resolution_dates = pd.Timestamp('2018-04-10') + pd.to_timedelta(generator.integers(0, 120 * 86400, 500), unit='s')
+        epochs = resolution_dates.values.astype('datetime64[s]').astype(np.int64)
+
+        forecast = self.backlog.query('2018-04-01', '2018-06-30', resolution_epochs=epochs)['forecast']
+
+        # The forecast starts the day after the history
+        self.assertEqual(forecast['days'][0], '2018-04-24')
+        self.assertEqual(forecast['days'][-1], '2018-06-30')
+        # The issues predicted before the first forecast day are overdue and left out
+        first_day = pd.Timestamp('2018-04-24')
+        self.assertEqual(forecast['overdue'], int((resolution_dates < first_day).sum()))
+        # The open issues at the end of the history, less those resolved by the end of every day (never below zero)
+        resolved = [int(((resolution_dates >= first_day) &
+                         (resolution_dates < pd.Timestamp(day) + pd.Timedelta(days=1))).sum()) for day in forecast['days']]
+        expected = [max(self.backlog.last_open_count - count, 0) for count in resolved]
+        self.assertEqual(forecast['open'], expected)
+
+    def test_forecast_continues_history(self):
+        # Most of the open issues are overdue, as in the predictions of the API
+        epochs = pd.to_datetime(['2017-01-01'] * 600 + ['2018-04-25', '2018-04-25', '2018-05-02']).values
+        epochs = epochs.astype('datetime64[s]').astype(np.int64)
+
+        result = self.backlog.query('2018-04-20', '2018-05-05', resolution_epochs=epochs)
+        history_open = result['history']['open'][-1]
+        forecast = result['forecast']
+
+        self.assertEqual(history_open, self.backlog.last_open_count)
+        self.assertEqual(forecast['overdue'], 600)
+        self.assertEqual(forecast['open'][:3], [history_open, history_open - 2, history_open - 2])
+        self.assertEqual(forecast['open'][-1], history_open - 3)
+
+        # A forecast that starts after the history still counts the resolutions in between
+        later = self.backlog.query('2018-05-01', '2018-05-05', resolution_epochs=epochs)['forecast']
+        self.assertEqual(later['days'][0], '2018-05-01')
+        self.assertEqual(later['open'], forecast['open'][-5:])
+
+    def test_invalid_query(self):
+        for query in [{'start': 'not a date'}, {'statuses': ['Unknown']}, {'start': '1900-01-01', 'end': '2200-01-01'}]:
+            with self.assertRaises(ValueError):
+                self.backlog.query(**query)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
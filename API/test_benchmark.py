@@ -0,0 +1,73 @@
+import unittest
+
+import pandas as pd
+from sklearn.dummy import DummyRegressor
+
+from benchmark import compare_results, generate_issues, run_benchmarks
+from preprocessing import parse_datetime_columns
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_generate_issues: Method to test the shape and distributions of the generated issues.
+        - test_run_and_compare: Method to test a small benchmark run and its comparison with a baseline.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the raw data from CSV to generate issues from.
+        """
+
+        # Read the raw data from CSV
+        self.df_avro_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+
+    def test_generate_issues(self):
+        issues = generate_issues(5000, seed=1, source=self.df_avro_issues)
+
+        self.assertEqual(list(issues.columns), list(self.df_avro_issues.columns))
+        self.assertEqual(len(issues), 5000)
+        self.assertTrue(issues['key'].is_unique)
+        self.assertEqual(issues['key'].iloc[0], 'AVRO-5000')
+
+        # The same seed generates the same issues
+        pd.testing.assert_frame_equal(issues, generate_issues(5000, seed=1, source=self.df_avro_issues))
+
+        # Same status distribution as the source
+        expected = self.df_avro_issues['status'].value_counts(normalize=True)
+        actual = issues['status'].value_counts(normalize=True).reindex(expected.index, fill_value=0)
+        self.assertLess((expected - actual).abs().max(), 0.03)
+
+        # Only resolved issues have a resolution date, which comes after the creation date, newest issues first
+        parsed = parse_datetime_columns(issues)
+        resolved = parsed['status'].isin(['Resolved', 'Closed'])
+        self.assertTrue(parsed.loc[resolved, 'resolutiondate'].notna().all())
+        self.assertTrue(parsed.loc[~resolved, 'resolutiondate'].isna().all())
+        self.assertTrue((parsed.loc[resolved, 'resolutiondate'] >= parsed.loc[resolved, 'created']).all())
+        self.assertTrue(parsed['created'].is_monotonic_decreasing)
+
+    def test_run_and_compare(self):
+        # Predict with a constant model instead of fitting a stand-in
+        model = DummyRegressor(strategy='constant', constant=10.0).fit([[0]], [0])
+
+        results = run_benchmarks(sizes=[200], repeat=2, model=model)
+
+        names = [result['name'] for result in results['results']]
+        self.assertEqual(names, ['preprocess_data', 'predict_resolution_date', 'predict_resolution_date_key',
+                                 'predict_resolution_date_key_encoder', 'get_issues_till_date'])
+        self.assertTrue(all(len(result['runs']) == 2 and result['rows'] == 200 for result in results['results']))
+        self.assertEqual(results['meta']['model'], 'DummyRegressor')
+
+        # A baseline twice as fast makes every benchmark a regression, one twice as slow none
+        faster = {'results': [dict(result, median=result['median'] / 2) for result in results['results']]}
+        slower = {'results': [dict(result, median=result['median'] * 2) for result in results['results']]}
+        self.assertTrue(all(entry['regression'] for entry in compare_results(results, faster)))
+        self.assertFalse(any(entry['regression'] for entry in compare_results(results, slower)))
+        self.assertEqual(compare_results(results, {'results': []}), [])
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from csvcache import cache_stats, read_csv_cached
+from preprocessing import parse_datetime_columns
+
+
+class TestReadCsvCached(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_cached_load: Method to test that a cached load returns the same data as parsing the CSV.
+        - test_transform: Method to test caching transformed data.
+        - test_invalidation: Method to test that changing the CSV invalidates the cache and removes the old entry.
+        - test_touched_file: Method to test that a new modification time alone does not invalidate the cache.
+        - test_same_file_name: Method to test that files with the same name in different directories are cached apart.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Copies the raw data CSV into a temporary directory that also holds the cache.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.path = os.path.join(self.directory, 'issues.csv')
+        shutil.copy('../data/for testing df_avro_issues raw data.csv', self.path)
+        self.cache_dir = os.path.join(self.directory, 'cache')
+
+        # Read the raw data from CSV
+        self.df_avro_issues = pd.read_csv(self.path)
+
+    def read(self, **kwargs):
+        hits = cache_stats['hits']
+        df = read_csv_cached(self.path, cache_dir=self.cache_dir, **kwargs)
+        return df, cache_stats['hits'] > hits
+
+    def test_cached_load(self):
+        first, first_hit = self.read()
+        second, second_hit = self.read()
+
+        self.assertFalse(first_hit)
+        self.assertTrue(second_hit)
+        pd.testing.assert_frame_equal(second, self.df_avro_issues)
+
+    def test_transform(self):
+        self.read(transform=parse_datetime_columns, cache_key='datetimes')
+        result, hit = self.read(transform=parse_datetime_columns, cache_key='datetimes')
+
+        self.assertTrue(hit)
+        pd.testing.assert_frame_equal(result, parse_datetime_columns(self.df_avro_issues))
+
+        # A different transform is cached separately
+        _, hit = self.read()
+        self.assertFalse(hit)
+
+    def test_invalidation(self):
+        self.read()
+
+        self.df_avro_issues.head(10).to_csv(self.path, index=False)
+        result, hit = self.read()
+
+        self.assertFalse(hit)
+        self.assertEqual(len(result), 10)
+
+        # Only the entry of the current content is kept
+        self.assertEqual(len([entry for entry in os.listdir(self.cache_dir) if not entry.endswith('.json')]), 1)
+
+    def test_touched_file(self):
+        self.read()
+
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        result, hit = self.read()
+
+        self.assertTrue(hit)
+        pd.testing.assert_frame_equal(result, self.df_avro_issues)
+
+    def test_same_file_name(self):
+        # A file of the same name, size and modification time in another directory, with another first issue
+        other_path = os.path.join(self.directory, 'other', 'issues.csv')
+        os.makedirs(os.path.dirname(other_path))
+        with open(self.path) as source_file:
+            content = source_file.read()
+        with open(other_path, 'w') as other_file:
+            other_file.write(content.replace('AVRO-2171', 'AVRO-9171', 1))
+        stat = os.stat(self.path)
+        os.utime(other_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        self.read()
+        other = read_csv_cached(other_path, cache_dir=self.cache_dir)
+        result, hit = self.read()
+
+        self.assertEqual(other['key'].iloc[0], 'AVRO-9171')
+        self.assertTrue(hit)
+        pd.testing.assert_frame_equal(result, self.df_avro_issues)
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,137 @@
+import unittest
+
+import pandas as pd
+
+from datahelper import ISSUES_SCHEMA, IssueStore
+from preprocessing import parse_datetime_columns
+
+
+class TestIssueStore(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_lookup: Method to test existence checks and row fetches by key.
+        - test_take: Method to test fetching several rows at once.
+        - test_upsert: Method to test that updates keep the index in sync.
+        - test_upsert_version: Method to test that the version after an update is derived from the data.
+        - test_schema: Method to test that the declared dtypes survive updates.
+        - test_schema_keeps_codes: Method to test that an update appends new categories without encoding the stored ones.
+        - test_invalid_values: Method to test that a value of the wrong type is rejected without changing the data.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the raw data from CSV into an issue store.
+        """
+
+        # Read the raw data from CSV
+        self.df_avro_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+
+        self.store = IssueStore(self.df_avro_issues, 'v1')
+
+    def test_lookup(self):
+        self.assertIn('AVRO-2171', self.store)
+        self.assertNotIn('AVRO-0', self.store)
+
+        issue = self.store.get('AVRO-2170')
+        expected_issue = parse_datetime_columns(self.df_avro_issues[self.df_avro_issues['key'] == 'AVRO-2170'])
+        pd.testing.assert_frame_equal(issue, expected_issue)
+
+        self.assertTrue(self.store.get('AVRO-0').empty)
+
+    def test_take(self):
+        issues = self.store.take(['AVRO-2170', 'AVRO-0', 'AVRO-2171'])
+
+        self.assertEqual(list(issues['key']), ['AVRO-2170', 'AVRO-2171'])
+
+    def test_upsert(self):
+        issues_before = self.store.issues
+
+        rows = self.store.get('AVRO-2171').copy()
+        rows['status'] = 'Resolved'
+        new_issue = rows.copy()
+        new_issue['key'] = 'AVRO-9999'
+
+        version = self.store.upsert(pd.concat([rows, new_issue]))
+
+        self.assertNotEqual(version, 'v1')
+        self.assertEqual(self.store.version, version)
+        self.assertEqual(len(self.store), len(self.df_avro_issues) + 1)
+        self.assertEqual(self.store.position('AVRO-2171'), 0)
+        self.assertEqual(self.store.get('AVRO-2171')['status'].iloc[0], 'Resolved')
+        self.assertEqual(self.store.position('AVRO-9999'), len(self.df_avro_issues))
+        self.assertEqual(self.store.get('AVRO-9999')['key'].iloc[0], 'AVRO-9999')
+        self.assertTrue(pd.api.types.is_datetime64_dtype(self.store.issues['created']))
+
+        # The data published before the update is left untouched
+        self.assertEqual(issues_before['status'].iloc[0], 'In Progress')
+        self.assertEqual(len(issues_before), len(self.df_avro_issues))
+
+    def test_upsert_version(self):
+        rows = self.store.get('AVRO-2171').copy()
+        rows['status'] = 'Resolved'
+
+        # Stores that applied the same updates (e.g. in different worker processes) have the same version
+        other_store = IssueStore(self.df_avro_issues, 'v1')
+        self.assertEqual(self.store.upsert(rows), other_store.upsert(rows.copy()))
+        self.assertTrue(self.store.version.startswith('v1+'))
+
+        # Different updates give different versions, and every update changes the version
+        rows['status'] = 'Closed'
+        self.assertNotEqual(self.store.upsert(rows), other_store.upsert(self.store.get('AVRO-2170')))
+        version = self.store.version
+        self.assertNotEqual(self.store.upsert(rows), version)
+
+    def test_schema(self):
+        store = IssueStore(self.df_avro_issues, 'v1', ISSUES_SCHEMA)
+
+        self.assertIsInstance(store.issues['status'].dtype, pd.CategoricalDtype)
+        self.assertEqual(store.issues['vote_count'].dtype, 'int8')
+        self.assertEqual(store.issues['description_length'].dtype, 'float32')
+        self.assertLess(store.issues.memory_usage(deep=True).sum(), self.df_avro_issues.memory_usage(deep=True).sum())
+
+        # An unseen category and a larger count are added without losing the declared dtypes
+        rows = store.get('AVRO-2171').copy()
+        rows['status'] = rows['status'].cat.add_categories('Triage')
+        rows['status'] = 'Triage'
+        rows['vote_count'] = 1000
+        store.upsert(rows)
+
+        self.assertIsInstance(store.issues['status'].dtype, pd.CategoricalDtype)
+        self.assertEqual(store.get('AVRO-2171')['status'].iloc[0], 'Triage')
+        self.assertEqual(store.issues['vote_count'].dtype, 'int16')
+        self.assertEqual(store.get('AVRO-2171')['vote_count'].iloc[0], 1000)
+
+    def test_schema_keeps_codes(self):
+        store = IssueStore(self.df_avro_issues, 'v1', ISSUES_SCHEMA)
+        categories = store.issues['priority'].cat.categories
+        codes = store.issues['priority'].cat.codes.to_numpy()
+
+        # The rows arrive as raw values, one of them a new priority
+        rows = self.df_avro_issues[self.df_avro_issues['key'].isin(['AVRO-2171', 'AVRO-2170'])].copy()
+        rows['priority'] = ['Urgent', 'Major']
+        new_issue = rows.iloc[[0]].assign(key='AVRO-9999', priority='Minor')
+        store.upsert(pd.concat([rows, new_issue]))
+
+        priority = store.issues['priority']
+        self.assertEqual(list(priority.cat.categories), list(categories) + ['Urgent'])
+        # The codes of the other issues are unchanged, the upserted issues are decoded to their new values
+        self.assertTrue((priority.cat.codes.to_numpy()[2:len(codes)] == codes[2:]).all())
+        self.assertEqual(list(store.take(['AVRO-2171', 'AVRO-2170', 'AVRO-9999'])['priority']),
+                         ['Urgent', 'Major', 'Minor'])
+        self.assertEqual(list(store.issues.index), list(range(len(self.df_avro_issues) + 1)))
+        self.assertTrue(pd.api.types.is_datetime64_dtype(store.issues['created']))
+
+    def test_invalid_values(self):
+        store = IssueStore(self.df_avro_issues, 'v1', ISSUES_SCHEMA)
+        rows = self.df_avro_issues[self.df_avro_issues['key'] == 'AVRO-2171'].assign(watch_count='abc')
+
+        with self.assertRaisesRegex(ValueError, 'watch_count'):
+            store.upsert(rows)
+        self.assertEqual(store.version, 'v1')
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
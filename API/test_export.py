@@ -0,0 +1,54 @@
+import gzip
+import io
+import json
+import unittest
+
+import pandas as pd
+
+from export import gzip_stream, iter_export
+
+
+class TestExport(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_ndjson: Method to test the NDJSON export.
+        - test_csv: Method to test the CSV export.
+        - test_gzip: Method to test compressing an export.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the expected predictions from CSV.
+        """
+
+        # Read the predicted dataframe from CSV
+        self.predictions = pd.read_csv('../data/for testing final_resolution_date_df after predicting.csv')
+        self.predictions['days_since_created'] = pd.to_timedelta(self.predictions['days_since_created'])
+
+    def test_ndjson(self):
+        chunks = list(iter_export(self.predictions, 'ndjson', chunk_size=500))
+
+        self.assertEqual(len(chunks), 5)
+        records = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()]
+        self.assertEqual(len(records), len(self.predictions))
+        self.assertEqual(records[0]['key'], 'AVRO-2171')
+        self.assertEqual(records[0]['resolutiondate'], '2018-04-24 07:30:24')
+        self.assertAlmostEqual(records[0]['days_since_created'], 6.40091, places=4)
+
+    def test_csv(self):
+        result = pd.read_csv(io.BytesIO(b''.join(iter_export(self.predictions, 'csv', chunk_size=500))))
+
+        self.assertEqual(list(result.columns), list(self.predictions.columns))
+        pd.testing.assert_series_equal(result['key'], self.predictions['key'])
+
+    def test_gzip(self):
+        chunks = list(iter_export(self.predictions, 'csv', chunk_size=500))
+
+        self.assertEqual(gzip.decompress(b''.join(gzip_stream(chunks))), b''.join(chunks))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+import numpy as np
+import pandas as pd
+from sklearn.dummy import DummyRegressor
+from sklearn.ensemble import RandomForestRegressor
+
+from forest import FlatForest, export_forest
+from model_registry import ModelRegistry, joblib
+
+
+class TestFlatForest(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_predict_matches_sklearn: Method to test that the flat forest predicts like the scikit-learn forest.
+        - test_missing_values: Method to test that missing values follow the same branches as in scikit-learn.
+        - test_export: Method to test exporting a pickled forest and loading it in the model registry.
+        - test_serving_without_sklearn: Method to test that the app serves an exported forest without importing
+                                        scikit-learn, while a pickled model imports it.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Fits a small random forest on random features with the feature columns of the issues data.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        random = np.random.RandomState(0)
+        self.X = pd.DataFrame(random.normal(size=(500, 6)),
+                              columns=['description_length', 'summary_length', 'watch_count', 'comment_count',
+                                       'priority_Major', 'issue_type_Bug'])
+        self.y = self.X['description_length'] * 3 + random.normal(size=500)
+        self.model = RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0).fit(self.X, self.y)
+
+    def test_predict_matches_sklearn(self):
+        forest = FlatForest.from_model(self.model)
+
+        self.assertEqual(forest.n_estimators, 20)
+        np.testing.assert_allclose(forest.predict(self.X), self.model.predict(self.X), rtol=1e-9)
+
+        # Columns are taken in the order the forest was fitted with, and batches do not change the result
+        shuffled = self.X[self.X.columns[::-1]]
+        np.testing.assert_allclose(forest.predict(shuffled, batch_size=7), self.model.predict(self.X), rtol=1e-9)
+
+        with self.assertRaises(ValueError):
+            forest.predict(self.X.values[:, :3])
+
+    def test_missing_values(self):
+        X = self.X.copy()
+        X.iloc[::5, 0] = np.nan
+        model = RandomForestRegressor(n_estimators=10, random_state=0).fit(X, self.y)
+
+        np.testing.assert_allclose(FlatForest.from_model(model).predict(X), model.predict(X), rtol=1e-9)
+
+    def test_export(self):
+        model_path = os.path.join(self.directory, 'model.pkl')
+        joblib.dump(self.model, model_path)
+        with open(os.path.join(self.directory, 'model_encoder.json'), 'w') as encoder_file:
+            encoder_file.write('{"feature_columns": [], "vocabularies": {}, "fill_values": {}}')
+
+        forest_path = export_forest(model_path)
+
+        self.assertEqual(forest_path, os.path.join(self.directory, 'model.npz'))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'model_encoder.json')))
+
+        loaded = ModelRegistry(forest_path).load()
+        self.assertIsInstance(loaded.model, FlatForest)
+        self.assertIsNotNone(loaded.encoder)
+        self.assertEqual(loaded.model.feature_names_in_, list(self.X.columns))
+        np.testing.assert_allclose(loaded.model.predict(self.X), self.model.predict(self.X), rtol=1e-9)
+
+    def test_serving_without_sklearn(self):
+        model_path = os.path.join(self.directory, 'model.pkl')
+        joblib.dump(self.model, model_path)
+        forest_path = export_forest(model_path)
+
+        # A fresh process, so nothing imported scikit-learn before the app
+        script = textwrap.dedent('''
+            import json
+            import sys
+            import app
+
+            status = app.app.test_client().get('/api/issue/AVRO-2171/resolve-prediction').status_code
+            print(json.dumps([status, 'sklearn' in sys.modules]))
+        ''')
+        # Any pickled scikit-learn model imports scikit-learn when it is unpickled
+        pickle_path = os.path.join(self.directory, 'dummy.pkl')
+        joblib.dump(DummyRegressor(strategy='constant', constant=10.0).fit([[0]], [0]), pickle_path)
+
+        for path, imports_sklearn in [(forest_path, False), (pickle_path, True)]:
+            environment = dict(os.environ, JIRA_MODEL_PATH=path, JIRA_DEFER_BACKGROUND_TASKS='1')
+            output = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    env=environment, capture_output=True, text=True, check=True).stdout
+            self.assertEqual(json.loads(output.splitlines()[-1]), [200, imports_sklearn], path)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from sklearn.dummy import DummyRegressor
+
+from datahelper import ISSUES_SCHEMA, IssueStore
+from ingest import IssueFileTailer, IssueIngestor, records_to_frame
+from model_registry import ModelRegistry, joblib
+from preprocessing import FeatureEncoder
+from snapshot import SnapshotManager
+
+
+class TestIngest(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_ingest: Method to test that ingested issues are upserted and re-scored.
+        - test_records_to_frame: Method to test the validation of ingested issues.
+        - test_tail_ndjson: Method to test following a file of newline delimited JSON issues.
+        - test_tail_csv: Method to test following a CSV file of issues.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the raw data from CSV into an issue store, and builds a snapshot with a model that predicts every issue
+        to be resolved after 10 days.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        path = os.path.join(self.directory, 'model.pkl')
+        joblib.dump(DummyRegressor(strategy='constant', constant=10.0).fit([[0]], [0]), path)
+        model_registry = ModelRegistry(path)
+        model_registry.load()
+
+        # Read the raw data from CSV
+        self.df_avro_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+        self.store = IssueStore(self.df_avro_issues, 'v1', ISSUES_SCHEMA)
+
+        self.snapshots = SnapshotManager(model_registry, lambda: self.store.issues, lambda: self.store.version,
+                                         FeatureEncoder().fit(self.df_avro_issues))
+        self.snapshots.rebuild()
+        self.ingestor = IssueIngestor(self.store, self.snapshots)
+
+        self.new_issue = {
+            'key': 'AVRO-9999', 'status': 'Open', 'priority': 'Major', 'issue_type': 'Bug',
+            'created': '2018-05-01T10:00:00.000+0000', 'updated': '2018-05-01T10:00:00.000+0000',
+            'description_length': 120, 'summary_length': 40, 'watch_count': 1, 'comment_count': 0,
+        }
+
+    def test_ingest(self):
+        snapshot_before = self.snapshots.current
+        # AVRO-2170 gets resolved, AVRO-9999 is new
+        resolved_issue = dict(self.df_avro_issues[self.df_avro_issues['key'] == 'AVRO-2170'].iloc[0].dropna(),
+                              status='Resolved', resolutiondate='2018-04-25T08:00:00.000+0000')
+
+        result = self.ingestor.ingest(records_to_frame([resolved_issue, self.new_issue]))
+
+        self.assertEqual(result, {'data_version': self.store.version, 'inserted': 1, 'updated': 1})
+        snapshot = self.snapshots.current
+        self.assertEqual(snapshot.data_version, self.store.version)
+        self.assertFalse(self.snapshots.is_stale())
+        self.assertEqual(snapshot.resolution_date('AVRO-2170'), '2018-04-25 08:00:00')
+        self.assertEqual(snapshot.resolution_date('AVRO-9999'), '2018-05-11 10:00:00')
+        self.assertNotIn('AVRO-2170', snapshot.date_index.keys)
+        self.assertIn('AVRO-9999', snapshot.date_index.keys)
+
+        # The published snapshot was left untouched
+        self.assertIsNone(snapshot_before.resolution_date('AVRO-9999'))
+
+        # Same result as predicting all issues again
+        rebuilt = self.snapshots.rebuild()
+        self.assertEqual(snapshot.resolution_dates, rebuilt.resolution_dates)
+        self.assertEqual(list(snapshot.date_index.epochs), list(rebuilt.date_index.epochs))
+        self.assertEqual(sorted(snapshot.date_index.keys), sorted(rebuilt.date_index.keys))
+        self.assertEqual(list(snapshot.predictions['key']), list(rebuilt.predictions['key']))
+
+    def test_records_to_frame(self):
+        self.assertEqual(list(records_to_frame([self.new_issue])['key']), ['AVRO-9999'])
+
+        self.assertTrue(pd.api.types.is_datetime64_dtype(records_to_frame([self.new_issue])['created']))
+
+        for records in [[{'status': 'Open'}], [{'key': 1}], ['AVRO-1'],
+                        [{'key': 'AVRO-9998', 'status': 'Open'}],
+                        [{'key': 'AVRO-9998', 'created': '2018-05-01T10:00:00.000+0000'}],
+                        [dict(self.new_issue, created='garbage')],
+                        [dict(self.new_issue, updated='garbage')],
+                        [dict(self.new_issue, watch_count='abc')]]:
+            with self.assertRaises(ValueError):
+                records_to_frame(records)
+
+    def test_tail_ndjson(self):
+        path = os.path.join(self.directory, 'issues.ndjson')
+        tailer = IssueFileTailer(path, self.ingestor)
+        self.assertEqual(tailer.poll(), 0)
+
+        # The partially written second line is only read once it is complete
+        with open(path, 'w') as tailed_file:
+            tailed_file.write(json.dumps(self.new_issue) + '\n' + '{"key": "AVRO-99')
+        self.assertEqual(tailer.poll(), 1)
+        self.assertIn('AVRO-9999', self.store)
+
+        with open(path, 'a') as tailed_file:
+            tailed_file.write('98", "status": "Open", "created": "2018-05-02T10:00:00.000+0000"}\n')
+        self.assertEqual(tailer.poll(), 1)
+        self.assertEqual(tailer.poll(), 0)
+        self.assertIn('AVRO-9998', self.store)
+        self.assertEqual(self.snapshots.current.data_version, self.store.version)
+
+    def test_tail_csv(self):
+        path = os.path.join(self.directory, 'issues.csv')
+        tailer = IssueFileTailer(path, self.ingestor)
+
+        with open(path, 'w') as tailed_file:
+            tailed_file.write(','.join(self.new_issue) + '\n')
+        self.assertEqual(tailer.poll(), 0)
+
+        with open(path, 'a') as tailed_file:
+            tailed_file.write(','.join(str(value) for value in self.new_issue.values()) + '\n')
+        self.assertEqual(tailer.poll(), 1)
+        self.assertEqual(self.snapshots.current.resolution_date('AVRO-9999'), '2018-05-11 10:00:00')
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
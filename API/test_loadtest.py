@@ -0,0 +1,102 @@
+import unittest
+
+from flask import Flask, jsonify
+
+from loadtest import LocalServer, build_plan, check_budgets, parse_budget, parse_mix, run_load, summarize
+
+
+class TestLoadTest(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_build_plan: Method to test that the request mix is drawn reproducibly.
+        - test_mix: Method to test a request mix and page size given on the command line.
+        - test_run_load: Method to test a load test against a local server and its summary.
+        - test_budgets: Method to test the latency budgets.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Creates an app with the routes of the API that answers from a dictionary of resolution dates.
+        """
+        resolution_dates = {'AVRO-1': '2018-01-01 00:00:00', 'AVRO-2': '2018-02-01 00:00:00'}
+        self.app = Flask(__name__)
+
+        @self.app.route('/api/issue/<issue_key>/resolve-fake3')
+        def resolve_fake3(issue_key):
+            return jsonify({'issue': issue_key, 'predicted_resolution_date': '1970-01-01T00:00:00.000+0000'})
+
+        @self.app.route('/api/issue/<issue_key>/resolve-prediction')
+        def resolve_predict(issue_key):
+            if issue_key not in resolution_dates:
+                return jsonify({'error': 'Issue key not found'}), 404
+            return jsonify({'issue': issue_key, 'predicted_resolution_date': resolution_dates[issue_key]})
+
+        @self.app.route('/api/release/<date>/resolved-since-now')
+        def resolved_since_now(date):
+            return jsonify({'now': date, 'issues': []})
+
+        self.keys = list(resolution_dates)
+        self.dates = ['2017-06-30', '2018-06-30']
+
+    def test_build_plan(self):
+        plan = build_plan(500, self.keys, self.dates, seed=3)
+
+        self.assertEqual(plan, build_plan(500, self.keys, self.dates, seed=3))
+        self.assertEqual(set(name for name, _, _ in plan),
+                         {'resolve-fake3', 'resolve-prediction', 'resolve-prediction-missing', 'resolved-since-now'})
+        # resolve-prediction has 4 of the 8 weights
+        self.assertAlmostEqual(sum(name == 'resolve-prediction' for name, _, _ in plan) / 500, 0.5, delta=0.1)
+
+    def test_mix(self):
+        mix = parse_mix('resolve-prediction=3, resolved-since-now=1,resolve-fake3=0')
+        plan = build_plan(400, self.keys, self.dates, mix, page_size=25)
+
+        self.assertEqual(set(name for name, _, _ in plan), {'resolve-prediction', 'resolved-since-now'})
+        self.assertAlmostEqual(sum(name == 'resolve-prediction' for name, _, _ in plan) / 400, 0.75, delta=0.1)
+        self.assertTrue(all(path.endswith('?limit=25') for name, path, _ in plan if name == 'resolved-since-now'))
+
+        for text in ['resolve-prediction', 'missing=1', 'resolve-prediction=-1', 'resolve-prediction=0']:
+            with self.assertRaises(ValueError):
+                parse_mix(text)
+
+    def test_run_load(self):
+        plan = build_plan(200, self.keys, self.dates)
+
+        with LocalServer(self.app) as server:
+            samples, elapsed = run_load(server.url, plan, rate=1000, concurrency=4)
+
+        self.assertEqual(len(samples), 200)
+        # The requests cannot be sent faster than the target rate
+        self.assertGreaterEqual(elapsed, 199 / 1000)
+
+        summary = summarize(samples, elapsed)
+        self.assertEqual(summary['all']['requests'], 200)
+        self.assertEqual(sum(stats['requests'] for route, stats in summary.items() if route != 'all'), 200)
+        # Missing keys are expected to be answered with 404
+        self.assertEqual(summary['all']['errors'], 0)
+        for stats in summary.values():
+            self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+            self.assertLessEqual(stats['p95_ms'], stats['p99_ms'])
+            self.assertLessEqual(stats['p99_ms'], stats['max_ms'])
+
+    def test_budgets(self):
+        summary = {
+            'resolve-prediction': {'errors': 0, 'p50_ms': 2.0, 'p95_ms': 8.0, 'p99_ms': 12.0, 'max_ms': 20.0},
+            'resolved-since-now': {'errors': 1, 'p50_ms': 2.0, 'p95_ms': 8.0, 'p99_ms': 12.0, 'max_ms': 20.0},
+        }
+
+        self.assertEqual(parse_budget('resolve-prediction:p99=50'), ('resolve-prediction', 'p99_ms', 50.0))
+        with self.assertRaises(ValueError):
+            parse_budget('resolve-prediction:p90=50')
+
+        self.assertEqual(check_budgets({'resolve-prediction': summary['resolve-prediction']},
+                                       [parse_budget('resolve-prediction:p99=50')]), [])
+        violations = check_budgets(summary, [parse_budget('resolve-prediction:p95=5'), parse_budget('missing:p50=1')])
+        self.assertEqual(len(violations), 3)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
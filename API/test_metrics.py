@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from sklearn.dummy import DummyRegressor
+
+from metrics import Counter, Histogram, MetricsRegistry, SlowRequestProfiler, StageMetrics
+from predict import predict_resolution_frame
+from preprocessing import FeatureEncoder, stage_hooks
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_render: Method to test the Prometheus text format of counters and histograms.
+        - test_stage_metrics: Method to test that the stages of a prediction are recorded.
+        - test_slow_request_profiler: Method to test that only the profiles of slow requests are written.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Creates an empty metrics registry and a temporary directory for the profiles.
+        """
+        self.registry = MetricsRegistry()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_render(self):
+        requests = self.registry.register(Counter('requests_total', 'Requests.', ('route',)))
+        durations = self.registry.register(Histogram('duration_seconds', 'Durations.', ('route',), (0.1, 1.0)))
+
+        requests.inc('/a')
+        requests.inc('/a', amount=2)
+        durations.observe(0.05, '/a')
+        durations.observe(0.5, '/a')
+        durations.observe(5.0, '/a')
+
+        lines = self.registry.render().splitlines()
+
+        self.assertIn('# TYPE requests_total counter', lines)
+        self.assertIn('requests_total{route="/a"} 3', lines)
+        self.assertIn('# TYPE duration_seconds histogram', lines)
+        self.assertIn('duration_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('duration_seconds_bucket{route="/a",le="1.0"} 2', lines)
+        self.assertIn('duration_seconds_bucket{route="/a",le="+Inf"} 3', lines)
+        self.assertIn('duration_seconds_sum{route="/a"} 5.55', lines)
+        self.assertIn('duration_seconds_count{route="/a"} 3', lines)
+
+    def test_stage_metrics(self):
+        df_avro_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+        model = DummyRegressor(strategy='constant', constant=10.0).fit([[0]], [0])
+
+        stage_metrics = StageMetrics(self.registry)
+        stage_hooks.append(stage_metrics)
+        self.addCleanup(stage_hooks.remove, stage_metrics)
+
+        # The legacy path runs preprocess_data, the encoder path encodes only the unresolved issues
+        predict_resolution_frame(df_avro_issues, model=model)
+        predict_resolution_frame(df_avro_issues, model=model, encoder=FeatureEncoder().fit(df_avro_issues))
+
+        for stage in ['preprocess.parse_dates', 'preprocess.one_hot', 'predict.preprocess', 'predict.fillna',
+                      'predict.encode', 'predict.resolution_dates']:
+            self.assertGreaterEqual(stage_metrics.durations.count(stage), 1, stage)
+        self.assertEqual(stage_metrics.durations.count('predict.model'), 2)
+        self.assertEqual(stage_metrics.rows.value('predict.parse_dates'), 2 * len(df_avro_issues))
+
+    def test_slow_request_profiler(self):
+        profiler = SlowRequestProfiler(self.directory, sample_rate=1.0, threshold=0.5)
+
+        self.assertIsNone(profiler.stop(profiler.start(), 'GET /fast', 0.1))
+        path = profiler.stop(profiler.start(), 'GET /api/issue/<issue_key>/resolve-prediction', 1.0)
+
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(path)])
+        self.assertTrue(path.endswith('GET_api_issue_issue_key_resolve_prediction.prof'))
+
+        self.assertIsNone(SlowRequestProfiler(self.directory, sample_rate=0.0).start())
+        self.assertIsNone(SlowRequestProfiler.from_environ({}))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sklearn.dummy import DummyRegressor
+
+from model_registry import ModelRegistry, joblib
+
+
+class TestModelRegistry(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_load_once: Method to test that the loaded model is reused between calls.
+        - test_hot_swap: Method to test swapping in a new artifact.
+        - test_failed_swap_keeps_model: Method to test that a broken artifact does not replace the current model.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Saves a small model artifact in a temporary directory.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.path = os.path.join(self.directory, 'model.pkl')
+        self.save_model(1.0, self.path)
+
+    def save_model(self, constant, path):
+        model = DummyRegressor(strategy='constant', constant=constant).fit([[0]], [0])
+        joblib.dump(model, path)
+
+    def test_load_once(self):
+        registry = ModelRegistry(self.path)
+        loaded = registry.load()
+
+        self.assertIs(registry.get(), loaded.model)
+        self.assertIs(registry.get(), registry.get())
+        self.assertEqual(registry.get().predict([[0]])[0], 1.0)
+
+    def test_hot_swap(self):
+        registry = ModelRegistry(self.path)
+        registry.load()
+        in_flight_model = registry.get()
+        old_version = registry.version
+
+        # Replace the artifact on disk and reload it
+        self.save_model(2.0, self.path)
+        os.utime(self.path, ns=(0, 0))
+        self.assertTrue(registry.reload_if_changed())
+
+        self.assertNotEqual(registry.version, old_version)
+        self.assertEqual(registry.get().predict([[0]])[0], 2.0)
+        # A request that grabbed the previous model still holds a working model
+        self.assertEqual(in_flight_model.predict([[0]])[0], 1.0)
+        self.assertFalse(registry.reload_if_changed())
+
+    def test_failed_swap_keeps_model(self):
+        registry = ModelRegistry(self.path)
+        registry.load()
+        old_version = registry.version
+
+        broken_path = os.path.join(self.directory, 'broken.pkl')
+        with open(broken_path, 'wb') as broken_file:
+            broken_file.write(b'not a pickle')
+
+        with self.assertRaises(Exception):
+            registry.load(broken_path)
+
+        self.assertEqual(registry.version, old_version)
+        self.assertEqual(registry.path, self.path)
+        self.assertEqual(registry.get().predict([[0]])[0], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,96 @@
+import unittest
+
+from response_cache import LRUCache, ResponseCache, SharedCache, cache_key
+
+
+class FakeRedis:
+    # Stores values in a dictionary, with the get/set API of redis.Redis
+    def __init__(self):
+        self.values = {}
+        self.available = True
+
+    def get(self, key):
+        if not self.available:
+            raise ConnectionError('Redis is down')
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        if not self.available:
+            raise ConnectionError('Redis is down')
+        self.values[key] = value
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_lru_eviction: Method to test that the least recently used entries are evicted first.
+        - test_ttl: Method to test that entries expire.
+        - test_shared_cache: Method to test sharing responses between processes through the shared cache.
+        - test_versioned_keys: Method to test that a new model or data version changes the cache keys.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Creates a clock that only moves when the test moves it.
+        """
+        self.now = 0.0
+        self.clock = lambda: self.now
+
+    def test_lru_eviction(self):
+        cache = LRUCache(2, clock=self.clock)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # Reading 'a' makes 'b' the least recently used entry
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_ttl(self):
+        cache = ResponseCache(LRUCache(10, ttl=60, clock=self.clock))
+        cache.set('a', b'{}', 200)
+
+        self.now = 59
+        self.assertEqual(cache.get('a'), (b'{}', 200))
+        self.now = 60
+        self.assertIsNone(cache.get('a'))
+
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.hit_ratio(), 0.5)
+        self.assertEqual(len(cache.local), 0)
+
+    def test_shared_cache(self):
+        client = FakeRedis()
+        worker_1 = ResponseCache(LRUCache(10), SharedCache(client, ttl=60))
+        worker_2 = ResponseCache(LRUCache(10), SharedCache(client, ttl=60))
+
+        worker_1.set('a', b'{"error": "Issue key not found"}', 404)
+
+        self.assertEqual(worker_2.get('a'), (b'{"error": "Issue key not found"}', 404))
+        self.assertEqual(worker_2.shared_hits, 1)
+        # Now cached in process too
+        self.assertEqual(worker_2.local.get('a'), (b'{"error": "Issue key not found"}', 404))
+
+        # A failing shared cache is a miss
+        client.available = False
+        self.assertIsNone(worker_2.get('b'))
+        worker_2.set('b', b'{}', 200)
+        self.assertEqual(worker_2.get('b'), (b'{}', 200))
+
+    def test_versioned_keys(self):
+        key = cache_key('resolve-prediction', ('model:1', 'data:1'), 'AVRO-2171')
+
+        self.assertEqual(key, 'resolve-prediction|model:1|data:1|AVRO-2171')
+        self.assertNotEqual(key, cache_key('resolve-prediction', ('model:2', 'data:1'), 'AVRO-2171'))
+        self.assertNotEqual(key, cache_key('resolve-prediction', ('model:1', 'data:2'), 'AVRO-2171'))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
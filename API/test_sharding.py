@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from sklearn.dummy import DummyRegressor
+
+from datahelper import ISSUES_SCHEMA, ShardedIssueStore
+from ingest import IssueIngestor, records_to_frame
+from model_registry import ModelRegistry, joblib
+from preprocessing import FeatureEncoder
+from sharding import ProcessPool, ShardedSnapshotManager
+
+
+class TestSharding(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_store: Method to test that the issues are partitioned by the project of their key.
+        - test_snapshots: Method to test that every project is predicted with its own model or the global one.
+        - test_ingest_new_project: Method to test that ingesting issues of a new project creates its shard.
+        - test_upsert_all_or_nothing: Method to test that an invalid issue of one project leaves every shard unchanged.
+        - test_process_pool: Method to test that scoring the shards in worker processes gives the same snapshots.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the raw data from CSV and moves every other issue to the project TEST. The global model predicts every
+        issue to be resolved after 10 days, and TEST has a model of its own that predicts 20 days.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        path = os.path.join(self.directory, 'model.pkl')
+        joblib.dump(DummyRegressor(strategy='constant', constant=10.0).fit([[0]], [0]), path)
+        self.model_registry = ModelRegistry(path)
+        self.model_registry.load()
+
+        self.project_models_dir = os.path.join(self.directory, 'projects')
+        os.makedirs(self.project_models_dir)
+        joblib.dump(DummyRegressor(strategy='constant', constant=20.0).fit([[0]], [0]),
+                    os.path.join(self.project_models_dir, 'TEST.pkl'))
+
+        # Read the raw data from CSV
+        self.df_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+        self.df_issues.loc[1::2, 'key'] = ['TEST-{}'.format(number) for number in range(len(self.df_issues[1::2]))]
+        self.store = ShardedIssueStore(self.df_issues, 'v1', ISSUES_SCHEMA)
+        self.encoder = FeatureEncoder().fit(self.df_issues)
+
+    def create_snapshots(self, executor=None):
+        snapshots = ShardedSnapshotManager(self.store, self.model_registry, self.encoder, self.project_models_dir,
+                                           executor)
+        snapshots.rebuild()
+        return snapshots
+
+    def test_store(self):
+        self.assertEqual(self.store.projects, ['AVRO', 'TEST'])
+        self.assertEqual(len(self.store), len(self.df_issues))
+        self.assertEqual(len(self.store.shard('TEST')), len(self.df_issues[1::2]))
+        self.assertIn('TEST-0', self.store)
+        self.assertNotIn('TEST-0', self.store.shard('AVRO'))
+        self.assertNotIn('OTHER-1', self.store)
+
+        self.assertEqual(self.store.get('TEST-0')['key'].tolist(), ['TEST-0'])
+        self.assertTrue(self.store.get('OTHER-1').empty)
+        self.assertEqual(sorted(self.store.take(['TEST-1', 'AVRO-2171', 'OTHER-1'])['key']), ['AVRO-2171', 'TEST-1'])
+        self.assertEqual(sorted(self.store.issues['key']), sorted(self.df_issues['key']))
+        self.assertEqual(self.store.version, 'v1/AVRO; v1/TEST')
+
+    def test_snapshots(self):
+        snapshots = self.create_snapshots()
+        self.assertEqual(len(snapshots.registries), 2)
+        self.assertFalse(snapshots.is_stale())
+
+        # AVRO-2171 (the first issue) is open, created at 2018-04-17 21:53:05
+        avro_snapshot = snapshots.shard_snapshot('AVRO-2171')
+        self.assertEqual(avro_snapshot.resolution_date('AVRO-2171'), '2018-04-27 21:53:05')
+        self.assertEqual(avro_snapshot.model_version, self.model_registry.version)
+        self.assertIsNone(avro_snapshot.resolution_date('TEST-0'))
+        self.assertEqual(len(snapshots.shard_snapshot('TEST-0').predictions), len(self.df_issues[1::2]))
+        self.assertIsNone(snapshots.shard_snapshot('OTHER-1'))
+
+        snapshot = snapshots.current
+        self.assertEqual(snapshot.data_version, self.store.version)
+        self.assertEqual(len(snapshot.predictions), len(self.df_issues))
+        self.assertEqual(snapshot.resolution_date('AVRO-2171'), '2018-04-27 21:53:05')
+        # The merged index holds the unresolved issues of both projects, in order of their resolution dates
+        self.assertEqual(len(snapshot.date_index), sum(len(snapshots.project_snapshot(project).date_index)
+                                                       for project in ['AVRO', 'TEST']))
+        self.assertTrue((snapshot.date_index.epochs[1:] >= snapshot.date_index.epochs[:-1]).all())
+
+        # Issues of TEST are predicted 20 days after their creation
+        test_predictions = snapshots.shard_snapshot('TEST-0').predictions
+        unresolved = test_predictions[~test_predictions['status'].isin(['Resolved', 'Closed'])]
+        self.assertTrue((unresolved['resolutiondate'] - unresolved['created'] == pd.Timedelta(days=20)).all())
+
+    def test_ingest_new_project(self):
+        snapshots = self.create_snapshots()
+        ingestor = IssueIngestor(self.store, snapshots)
+        avro_snapshot = snapshots.shard_snapshot('AVRO-2171')
+
+        result = ingestor.ingest(records_to_frame([{
+            'key': 'NEW-1', 'status': 'Open', 'priority': 'Major', 'issue_type': 'Bug',
+            'created': '2018-05-01T10:00:00.000+0000', 'updated': '2018-05-01T10:00:00.000+0000',
+        }]))
+
+        self.assertEqual(result['inserted'], 1)
+        self.assertEqual(self.store.projects, ['AVRO', 'NEW', 'TEST'])
+        self.assertEqual(snapshots.current.resolution_date('NEW-1'), '2018-05-11 10:00:00')
+        self.assertEqual(snapshots.current.data_version, self.store.version)
+        # The other projects were neither updated nor rebuilt
+        self.assertIs(snapshots.shard_snapshot('AVRO-2171'), avro_snapshot)
+
+    def test_upsert_all_or_nothing(self):
+        version = self.store.version
+        rows = pd.concat([self.store.get('AVRO-2171').assign(status='Resolved'),
+                          self.store.get('TEST-0').assign(watch_count='abc')])
+
+        with self.assertRaisesRegex(ValueError, 'watch_count'):
+            self.store.upsert(rows)
+        self.assertEqual(self.store.version, version)
+        self.assertNotEqual(self.store.get('AVRO-2171')['status'].iloc[0], 'Resolved')
+
+    def test_process_pool(self):
+        pool = ProcessPool(2)
+        self.addCleanup(pool.shutdown)
+
+        snapshot = self.create_snapshots(pool).current
+        expected = self.create_snapshots().current
+        for project in ['AVRO', 'TEST']:
+            pd.testing.assert_frame_equal(snapshot.snapshots[project].predictions,
+                                          expected.snapshots[project].predictions)
+        self.assertEqual(snapshot.version, expected.version)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
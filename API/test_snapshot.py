@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+from sklearn.dummy import DummyRegressor
+
+from model_registry import ModelRegistry, joblib
+from preprocessing import FeatureEncoder
+from snapshot import PredictionSnapshot, SnapshotManager
+
+
+class TestSnapshotManager(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_rebuild: Method to test building and reading a snapshot.
+        - test_rebuild_if_stale: Method to test that a snapshot is only rebuilt when the data or model changed.
+        - test_readers_keep_their_snapshot: Method to test that a rebuild does not modify a published snapshot.
+        - test_date_index: Method to test the range queries on the predicted resolution dates.
+        - test_missing_predictions: Method to test that issues without a predicted resolution date are not indexed.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the raw data from CSV and saves a model that predicts every issue to be resolved after 10 days.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        path = os.path.join(self.directory, 'model.pkl')
+        joblib.dump(DummyRegressor(strategy='constant', constant=10.0).fit([[0]], [0]), path)
+        self.model_registry = ModelRegistry(path)
+        self.model_registry.load()
+
+        # Read the raw data from CSV
+        self.df_avro_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+        self.data_version = 'v1'
+
+        self.snapshots = SnapshotManager(self.model_registry, lambda: self.df_avro_issues, lambda: self.data_version,
+                                         FeatureEncoder().fit(self.df_avro_issues))
+
+    def test_rebuild(self):
+        snapshot = self.snapshots.rebuild()
+
+        self.assertIs(self.snapshots.current, snapshot)
+        self.assertEqual(snapshot.version, (self.model_registry.version, 'v1'))
+        self.assertEqual(len(snapshot.predictions), len(self.df_avro_issues))
+        # Created 2018-04-17 21:53:05 and predicted to take 10 days
+        self.assertEqual(snapshot.resolution_date('AVRO-2171'), '2018-04-27 21:53:05')
+        self.assertIsNone(snapshot.resolution_date('AVRO-0'))
+
+    def test_rebuild_if_stale(self):
+        self.assertTrue(self.snapshots.is_stale())
+        self.snapshots.rebuild()
+
+        self.assertFalse(self.snapshots.rebuild_if_stale())
+
+        self.data_version = 'v2'
+        self.assertTrue(self.snapshots.rebuild_if_stale())
+        self.assertEqual(self.snapshots.current.data_version, 'v2')
+
+    def test_readers_keep_their_snapshot(self):
+        snapshot = self.snapshots.rebuild()
+        resolution_dates = dict(snapshot.resolution_dates)
+
+        self.data_version = 'v2'
+        self.snapshots.rebuild()
+
+        self.assertIsNot(self.snapshots.current, snapshot)
+        self.assertEqual(snapshot.resolution_dates, resolution_dates)
+        self.assertEqual(snapshot.data_version, 'v1')
+
+    def test_date_index(self):
+        snapshot = self.snapshots.rebuild()
+        predictions = snapshot.predictions
+        unresolved_issues = predictions[~predictions['status'].isin(['Resolved', 'Closed'])]
+
+        keys, resolution_dates, total = snapshot.date_index.issues_until('2017-06-30')
+
+        # Same issues as filtering the predictions, earliest resolution date first
+        expected = unresolved_issues[unresolved_issues['resolutiondate'] <= pd.Timestamp('2017-06-30')]
+        self.assertEqual(total, len(expected))
+        self.assertEqual(sorted(keys), sorted(expected['key']))
+        self.assertEqual(list(resolution_dates), sorted(expected['resolutiondate'].dt.strftime('%Y-%m-%d %H:%M:%S')))
+
+        # Pages cover the same issues
+        first_keys, _, _ = snapshot.date_index.issues_until('2017-06-30', 0, 10)
+        second_keys, _, _ = snapshot.date_index.issues_until('2017-06-30', 10, 10)
+        self.assertEqual(list(first_keys) + list(second_keys), list(keys[:20]))
+
+        # A timezone offset is converted to UTC
+        self.assertEqual(snapshot.date_index.count_until('2017-06-30T02:00:00+02:00'), total)
+
+        with self.assertRaises(ValueError):
+            snapshot.date_index.count_until('not a date')
+
+    def test_missing_predictions(self):
+        snapshot = self.snapshots.rebuild()
+        # AVRO-2171 (the first issue) is open, its prediction gets lost
+        changed_predictions = snapshot.predictions.iloc[[0]].copy()
+        changed_predictions['resolutiondate'] = pd.NaT
+
+        for updated in [snapshot.updated(changed_predictions, 'v2'),
+                        PredictionSnapshot(pd.concat([changed_predictions, snapshot.predictions.iloc[1:]]), 'm', 'v2')]:
+            self.assertIsNone(updated.resolution_date('AVRO-2171'))
+            self.assertNotIn('AVRO-2171', updated.date_index.keys)
+            self.assertEqual(len(updated.date_index), len(snapshot.date_index) - 1)
+            self.assertEqual(updated.date_index.count_until('1970-01-01'), 0)
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
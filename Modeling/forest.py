@@ -0,0 +1,247 @@
+import argparse
+import os
+import shutil
+
+import numpy as np
+
+
+# Bumped whenever the layout of the exported arrays changes
+FOREST_FORMAT = 1
+
+
+def flatten_forest(model):
+    """
+    Flatten the trees of a fitted sklearn random forest (or a single regression tree) into contiguous node arrays.
+
+    The nodes of all trees are concatenated, and the child indices point into the concatenated arrays. Leaves point
+    to themselves, which is how the walk recognizes them.
+
+    Parameters:
+    model: A fitted `RandomForestRegressor`, `ExtraTreesRegressor` or `DecisionTreeRegressor` with a single output.
+
+    Returns:
+    dict: The arrays and metadata accepted by `FlatForest`.
+    """
+    estimators = getattr(model, 'estimators_', [model])
+
+    features, thresholds, lefts, rights, values, missing_lefts, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        if tree.n_outputs != 1:
+            raise ValueError('Only single-output regression forests can be flattened')
+
+        left = tree.children_left.astype(np.int32)
+        right = tree.children_right.astype(np.int32)
+        leaf = left == -1
+        nodes = np.arange(tree.node_count, dtype=np.int32)
+
+        features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        lefts.append(np.where(leaf, nodes, left) + offset)
+        rights.append(np.where(leaf, nodes, right) + offset)
+        values.append(tree.value[:, 0, 0])
+        # Trees fitted with missing values remember which child the missing values go to (scikit-learn >= 1.3)
+        missing_left = getattr(tree, 'missing_go_to_left', None)
+        missing_lefts.append(np.zeros(tree.node_count, dtype=bool) if missing_left is None
+                             else missing_left.astype(bool) & ~leaf)
+        roots.append(offset)
+
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    feature_names = getattr(model, 'feature_names_in_', None)
+    return {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts).astype(np.int32),
+        'right': np.concatenate(rights).astype(np.int32),
+        'value': np.concatenate(values),
+        'missing_left': np.concatenate(missing_lefts),
+        'roots': np.array(roots, dtype=np.int32),
+        'max_depth': max_depth,
+        'n_features': int(model.n_features_in_),
+        'feature_names': None if feature_names is None else [str(name) for name in feature_names],
+    }
+
+
+class FlatForest:
+    """
+    A random forest regressor stored as flat NumPy node arrays, which predicts without scikit-learn.
+
+    All trees are walked for a batch of rows at once: every step moves each (row, tree) pair that has not reached a
+    leaf one level down, so a prediction is at most `max_depth` vectorized steps instead of a Python loop over the
+    trees and rows. The predictions match scikit-learn's, because the rows are compared with the thresholds in
+    float32 like scikit-learn does.
+
+    Parameters:
+    feature (np.ndarray): The feature each node splits on.
+    threshold (np.ndarray): The threshold of each node. Rows with a value <= threshold go to the left child.
+    left (np.ndarray): The left child of each node. Leaves point to themselves.
+    right (np.ndarray): The right child of each node. Leaves point to themselves.
+    value (np.ndarray): The prediction of each leaf.
+    missing_left (np.ndarray): Whether missing values go to the left child of each node.
+    roots (np.ndarray): The root node of each tree.
+    max_depth (int): The depth of the deepest tree.
+    n_features (int): The number of features the forest was fitted on.
+    feature_names (list, optional): The names of the features, in order, if the forest was fitted on a DataFrame.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, missing_left, roots, max_depth, n_features,
+                 feature_names=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.missing_left = missing_left
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.feature_names_in_ = None if feature_names is None else list(feature_names)
+
+    @classmethod
+    def from_model(cls, model):
+        """Flatten a fitted scikit-learn forest, see `flatten_forest`."""
+        return cls(**flatten_forest(model))
+
+    def save(self, path):
+        """Save the node arrays to an uncompressed .npz file."""
+        np.savez(
+            path,
+            format=FOREST_FORMAT,
+            feature=self.feature,
+            threshold=self.threshold,
+            left=self.left,
+            right=self.right,
+            value=self.value,
+            missing_left=self.missing_left,
+            roots=self.roots,
+            max_depth=self.max_depth,
+            n_features=self.n_features_in_,
+            feature_names=np.array(self.feature_names_in_ or [], dtype=str),
+            has_feature_names=self.feature_names_in_ is not None,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a forest saved with `save`.
+
+        Raises:
+        ValueError: If the file was written in another format.
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            if int(arrays['format']) != FOREST_FORMAT:
+                raise ValueError('Unsupported forest format {} in {}'.format(int(arrays['format']), path))
+            return cls(
+                arrays['feature'],
+                arrays['threshold'],
+                arrays['left'],
+                arrays['right'],
+                arrays['value'],
+                arrays['missing_left'],
+                arrays['roots'],
+                int(arrays['max_depth']),
+                int(arrays['n_features']),
+                arrays['feature_names'].tolist() if bool(arrays['has_feature_names']) else None,
+            )
+
+    @property
+    def n_estimators(self):
+        """The number of trees in the forest."""
+        return len(self.roots)
+
+    def predict(self, X, batch_size=10000):
+        """
+        Predict the target of each row as the mean of the leaf values of all trees.
+
+        Parameters:
+        X (pd.DataFrame or array-like): The feature rows. The columns of a DataFrame are taken in the order the forest
+                                        was fitted with.
+        batch_size (int, optional): The number of rows walked at a time, which bounds the memory used by the walk to
+                                    `batch_size * n_estimators` node indices.
+
+        Returns:
+        np.ndarray: The predictions, one per row.
+        """
+        if self.feature_names_in_ is not None and hasattr(X, 'columns'):
+            X = X[self.feature_names_in_]
+        # scikit-learn compares the features with the thresholds in float32
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError('X has {} features, but the forest was fitted with {}'.format(
+                X.shape[-1], self.n_features_in_))
+
+        predictions = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), batch_size):
+            rows = X[start:start + batch_size]
+            predictions[start:start + batch_size] = self.value[self._leaves(rows)].mean(axis=1)
+        return predictions
+
+    def _leaves(self, rows):
+        """Return the leaf each row reaches in each tree, as an array of shape (rows, trees)."""
+        n_rows, n_trees = len(rows), len(self.roots)
+        values = rows.ravel()
+        # The right and left child of every node side by side, so the next node is one gather
+        children = np.stack([self.right, self.left], axis=1).ravel()
+
+        # One entry per (row, tree) pair, and the offset of the row in the flattened feature values
+        nodes = np.tile(self.roots, n_rows)
+        row_offsets = np.repeat(np.arange(n_rows) * rows.shape[1], n_trees)
+
+        # Only the pairs that have not reached a leaf yet are walked
+        active = np.arange(len(nodes))
+        current = nodes
+        for _ in range(self.max_depth):
+            feature_values = np.take(values, np.take(row_offsets, active) + np.take(self.feature, current))
+            go_left = feature_values <= np.take(self.threshold, current)
+            if self.missing_left.any():
+                go_left |= np.isnan(feature_values) & np.take(self.missing_left, current)
+            current = np.take(children, 2 * current + go_left)
+            nodes[active] = current
+
+            not_leaf = np.take(self.left, current) != current
+            active, current = active[not_leaf], current[not_leaf]
+            if not len(active):
+                break
+        return nodes.reshape(n_rows, n_trees)
+
+def export_forest(model_path, forest_path=None):
+    """
+    Export a pickled random forest to a .npz file that `FlatForest.load` can read without scikit-learn.
+
+    The feature encoder schema saved next to the pickle, if any, is copied next to the exported forest.
+
+    Parameters:
+    model_path (str): The pickled model, e.g. 'RF_regressor_model.pkl'.
+    forest_path (str, optional): The file to write. Defaults to `model_path` with the extension '.npz'.
+
+    Returns:
+    str: The path of the exported forest.
+    """
+    try:
+        import joblib
+    except ImportError:
+        from sklearn.externals import joblib
+
+    forest_path = forest_path or os.path.splitext(model_path)[0] + '.npz'
+    FlatForest.from_model(joblib.load(model_path)).save(forest_path)
+
+    # The encoder schema is saved next to the artifact, like `model_registry.encoder_path` expects it. This module
+    # does not import the registry, so it can be used in the Modeling folder too
+    model_encoder_path = os.path.splitext(model_path)[0] + '_encoder.json'
+    forest_encoder_path = os.path.splitext(forest_path)[0] + '_encoder.json'
+    if os.path.exists(model_encoder_path) and model_encoder_path != forest_encoder_path:
+        shutil.copyfile(model_encoder_path, forest_encoder_path)
+    return forest_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a pickled random forest to flat NumPy node arrays.')
+    parser.add_argument('model_path', help='The pickled model, e.g. ../RF_regressor_model.pkl')
+    parser.add_argument('forest_path', nargs='?', help='The .npz file to write (defaults to the model path)')
+    args = parser.parse_args()
+
+    print(export_forest(args.model_path, args.forest_path))
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from preprocessing import FeatureEncoder, preprocess_data
+
+
+class TestFeatureEncoder(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_transform_matches_preprocess_data: Method to test the encoder against the preprocess_data function.
+        - test_transform_single_issue: Method to test encoding a single issue.
+        - test_unseen_category: Method to test that unseen categories do not change the schema.
+        - test_save_and_load: Method to test persisting the encoder.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the raw data from CSV and fits the encoder on it.
+        """
+
+        # Read the raw data from CSV
+        self.df_avro_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+
+        self.encoder = FeatureEncoder().fit(self.df_avro_issues)
+
+        # Features of the unresolved issues as produced by preprocess_data, with the training means filled in
+        preprocessed_df = preprocess_data(self.df_avro_issues)
+        self.expected_features = preprocessed_df[preprocessed_df['status'] != 4].drop(['days_since_created', 'status'], axis=1)
+        self.expected_features = self.expected_features.fillna(self.encoder.fill_values)
+
+        self.unresolved_issues = self.df_avro_issues.loc[self.expected_features.index]
+
+    def test_transform_matches_preprocess_data(self):
+        result = self.encoder.transform(self.unresolved_issues)
+
+        self.assertEqual(list(result.columns), list(self.expected_features.columns))
+        pd.testing.assert_frame_equal(result, self.expected_features, check_dtype=False)
+
+    def test_transform_single_issue(self):
+        issue = self.df_avro_issues[self.df_avro_issues['key'] == 'AVRO-2171']
+
+        result = self.encoder.transform(issue)
+
+        self.assertEqual(result.shape, (1, len(self.encoder.feature_columns)))
+        pd.testing.assert_frame_equal(result, self.expected_features.loc[issue.index], check_dtype=False)
+
+    def test_unseen_category(self):
+        issue = self.df_avro_issues.head(1).copy()
+        issue['issue_type'] = 'Epic'
+
+        result = self.encoder.transform(issue)
+
+        self.assertEqual(list(result.columns), self.encoder.feature_columns)
+        issue_type_columns = [col for col in result.columns if col.startswith('issue_type_')]
+        self.assertEqual(result[issue_type_columns].values.sum(), 0)
+
+    def test_save_and_load(self):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+
+        self.encoder.save(path)
+        loaded_encoder = FeatureEncoder.load(path)
+
+        pd.testing.assert_frame_equal(loaded_encoder.transform(self.unresolved_issues),
+                                      self.encoder.transform(self.unresolved_issues))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -6,7 +6,9 @@
 
 import unittest
 import pandas as pd
+from sklearn.dummy import DummyRegressor
 from predict import predict_resolution_date
+from preprocessing import FeatureEncoder
 import datetime
 
 class TestPredictResolutionDate(unittest.TestCase):
@@ -15,6 +17,7 @@ class TestPredictResolutionDate(unittest.TestCase):
         - setUp: Method to set up the test environment before each test case.
         - test_predict_resolution_date_with_key_none: Method to test the function with key=None.
         - test_predict_resolution_date_with_specific_key: Method to test the function with a specific key.
+        - test_predict_resolution_date_with_position: Method to test the function with the row position of the key.
     """
 
     def setUp(self):
@@ -81,6 +84,28 @@ class TestPredictResolutionDate(unittest.TestCase):
         # Assuming 'result' and 'expected_result' are datetime objects
         # self.assertAlmostEqual(result, expected_result, delta=datetime.timedelta(seconds=10))
 
+    def test_predict_resolution_date_with_position(self):
+        """
+        Method to test the predict_resolution_date function with the row position of a specific key.
+
+        Compares the result of an issue looked up by its row position with the result of looking up its key, with a
+        model that predicts every issue to be resolved after 10 days.
+        """
+
+        model = DummyRegressor(strategy='constant', constant=10.0).fit([[0]], [0])
+        encoder = FeatureEncoder().fit(self.df_avro_issues)
+        position = int(self.df_avro_issues.index[self.df_avro_issues['key'] == 'AVRO-2171'][0])
+
+        for encoder_or_none in [None, encoder]:
+            result = predict_resolution_date(self.df_avro_issues, key='AVRO-2171', model=model,
+                                             encoder=encoder_or_none, position=position)
+            self.assertEqual(result, predict_resolution_date(self.df_avro_issues, key='AVRO-2171', model=model,
+                                                             encoder=encoder_or_none))
+            self.assertEqual(result, '2018-04-27 21:53:05')
+
+        with self.assertRaises(KeyError):
+            predict_resolution_date(self.df_avro_issues, key='AVRO-0', model=model, encoder=encoder)
+
 if __name__ == "__main__":
     unittest.main(argv=[''], verbosity=2, exit=False)
 
@@ -0,0 +1,122 @@
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import joblib
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+
+from forest import export_forest
+from predict import predict_resolution_date, score_file
+from preprocessing import FeatureEncoder, preprocess_data
+
+
+class TestScoreFile(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_same_as_in_process: Method to test that chunked scoring gives the same results as predict_resolution_date.
+        - test_worker_processes: Method to test scoring the chunks in worker processes.
+        - test_command_line: Method to test the score command of predict.py.
+        - test_exported_forest: Method to test scoring with a forest exported to a .npz file, from the command line too.
+        - test_parquet_without_pyarrow: Method to test that Parquet files without pyarrow fail before scoring starts.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the raw data from CSV, fits the encoder and a linear model on it, and writes the model to a temporary
+        directory.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        # Read the raw data from CSV
+        self.df_avro_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+        self.input_path = os.path.join(self.directory, 'issues.csv')
+        self.df_avro_issues.to_csv(self.input_path, index=False)
+
+        self.encoder = FeatureEncoder().fit(self.df_avro_issues)
+        # Train on the resolved issues
+        preprocessed_df = preprocess_data(self.df_avro_issues).dropna(subset=['days_since_created'])
+        self.model = LinearRegression().fit(self.encoder.transform(self.df_avro_issues.loc[preprocessed_df.index]),
+                                            preprocessed_df['days_since_created'])
+        self.model_path = os.path.join(self.directory, 'model.pkl')
+        joblib.dump(self.model, self.model_path)
+
+        self.expected = predict_resolution_date(self.df_avro_issues, model=self.model, encoder=self.encoder)
+
+    def read_output(self, path):
+        result = pd.read_csv(path)
+        result['days_since_created'] = pd.to_timedelta(result['days_since_created'])
+        return result
+
+    def test_same_as_in_process(self):
+        output_path = os.path.join(self.directory, 'scored.csv')
+
+        # Chunks that do not divide the number of issues
+        stats = score_file(self.input_path, output_path, self.model_path, self.encoder, chunksize=700, workers=1)
+
+        self.assertEqual(stats['rows'], len(self.df_avro_issues))
+        self.assertGreater(stats['rows_per_second'], 0)
+        pd.testing.assert_frame_equal(self.read_output(output_path), self.expected)
+
+    def test_worker_processes(self):
+        output_path = os.path.join(self.directory, 'scored.csv')
+
+        score_file(self.input_path, output_path, self.model_path, self.encoder, chunksize=1000, workers=2)
+
+        pd.testing.assert_frame_equal(self.read_output(output_path), self.expected)
+
+    def score(self, *args):
+        # Run the score command of predict.py in a new process
+        return subprocess.run([sys.executable, 'predict.py', 'score', self.input_path] + list(args) +
+                              ['--model', self.model_path, '--fit-encoder', self.input_path],
+                              capture_output=True, text=True)
+
+    def test_command_line(self):
+        output_path = os.path.join(self.directory, 'scored.csv')
+
+        result = self.score(output_path, '--chunksize', '700', '--workers', '1')
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('Scored {} issues'.format(len(self.df_avro_issues)), result.stderr)
+        pd.testing.assert_frame_equal(self.read_output(output_path), self.expected)
+
+    def test_exported_forest(self):
+        # A small forest on the same features, pickled and exported
+        preprocessed_df = preprocess_data(self.df_avro_issues).dropna(subset=['days_since_created'])
+        model = RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0).fit(
+            self.encoder.transform(self.df_avro_issues.loc[preprocessed_df.index]), preprocessed_df['days_since_created'])
+        joblib.dump(model, self.model_path)
+        forest_path = export_forest(self.model_path)
+        expected = predict_resolution_date(self.df_avro_issues, model=model, encoder=self.encoder)
+
+        output_path = os.path.join(self.directory, 'scored.csv')
+        score_file(self.input_path, output_path, forest_path, self.encoder, chunksize=1000, workers=1)
+        pd.testing.assert_frame_equal(self.read_output(output_path), expected)
+
+        self.model_path = forest_path
+        result = self.score(output_path, '--workers', '1')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        pd.testing.assert_frame_equal(self.read_output(output_path), expected)
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is not None, 'pyarrow is installed')
+    def test_parquet_without_pyarrow(self):
+        output_path = os.path.join(self.directory, 'scored.parquet')
+
+        result = self.score(output_path)
+
+        self.assertEqual(result.returncode, 2)
+        self.assertIn('Parquet files require the pyarrow package', result.stderr)
+        self.assertFalse(os.path.exists(output_path))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+
+from forest import FlatForest
+from predict import predict_resolution_date
+from preprocessing import FeatureEncoder
+from train import load_features, publish, train
+
+
+class TestTrain(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_load_features: Method to test the feature matrix and its on-disk cache.
+        - test_train_and_publish: Method to test training, the written artifact and publishing it.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Creates temporary directories for the feature cache and the artifacts.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.output_dir = os.path.join(self.directory, 'models')
+
+        self.data_path = '../data/for testing df_avro_issues raw data.csv'
+
+    def test_load_features(self):
+        X, y, encoder, digest, cache_hit = load_features(self.data_path, self.cache_dir)
+
+        self.assertFalse(cache_hit)
+        self.assertEqual(list(X.columns), encoder.feature_columns)
+        self.assertEqual(len(X), len(y))
+        self.assertFalse(X.isna().any().any())
+        self.assertFalse(y.isna().any())
+
+        # The second load reads the same features from the cache
+        cached_X, cached_y, cached_encoder, cached_digest, cache_hit = load_features(self.data_path, self.cache_dir)
+
+        self.assertTrue(cache_hit)
+        self.assertEqual(cached_digest, digest)
+        self.assertEqual(cached_encoder.to_dict(), encoder.to_dict())
+        pd.testing.assert_frame_equal(cached_X, X)
+        pd.testing.assert_series_equal(cached_y, y)
+
+    def test_train_and_publish(self):
+        param_distributions = {'n_estimators': [5, 10], 'max_depth': [None, 5]}
+
+        metrics = train(self.data_path, self.output_dir, param_distributions, n_iter=2, cv=2, n_jobs=2,
+                        cache_dir=self.cache_dir)
+
+        model_path = metrics['model_path']
+        self.assertTrue(os.path.basename(model_path).startswith('RF_regressor_model-'))
+        self.assertGreater(metrics['cv']['mae'], 0)
+        self.assertEqual(set(metrics['timings']), {'features', 'search', 'refit', 'save'})
+        with open(os.path.splitext(model_path)[0] + '_metrics.json') as metrics_file:
+            self.assertEqual(json.load(metrics_file)['version'], metrics['version'])
+
+        # The artifact scores issues with the encoder saved next to it
+        model = joblib.load(model_path)
+        encoder = FeatureEncoder.load(os.path.splitext(model_path)[0] + '_encoder.json')
+        result = predict_resolution_date(pd.read_csv(self.data_path), key='AVRO-2171', model=model, encoder=encoder)
+        self.assertGreater(result, '2018-04-17')
+
+        # The same seed trains the same model
+        retrained = train(self.data_path, self.output_dir, param_distributions, n_iter=2, cv=2, n_jobs=2,
+                          cache_dir=self.cache_dir)
+        self.assertTrue(retrained['features_cached'])
+        self.assertEqual(retrained['best_params'], metrics['best_params'])
+        self.assertEqual(retrained['cv'], metrics['cv'])
+
+        target_path = os.path.join(self.directory, 'RF_regressor_model.pkl')
+        publish(model_path, target_path)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'RF_regressor_model_encoder.json')))
+        self.assertEqual(joblib.load(target_path).get_params(), model.get_params())
+
+        # An exported forest served instead of the pickle is exported again
+        features = encoder.transform(pd.read_csv(self.data_path)).values
+        forest_path = os.path.join(self.directory, 'RF_regressor_model.npz')
+        FlatForest.from_model(RandomForestRegressor(n_estimators=1).fit(features, range(len(features)))).save(forest_path)
+        publish(model_path, target_path)
+        self.assertEqual(FlatForest.load(forest_path).n_estimators, model.n_estimators)
+        np.testing.assert_allclose(FlatForest.load(forest_path).predict(features), model.predict(features))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
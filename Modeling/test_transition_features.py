@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import parse_datetime_column
+from transitions import TRANSITION_FEATURES, TransitionFeatureStore, reference_times
+
+
+class TestTransitionFeatures(unittest.TestCase):
+    """
+    Methods:
+        - setUp: Method to set up the test environment before each test case.
+        - test_features: Method to test the lifecycle features of an issue against its transitions.
+        - test_incremental_update: Method to test that updating the store gives the same features as rebuilding it.
+        - test_reference_times: Method to test that the features of issues are measured until a fixed time.
+    """
+
+    def setUp(self):
+        """
+        Method to set up the test environment before each test case.
+
+        Reads the raw issues and transitions from CSV and builds the feature store.
+        """
+
+        # Read the raw data from CSV
+        self.df_avro_issues = pd.read_csv('../data/for testing df_avro_issues raw data.csv')
+        self.df_avro_transitions = pd.read_csv('../data/avro-transitions.csv')
+
+        self.store = TransitionFeatureStore.from_transitions(self.df_avro_transitions)
+
+    def test_features(self):
+        features = self.store.lookup(pd.Series(['AVRO-2171', 'MISSING-1'], index=[5, 7]), as_of='2018-04-22')
+
+        self.assertEqual(list(features.columns), TRANSITION_FEATURES)
+        self.assertEqual(list(features.index), [5, 7])
+
+        # Created (Open), moved to Patch Available and then to In Progress
+        transitions = self.df_avro_transitions[self.df_avro_transitions['key'] == 'AVRO-2171']
+        issue = features.loc[5]
+        self.assertEqual(issue['transition_count'], len(transitions))
+        self.assertEqual(issue['reopen_count'], 0)
+        self.assertAlmostEqual(issue['days_in_open'], 0.153279606481)
+        self.assertAlmostEqual(issue['days_in_patch_available'], 3.59082945602)
+        self.assertAlmostEqual(issue['days_since_last_transition'],
+                               (pd.Timestamp('2018-04-22') - pd.Timestamp('2018-04-21 15:44:36.753')).total_seconds() / 86400)
+
+        # Issues without transitions have no features
+        self.assertTrue(features.loc[7].isna().all())
+
+        # Reopens are counted
+        reopened_keys = self.df_avro_transitions.loc[self.df_avro_transitions['to_status'] == 'Reopened', 'key']
+        self.assertTrue((self.store.lookup(reopened_keys, as_of='2019-01-01')['reopen_count'] >= 1).all())
+
+    def test_incremental_update(self):
+        keys = self.df_avro_transitions['key'].unique()
+
+        store = TransitionFeatureStore.from_transitions(self.df_avro_transitions.iloc[:3000])
+        store.update(self.df_avro_transitions.iloc[3000:])
+
+        self.assertEqual(len(store), len(self.store))
+        np.testing.assert_allclose(store.lookup(keys, as_of='2019-01-01').values,
+                                   self.store.lookup(keys, as_of='2019-01-01').values)
+
+    def test_reference_times(self):
+        resolved = self.df_avro_issues['status'].isin(['Resolved', 'Closed'])
+        references = reference_times(self.df_avro_issues, as_of='2019-01-01T02:00:00+02:00')
+
+        # Resolved issues are measured until their resolution, the others until as_of (in UTC)
+        pd.testing.assert_series_equal(references[resolved],
+                                       parse_datetime_column(self.df_avro_issues.loc[resolved, 'resolutiondate']),
+                                       check_names=False)
+        self.assertTrue((references[~resolved] == pd.Timestamp('2019-01-01')).all())
+
+        # The features do not depend on when they are computed, and the resolved issues not even on as_of
+        features = self.store.features(self.df_avro_issues, as_of='2019-01-01')
+        pd.testing.assert_frame_equal(features, self.store.features(self.df_avro_issues, as_of='2019-01-01'))
+        pd.testing.assert_frame_equal(features[resolved],
+                                      self.store.features(self.df_avro_issues, as_of='2020-01-01')[resolved])
+        self.assertEqual(list(features.index), list(self.df_avro_issues.index))
+
+
+if __name__ == "__main__":
+    unittest.main(argv=[''], verbosity=2, exit=False)
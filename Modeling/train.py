@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+try:
+    import joblib
+except ImportError:
+    from sklearn.externals import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import KFold, RandomizedSearchCV
+
+from forest import FlatForest
+from preprocessing import FeatureEncoder, preprocess_data
+
+
+logger = logging.getLogger(__name__)
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'avro-issues.csv')
+
+# Directory the versioned model artifacts are written to (ignored by git)
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models')
+
+# Directory of the cached feature matrices, shared with the API's CSV cache (ignored by git)
+CACHE_DIR = os.environ.get(
+    'JIRA_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', '.cache')
+)
+
+# Bumped whenever preprocess_data or the layout of the cached features changes, so older caches are never read
+FEATURES_FORMAT = 1
+
+# Hyperparameters of the Random Forest Regressor that are searched
+PARAM_DISTRIBUTIONS = {
+    'n_estimators': [100, 200, 300],
+    'max_depth': [None, 10, 20, 30],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+    'max_features': [1.0, 'sqrt'],
+}
+
+# Scores computed for every hyperparameter candidate, the first one selects the best candidate
+SCORING = {
+    'mae': 'neg_mean_absolute_error',
+    'rmse': 'neg_root_mean_squared_error',
+    'r2': 'r2',
+}
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_features(data_path, cache_dir=None):
+    """
+    Load the training feature matrix, target and encoder of a CSV file of raw issues.
+
+    The issues are preprocessed with `preprocess_data` and the resolved issues are kept as training rows, with
+    missing values filled like the encoder fills them when the model is served. The result is cached on disk, keyed
+    by the content of the CSV file, so retraining on unchanged data skips the preprocessing.
+
+    Parameters:
+    data_path (str): The CSV file of raw issues, with the columns of 'avro-issues.csv'.
+    cache_dir (str, optional): The directory of the cache. Defaults to `CACHE_DIR`.
+
+    Returns:
+    tuple: The features (pd.DataFrame), the days to resolution (pd.Series), the fitted encoder, the SHA-256 digest of
+           the data and whether the features were read from the cache.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    digest = file_digest(data_path)
+    cache_path = os.path.join(cache_dir, 'features-{}-{}'.format(FEATURES_FORMAT, digest))
+
+    if os.path.isdir(cache_path):
+        encoder = FeatureEncoder.load(os.path.join(cache_path, 'encoder.json'))
+        X = pd.DataFrame(np.load(os.path.join(cache_path, 'X.npy'), allow_pickle=False),
+                         columns=encoder.feature_columns)
+        y = pd.Series(np.load(os.path.join(cache_path, 'y.npy'), allow_pickle=False), name='days_since_created')
+        return X, y, encoder, digest, True
+
+    preprocessed_df = preprocess_data(pd.read_csv(data_path))
+    encoder = FeatureEncoder().fit_features(preprocessed_df)
+
+    # Resolved issues (status 4) are the training rows
+    resolved_df = preprocessed_df[(preprocessed_df['status'] == 4) & preprocessed_df['days_since_created'].notna()]
+    X = resolved_df[encoder.feature_columns].fillna(encoder.fill_values).astype('float64').reset_index(drop=True)
+    y = resolved_df['days_since_created'].astype('float64').reset_index(drop=True)
+
+    # Write to a temporary directory and rename it, so a concurrent or interrupted run never leaves a partial cache
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_path = cache_path + '.{}.tmp'.format(os.getpid())
+    os.makedirs(temporary_path, exist_ok=True)
+    np.save(os.path.join(temporary_path, 'X.npy'), X.values, allow_pickle=False)
+    np.save(os.path.join(temporary_path, 'y.npy'), y.values, allow_pickle=False)
+    encoder.save(os.path.join(temporary_path, 'encoder.json'))
+    try:
+        os.rename(temporary_path, cache_path)
+    except OSError:
+        # Another run cached the same features first
+        shutil.rmtree(temporary_path, ignore_errors=True)
+
+    return X, y, encoder, digest, False
+
+
+def search_hyperparameters(X, y, param_distributions=PARAM_DISTRIBUTIONS, n_iter=10, cv=5, n_jobs=-1, seed=0):
+    """
+    Search the hyperparameters of a Random Forest Regressor with cross-validation, and refit the best candidate.
+
+    The candidates and folds are evaluated in parallel by `n_jobs` worker processes, and the same seed always draws
+    the same candidates, folds and forests.
+
+    Parameters:
+    X (pd.DataFrame): The training features.
+    y (pd.Series): The days to resolution.
+    param_distributions (dict, optional): The values searched for every hyperparameter.
+    n_iter (int, optional): The number of candidates.
+    cv (int, optional): The number of cross-validation folds.
+    n_jobs (int, optional): The number of worker processes, -1 uses all CPUs.
+    seed (int, optional): The seed of the candidates, folds and forests.
+
+    Returns:
+    RandomizedSearchCV: The fitted search, with the refitted best model as `best_estimator_`.
+    """
+    search = RandomizedSearchCV(
+        RandomForestRegressor(random_state=seed),
+        param_distributions,
+        n_iter=n_iter,
+        scoring=SCORING,
+        refit='mae',
+        cv=KFold(n_splits=cv, shuffle=True, random_state=seed),
+        n_jobs=n_jobs,
+        random_state=seed,
+    )
+    return search.fit(X, y)
+
+
+def cross_validation_metrics(search):
+    """Return the mean and standard deviation across the folds of every score of the best candidate."""
+    results = search.cv_results_
+    metrics = {}
+    for name in SCORING:
+        # The scores are negated errors, so that greater is better
+        sign = 1 if name == 'r2' else -1
+        metrics[name] = float(sign * results['mean_test_' + name][search.best_index_])
+        metrics[name + '_std'] = float(results['std_test_' + name][search.best_index_])
+    return metrics
+
+
+def train(data_path=DATA_PATH, output_dir=MODELS_DIR, param_distributions=PARAM_DISTRIBUTIONS, n_iter=10, cv=5,
+          n_jobs=-1, seed=0, cache_dir=None):
+    """
+    Train a Random Forest Regressor on a CSV file of raw issues and write a versioned model artifact.
+
+    Next to the artifact 'RF_regressor_model-<version>.pkl', the encoder schema ('..._encoder.json', where the API's
+    model registry looks for it) and the metrics ('..._metrics.json': the duration of every stage, the cross-validated
+    scores and the best hyperparameters) are written. The version is made of the training time and the data digest.
+
+    Parameters:
+    data_path (str, optional): The CSV file of raw issues.
+    output_dir (str, optional): The directory the artifact is written to.
+    param_distributions, n_iter, cv, n_jobs, seed: See `search_hyperparameters`.
+    cache_dir (str, optional): The directory of the feature cache, see `load_features`.
+
+    Returns:
+    dict: The metrics, including the path of the artifact.
+    """
+    timings = {}
+
+    started_at = time.perf_counter()
+    X, y, encoder, digest, cache_hit = load_features(data_path, cache_dir)
+    timings['features'] = time.perf_counter() - started_at
+    logger.info('Loaded %d training issues with %d features (%s)', len(X), X.shape[1], 'cached' if cache_hit else 'preprocessed')
+
+    started_at = time.perf_counter()
+    search = search_hyperparameters(X, y, param_distributions, n_iter, cv, n_jobs, seed)
+    timings['search'] = time.perf_counter() - started_at - search.refit_time_
+    timings['refit'] = search.refit_time_
+    logger.info('Best hyperparameters %s', search.best_params_)
+
+    trained_at = datetime.now(timezone.utc)
+    version = '{}-{}'.format(trained_at.strftime('%Y%m%dT%H%M%SZ'), digest[:8])
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, 'RF_regressor_model-{}.pkl'.format(version))
+
+    started_at = time.perf_counter()
+    joblib.dump(search.best_estimator_, model_path)
+    encoder.save(os.path.splitext(model_path)[0] + '_encoder.json')
+    timings['save'] = time.perf_counter() - started_at
+
+    metrics = {
+        'version': version,
+        'model_path': model_path,
+        'trained_at': trained_at.isoformat(),
+        'data_path': os.path.abspath(data_path),
+        'data_sha256': digest,
+        'features_cached': cache_hit,
+        'rows': len(X),
+        'features': X.shape[1],
+        'best_params': search.best_params_,
+        'cv_folds': cv,
+        'candidates': n_iter,
+        'cv': cross_validation_metrics(search),
+        'timings': timings,
+        'sklearn_version': sklearn.__version__,
+    }
+    with open(os.path.splitext(model_path)[0] + '_metrics.json', 'w') as metrics_file:
+        json.dump(metrics, metrics_file, indent=2, default=str)
+
+    return metrics
+
+
+def publish(model_path, target_path):
+    """
+    Replace the served model artifact and its encoder schema with a trained one.
+
+    Both files are copied next to their targets and then renamed, so the API's model registry never reads a
+    partially written file. The encoder is replaced first, since the registry reloads when the model changes.
+
+    The API serves the forest exported next to the target (the target with the extension '.npz') instead of the
+    pickle when it exists, so that forest is exported again from the trained model.
+    """
+    for source, target in [(os.path.splitext(model_path)[0] + '_encoder.json', os.path.splitext(target_path)[0] + '_encoder.json'),
+                           (model_path, target_path)]:
+        temporary_path = target + '.tmp'
+        shutil.copyfile(source, temporary_path)
+        os.replace(temporary_path, target)
+
+    forest_path = os.path.splitext(target_path)[0] + '.npz'
+    if os.path.exists(forest_path):
+        # np.savez adds the extension '.npz' to any other file name
+        temporary_path = os.path.splitext(target_path)[0] + '.tmp.npz'
+        FlatForest.from_model(joblib.load(model_path)).save(temporary_path)
+        os.replace(temporary_path, forest_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the resolution date model and write a versioned artifact.')
+    parser.add_argument('--data', default=DATA_PATH, help='CSV file of raw issues')
+    parser.add_argument('--output-dir', default=MODELS_DIR, help='Directory the versioned artifacts are written to')
+    parser.add_argument('--n-iter', type=int, default=10, help='Number of hyperparameter candidates')
+    parser.add_argument('--cv', type=int, default=5, help='Number of cross-validation folds')
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Number of worker processes (-1 uses all CPUs)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the search, folds and forests')
+    parser.add_argument('--publish', metavar='PATH', help='Also replace the served model, e.g. ../RF_regressor_model.pkl')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    metrics = train(args.data, args.output_dir, n_iter=args.n_iter, cv=args.cv, n_jobs=args.n_jobs, seed=args.seed)
+    if args.publish:
+        publish(metrics['model_path'], args.publish)
+
+    print(json.dumps({key: metrics[key] for key in ['version', 'model_path', 'cv', 'timings']}, indent=2))
@@ -0,0 +1,178 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import parse_datetime_column
+
+
+# Statuses whose dwell times (the days an issue spent in them, summed over all its visits) are features
+DWELL_STATUSES = ['Open', 'In Progress', 'Patch Available', 'Reopened']
+
+# Statuses that end the lifecycle of an issue, leaving them again is a reopen
+RESOLVED_STATUSES = ['Resolved', 'Closed']
+
+# Additive aggregates of the transitions of every issue, in the order of the columns of the store
+SUM_FEATURES = ['transition_count', 'reopen_count'] + [
+    'days_in_' + status.lower().replace(' ', '_') for status in DWELL_STATUSES]
+
+# Features returned by `TransitionFeatureStore.lookup`
+TRANSITION_FEATURES = SUM_FEATURES + ['days_since_last_transition']
+
+
+def aggregate_transitions(transitions):
+    """
+    Aggregate status transitions per issue key with grouped, vectorized operations.
+
+    Parameters:
+    transitions (pd.DataFrame): Transitions with the columns 'key', 'from_status', 'to_status', 'when' (ISO-8601 or
+                                datetime64) and 'days_in_from_status', e.g. from 'avro-transitions.csv'.
+
+    Returns:
+    tuple: The unique keys (pd.Index), their `SUM_FEATURES` (2D float64 array, one row per key) and the time of
+           their last transition (int64 array of nanoseconds since the epoch).
+    """
+    key_codes, keys = pd.factorize(transitions['key'])
+    n_keys = len(keys)
+
+    from_status = transitions['from_status'].astype(object).values
+    to_status = transitions['to_status'].astype(object).values
+    days = np.nan_to_num(transitions['days_in_from_status'].to_numpy(dtype='float64', na_value=np.nan))
+    reopened = (to_status == 'Reopened') | (np.isin(from_status, RESOLVED_STATUSES) & ~np.isin(to_status, RESOLVED_STATUSES))
+
+    sums = np.empty((n_keys, len(SUM_FEATURES)))
+    sums[:, 0] = np.bincount(key_codes, minlength=n_keys)
+    sums[:, 1] = np.bincount(key_codes, weights=reopened, minlength=n_keys)
+    for column, status in enumerate(DWELL_STATUSES, start=2):
+        sums[:, column] = np.bincount(key_codes, weights=np.where(from_status == status, days, 0.0), minlength=n_keys)
+
+    when = parse_datetime_column(transitions['when']).values.view('int64')
+    last_transition = np.full(n_keys, np.iinfo('int64').min)
+    np.maximum.at(last_transition, key_codes, when)
+
+    return pd.Index(keys), sums, last_transition
+
+
+class TransitionFeatureStore:
+    """
+    Lifecycle features of every issue, computed from its status transitions and stored by issue key.
+
+    The features are held as NumPy arrays with a hash index on the keys, so looking up the features of any number of
+    issues costs O(1) per issue. New transitions are folded into the stored aggregates without aggregating the
+    transitions seen before again: the aggregates are sums and a maximum, so they can be combined.
+
+    Lookups read a single reference to the current arrays, and updates build new arrays before swapping that
+    reference, so lookups never see a partially applied update.
+
+    Parameters:
+    keys (pd.Index, optional): The issue keys.
+    sums (np.ndarray, optional): The `SUM_FEATURES` of every key.
+    last_transition (np.ndarray, optional): The time of the last transition of every key, in nanoseconds.
+    """
+
+    def __init__(self, keys=None, sums=None, last_transition=None):
+        if keys is None:
+            keys, sums, last_transition = pd.Index([]), np.empty((0, len(SUM_FEATURES))), np.empty(0, dtype='int64')
+        self._state = (keys, sums, last_transition)
+        self._update_lock = threading.Lock()
+
+    @classmethod
+    def from_transitions(cls, transitions):
+        """Build a store from a DataFrame of transitions, see `aggregate_transitions`."""
+        return cls(*aggregate_transitions(transitions))
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def __contains__(self, key):
+        return key in self._state[0]
+
+    def update(self, transitions):
+        """
+        Fold new transitions into the stored features.
+
+        Parameters:
+        transitions (pd.DataFrame): Transitions that were not added to the store before.
+        """
+        new_keys, new_sums, new_last_transition = aggregate_transitions(transitions)
+
+        with self._update_lock:
+            keys, sums, last_transition = self._state
+            positions = keys.get_indexer(new_keys)
+            known = positions >= 0
+
+            sums = sums.copy()
+            last_transition = last_transition.copy()
+            sums[positions[known]] += new_sums[known]
+            last_transition[positions[known]] = np.maximum(last_transition[positions[known]],
+                                                           new_last_transition[known])
+
+            self._state = (keys.append(new_keys[~known]), np.concatenate([sums, new_sums[~known]]),
+                           np.concatenate([last_transition, new_last_transition[~known]]))
+
+    def lookup(self, keys, as_of):
+        """
+        Look up the features of issues.
+
+        Parameters:
+        keys (pd.Series or list of str): The issue keys.
+        as_of: The time 'days_since_last_transition' is measured until (naive timestamps are UTC), either one time
+               for every issue or a sequence of times aligned with `keys`, see `reference_times`.
+
+        Returns:
+        pd.DataFrame: The `TRANSITION_FEATURES` of the issues, with the index of `keys` if it is a Series. Issues
+                      without transitions, or without a time to measure until, have missing values.
+        """
+        stored_keys, sums, last_transition = self._state
+        positions = stored_keys.get_indexer(keys)
+        found = positions >= 0
+
+        values = np.full((len(positions), len(TRANSITION_FEATURES)), np.nan)
+        values[found, :len(SUM_FEATURES)] = sums[positions[found]]
+
+        as_of = pd.to_datetime(as_of, utc=True)
+        if isinstance(as_of, pd.Timestamp):
+            as_of = np.full(len(positions), as_of.value)
+        else:
+            # Missing times are NaT, which becomes NaN below
+            as_of = np.where(pd.isna(np.asarray(as_of)), np.nan, pd.DatetimeIndex(as_of).asi8)
+        values[found, -1] = (as_of[found] - last_transition[positions[found]]) / (24 * 60 * 60 * 1e9)
+
+        index = keys.index if isinstance(keys, pd.Series) else None
+        return pd.DataFrame(values, index=index, columns=TRANSITION_FEATURES)
+
+    def features(self, issues, as_of):
+        """
+        Look up the features of issues, with 'days_since_last_transition' measured until `reference_times`.
+
+        Parameters:
+        issues (pd.DataFrame): The raw issues, with the columns 'key', 'status', 'updated' and 'resolutiondate'.
+        as_of: The time the features of the issues that are not resolved are measured until.
+
+        Returns:
+        pd.DataFrame: The `TRANSITION_FEATURES` of the issues, with the index of `issues`.
+        """
+        return self.lookup(issues['key'], reference_times(issues, as_of))
+
+
+def reference_times(issues, as_of):
+    """
+    The time until which the features of every issue are measured, so that they do not change with the current time.
+
+    Resolved issues are measured until their resolution date (their last update if it is missing), and the other
+    issues until `as_of`.
+
+    Parameters:
+    issues (pd.DataFrame): The raw issues, with the columns 'status', 'updated' and 'resolutiondate'.
+    as_of: The time the issues that are not resolved are measured until (naive timestamps are UTC).
+
+    Returns:
+    pd.Series: The times as naive UTC datetimes, with the index of `issues`.
+    """
+    resolved = issues['status'].isin(RESOLVED_STATUSES)
+    resolution_times = parse_datetime_column(issues['resolutiondate']).fillna(parse_datetime_column(issues['updated']))
+
+    as_of = pd.Timestamp(as_of)
+    if as_of.tzinfo is not None:
+        as_of = as_of.tz_convert('UTC').tz_localize(None)
+    return resolution_times.where(resolved, as_of)